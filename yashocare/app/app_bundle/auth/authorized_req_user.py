@@ -1,19 +1,45 @@
+import time
+from functools import lru_cache
+
 from pydantic import BaseModel
-from fastapi import Depends
-import jwt
+from fastapi import Depends, HTTPException
+from app.app_bundle.cache import TTLCache
+from app.app_bundle.database.tenant import active_tenant
 from app.app_bundle.env_config_settings import get_settings
+from app.user.user_cache import is_user_active
 from fastapi.security import OAuth2PasswordBearer
 
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="/api/v1/user/login")
 
+@lru_cache
+def get_verified_token_cache():
+    # decoded claims by raw token, never kept past the token's own exp
+    return TTLCache(maxsize=get_settings().token_cache_size, ttl=get_settings().token_cache_ttl)
+
+
 class CurrentUserInfo(BaseModel):
     user_id: str
 
+
+def verify_token(token: str):
+    payload = get_verified_token_cache().get(token)
+    if payload is None:
+        import jwt
+
+        payload = jwt.decode(token, get_settings().jwt_secret, algorithms="HS256")
+        exp = payload.get("exp")
+        get_verified_token_cache().set(token, payload, exp - time.time() if exp else None)
+    return payload
+
+
 async def get_current_user(token: str = Depends(oauth2_scheme)):
-    payload = jwt.decode(token, get_settings().jwt_secret, algorithms="HS256")
+    payload = verify_token(token)
     user_id = payload.get("user_id")
     entity_type = payload.get("entity_type")
     if user_id is None:
         return {"message":"Invalid User","status_code":401}
+    if payload.get("tenant_id", get_settings().tenant_id) != active_tenant():
+        raise HTTPException(status_code=401, detail="Token issued for another tenant")
+    if not await is_user_active(user_id):
+        raise HTTPException(status_code=401, detail="User deactivated")
     return {"user_id":user_id,"entity_type":entity_type}
-
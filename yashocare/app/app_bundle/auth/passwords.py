@@ -0,0 +1,66 @@
+import asyncio
+import time
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
+
+from app.app_bundle.env_config_settings import get_settings
+from app.app_bundle.metrics import PASSWORD_SECONDS
+
+
+class PasswordPoolBusy(Exception):
+    pass
+
+
+@lru_cache
+def get_password_executor():
+    # bcrypt releases the GIL while hashing, so threads give real parallelism
+    return ThreadPoolExecutor(
+        max_workers=get_settings().password_workers,
+        thread_name_prefix="bcrypt",
+    )
+
+
+@lru_cache
+def get_password_slots():
+    return asyncio.Semaphore(get_settings().password_concurrency)
+
+
+def hash_password(password: str) -> bytes:
+    import bcrypt
+
+    pw = bytes(password, "utf-8")
+    salt = bcrypt.gensalt(rounds=get_settings().bcrypt_rounds)
+    return bcrypt.hashpw(pw, salt)
+
+
+def check_password(password: str, hashed: str) -> bool:
+    import bcrypt
+
+    return bcrypt.checkpw(password.encode("utf-8"), hashed.encode())
+
+
+async def _run_limited(fn, *args):
+    # admission limit: callers past password_concurrency wait briefly, then
+    # are turned away instead of queueing behind a login storm
+    slots = get_password_slots()
+    started = time.perf_counter()
+    try:
+        await asyncio.wait_for(slots.acquire(), timeout=get_settings().password_queue_timeout)
+    except asyncio.TimeoutError:
+        raise PasswordPoolBusy()
+    admitted = time.perf_counter()
+    PASSWORD_SECONDS.labels(fn.__name__, "wait").observe(admitted - started)
+    try:
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(get_password_executor(), fn, *args)
+    finally:
+        slots.release()
+        PASSWORD_SECONDS.labels(fn.__name__, "run").observe(time.perf_counter() - admitted)
+
+
+async def hash_password_async(password: str) -> bytes:
+    return await _run_limited(hash_password, password)
+
+
+async def check_password_async(password: str, hashed: str) -> bool:
+    return await _run_limited(check_password, password, hashed)
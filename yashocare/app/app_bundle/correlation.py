@@ -0,0 +1,39 @@
+import logging
+from contextvars import ContextVar
+from uuid import uuid4
+
+# id of the request being served, echoed back and stamped on every log record
+correlation_id: ContextVar[str] = ContextVar("correlation_id", default="-")
+
+HEADER = "x-request-id"
+
+
+class CorrelationIdFilter(logging.Filter):
+    def filter(self, record):
+        record.correlation_id = correlation_id.get()
+        return True
+
+
+class CorrelationIdMiddleware:
+    # takes the caller's X-Request-ID when given so ids line up across services
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+        headers = dict(scope["headers"])
+        value = headers.get(HEADER.encode(), b"").decode("latin-1")[:64]
+        if not value or not value.isprintable():
+            value = uuid4().hex
+        token = correlation_id.set(value)
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                message["headers"] = [*message.get("headers", []), (HEADER.encode(), value.encode("latin-1"))]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            correlation_id.reset(token)
@@ -5,6 +5,29 @@ import pytz
 from beanie import Document
 from pydantic import Field
 
+from app.app_bundle.database.tenant import tenant_collection
+from app.app_bundle.env_config_settings import get_settings
+
+
+class collection_name:
+    # Beanie reads Settings.name with getattr during init_beanie, so the
+    # service/environment prefix is resolved then instead of at import
+    def __init__(self, suffix: str):
+        self.suffix = suffix
+
+    def __get__(self, instance, owner):
+        return f"{get_settings().service_name}_{get_settings().environment}_{self.suffix}"
+
+
+class from_settings:
+    # the same deferral for any other Settings attribute built from the
+    # env settings, e.g. a TTL index's expireAfterSeconds
+    def __init__(self, build):
+        self.build = build
+
+    def __get__(self, instance, owner):
+        return self.build()
+
 
 class MongoDocument(Document):
     id: str = Field(default_factory=lambda: str(uuid4().int))
@@ -16,12 +39,18 @@ class MongoDocument(Document):
     )
     is_active: bool = True
 
+    @classmethod
+    def get_motor_collection(cls):
+        return tenant_collection(super().get_motor_collection())
+
     async def save(self, *args, **kwargs):
         current_datetime = datetime.datetime.now(tz=pytz.UTC)
         if not self.created_at:
             self.created_at = current_datetime
         self.updated_at = current_datetime
-        return await super(MongoDocument, self).save(*args, **kwargs)
+        result = await super(MongoDocument, self).save(*args, **kwargs)
+        await self.after_write()
+        return result
 
     async def delete(self, *args, **kwargs):
         current_datetime = datetime.datetime.now(tz=pytz.UTC)
@@ -29,7 +58,12 @@ class MongoDocument(Document):
             self.created_at = current_datetime
         self.is_active = False
         self.updated_at = current_datetime
-        return await super(MongoDocument, self).save(*args, **kwargs)
+        result = await super(MongoDocument, self).save(*args, **kwargs)
+        await self.after_write()
+        return result
+
+    async def after_write(self):
+        pass
 
     def to_json(self):
         return self.model_dump()
@@ -1,20 +1,118 @@
+import asyncio
+from collections import OrderedDict
+from functools import lru_cache
+from typing import Optional
+
 from beanie import init_beanie
 from motor.motor_asyncio import AsyncIOMotorClient
+from starlette.responses import JSONResponse
 
+from app.app_bundle.database.indexes import ensure_collection, reconcile_indexes, explain_query_shapes
+from app.app_bundle.database.tenant import allowed_tenants, current_tenant, tenant_db_name
 from app.app_bundle.env_config_settings import get_settings
+from app.app_bundle.metrics import MongoCommandMetrics
 from app.user.user_model import (
     Yasho_User
 )
-from app.visit.visit_model import Visit
-
-
-async def get_db_session_db(tenant_id: str = get_settings().tenant_id):
-    client = AsyncIOMotorClient(get_settings().mongo_uri)
-    db_name = f"{tenant_id}_{get_settings().environment}"
-    await init_beanie(
-        database=client[db_name],
-        document_models=[
-            Yasho_User,
-            Visit
-        ],
+from app.visit.visit_model import SyncReceipt, Visit
+from app.vitals.vitals_model import VitalReading
+
+DOCUMENT_MODELS = [
+    Yasho_User,
+    Visit,
+    VitalReading,
+    SyncReceipt,
+]
+
+
+@lru_cache
+def get_mongo_client():
+    settings = get_settings()
+    return AsyncIOMotorClient(
+        settings.mongo_uri,
+        maxPoolSize=settings.mongo_max_pool_size,
+        minPoolSize=settings.mongo_min_pool_size,
+        maxIdleTimeMS=settings.mongo_max_idle_time_ms,
+        connectTimeoutMS=settings.mongo_connect_timeout_ms,
+        serverSelectionTimeoutMS=settings.mongo_server_selection_timeout_ms,
+        socketTimeoutMS=settings.mongo_socket_timeout_ms,
+        event_listeners=[MongoCommandMetrics()],
     )
+
+
+class TenantRouter:
+    # Beanie stays bound to the default tenant; MongoDocument.get_motor_collection
+    # re-targets queries at the current_tenant database. This keeps an LRU of the
+    # tenants whose indexes were reconciled in this process.
+    def __init__(self, maxsize: Optional[int] = None):
+        # None reads tenant_cache_size when first needed
+        self.maxsize = maxsize
+        self._ready = OrderedDict()
+        self._lock = asyncio.Lock()
+
+    async def activate(self, tenant_id: str):
+        if tenant_id in self._ready:
+            self._ready.move_to_end(tenant_id)
+            return
+        async with self._lock:
+            if tenant_id in self._ready:
+                return
+            await self._prepare(tenant_id)
+            self._ready[tenant_id] = True
+            while len(self._ready) > (self.maxsize or get_settings().tenant_cache_size):
+                self._ready.popitem(last=False)
+
+    async def _prepare(self, tenant_id: str):
+        token = current_tenant.set(tenant_id)
+        try:
+            for model in DOCUMENT_MODELS:
+                await ensure_collection(model.get_motor_collection(), model)
+            if get_settings().mongo_reconcile_indexes:
+                for model in DOCUMENT_MODELS:
+                    await reconcile_indexes(model.get_motor_collection(), model, get_settings().mongo_drop_stale_indexes)
+        finally:
+            current_tenant.reset(token)
+
+
+tenant_router = TenantRouter()
+
+
+class TenantMiddleware:
+    # innermost of the app middlewares, so an unknown-tenant 404 still gets
+    # CORS headers, a request id and a metrics sample
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+        headers = dict(scope["headers"])
+        tenant_id = headers.get(b"x-tenant-id", b"").decode("latin-1") or get_settings().tenant_id
+        if tenant_id not in allowed_tenants():
+            response = JSONResponse({"status_code": 404, "error": "Unknown tenant"}, status_code=404)
+            return await response(scope, receive, send)
+        await tenant_router.activate(tenant_id)
+        token = current_tenant.set(tenant_id)
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            current_tenant.reset(token)
+
+
+_beanie_initialized = False
+
+
+async def get_db_session_db(tenant_id: Optional[str] = None):
+    global _beanie_initialized
+    tenant_id = tenant_id or get_settings().tenant_id
+    first_run = not _beanie_initialized
+    if first_run:
+        await init_beanie(
+            database=get_mongo_client()[tenant_db_name(get_settings().tenant_id)],
+            document_models=DOCUMENT_MODELS,
+            skip_indexes=True,
+        )
+        _beanie_initialized = True
+    await tenant_router.activate(tenant_id)
+    if first_run and get_settings().mongo_explain_query_shapes:
+        await explain_query_shapes(get_mongo_client()[tenant_db_name(tenant_id)])
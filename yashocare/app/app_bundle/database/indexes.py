@@ -0,0 +1,102 @@
+import logging
+from datetime import datetime
+
+import pytz
+from beanie.odm.fields import IndexModelField
+from beanie.odm.utils.pydantic import get_model_fields
+from beanie.odm.utils.typing import get_index_attributes
+from pymongo import IndexModel
+from pymongo.errors import CollectionInvalid, OperationFailure
+
+from app.user.user_model import Yasho_User
+from app.visit.visit_model import Visit, VisitStatus
+from app.vitals.vitals_model import VitalReading
+
+logger = logging.getLogger(__name__)
+
+
+def declared_indexes(model):
+    indexes = []
+    for name, field in get_model_fields(model).items():
+        attrs = get_index_attributes(field)
+        if attrs is not None:
+            indexes.append(IndexModelField(IndexModel([(field.alias or name, attrs[0])], **attrs[1])))
+    for index in model.get_settings().indexes or []:
+        indexes.append(index if isinstance(index, IndexModelField) else IndexModelField(index))
+    return IndexModelField.merge_indexes([], indexes)
+
+
+async def ensure_collection(collection, model):
+    # time-series collections have to be created as such before the first
+    # insert; init_beanie only does it for the default tenant's database
+    timeseries = model.get_settings().timeseries
+    if timeseries is None:
+        return
+    if collection.name in await collection.database.list_collection_names(nameOnly=True):
+        return
+    try:
+        await collection.database.create_collection(**timeseries.build_query(collection.name))
+        logger.info("created time-series collection %s", collection.name)
+    except (CollectionInvalid, OperationFailure) as exc:
+        # NamespaceExists: another worker created it first
+        if isinstance(exc, OperationFailure) and exc.code != 48:
+            raise
+
+
+async def reconcile_indexes(collection, model, drop_stale: bool = False):
+    declared = declared_indexes(model)
+    existing = IndexModelField.from_motor_index_information(await collection.index_information())
+
+    for index in IndexModelField.list_difference(existing, declared):
+        if drop_stale:
+            logger.info("dropping index %s on %s", index.name, collection.name)
+            await collection.drop_index(index.name)
+        else:
+            logger.warning("undeclared index %s on %s", index.name, collection.name)
+
+    for index in IndexModelField.list_difference(declared, existing):
+        try:
+            await collection.create_indexes([index.index])
+            logger.info("created index %s on %s", index.name, collection.name)
+        except OperationFailure as exc:
+            # e.g. duplicate user_id/visit_id values blocking a unique index;
+            # keep serving and surface it instead of failing startup
+            logger.error("could not create index %s on %s: %s", index.name, collection.name, exc)
+
+
+def query_shapes():
+    now = datetime.now(tz=pytz.UTC)
+    open_statuses = {"$nin": [VisitStatus.cancelledVisit.value, VisitStatus.checkedOut.value]}
+    return [
+        (Visit, "visit_by_id", {"visit_id": ""}),
+        (Visit, "client_overlap", {"assigned_client_id": "", "from_ts": {"$lte": now}, "to_ts": {"$gte": now}, "main_status": open_statuses}),
+        (Visit, "emp_overlap", {"assigned_emp_id": "", "from_ts": {"$lte": now}, "to_ts": {"$gte": now}, "main_status": open_statuses}),
+        (Visit, "admin_visits", {"assigned_admin_id": "", "main_status": {"$ne": VisitStatus.cancelledVisit.value}}),
+        (Visit, "emp_visits", {"assigned_emp_id": "", "main_status": {"$ne": VisitStatus.cancelledVisit.value}}),
+        (Visit, "client_visits", {"assigned_client_id": "", "main_status": {"$ne": VisitStatus.cancelledVisit.value}}),
+        (Yasho_User, "user_by_id", {"user_id": ""}),
+        (Yasho_User, "user_by_mobile", {"mobile": ""}),
+        (Yasho_User, "active_users", {"entity_type": "employee", "is_active": True}),
+        (VitalReading, "client_trend", {"client_id": "", "at": {"$gte": now, "$lte": now}}),
+    ]
+
+
+def _plan_summary(plan):
+    # slot-based engine wraps the classic plan tree in "queryPlan"
+    plan = plan.get("queryPlan", plan)
+    stages = []
+    while plan:
+        stage = plan.get("stage", "?")
+        if plan.get("indexName"):
+            stage = f"{stage}({plan['indexName']})"
+        stages.append(stage)
+        plan = plan.get("inputStage") or (plan.get("inputStages") or [None])[0]
+    return " <- ".join(stages)
+
+
+async def explain_query_shapes(database):
+    for model, name, query in query_shapes():
+        collection = database[model.get_collection_name()]
+        explain = await collection.find(query).explain()
+        plan = explain.get("queryPlanner", {}).get("winningPlan", {})
+        logger.info("query plan %s.%s: %s", collection.name, name, _plan_summary(plan))
@@ -0,0 +1,34 @@
+from contextvars import ContextVar
+from typing import Optional
+
+from app.app_bundle.env_config_settings import get_settings
+
+# tenant of the request being served; None means the default tenant Beanie was initialised with
+current_tenant: ContextVar[Optional[str]] = ContextVar("current_tenant", default=None)
+
+_collections = {}
+
+
+def tenant_db_name(tenant_id: str):
+    return f"{tenant_id}_{get_settings().environment}"
+
+
+def allowed_tenants():
+    extra = [t.strip() for t in get_settings().tenant_ids.split(",") if t.strip()]
+    return {get_settings().tenant_id, *extra}
+
+
+def active_tenant():
+    return current_tenant.get() or get_settings().tenant_id
+
+
+def tenant_collection(collection):
+    tenant_id = current_tenant.get()
+    if tenant_id is None or tenant_id == get_settings().tenant_id:
+        return collection
+    key = (tenant_id, collection.name)
+    routed = _collections.get(key)
+    if routed is None:
+        routed = collection.database.client[tenant_db_name(tenant_id)][collection.name]
+        _collections[key] = routed
+    return routed
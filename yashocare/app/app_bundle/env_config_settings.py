@@ -13,6 +13,74 @@ class Settings(BaseSettings):
     service_name: str
     jwt_secret: str
     tenant_id: str = "yashocare"
+    # comma-separated tenants served next to tenant_id, selected by X-Tenant-Id
+    tenant_ids: str = ""
+    tenant_cache_size: int = 32
+    mongo_max_pool_size: int = 100
+    mongo_min_pool_size: int = 0
+    mongo_max_idle_time_ms: int = 300000
+    mongo_connect_timeout_ms: int = 5000
+    mongo_server_selection_timeout_ms: int = 5000
+    mongo_socket_timeout_ms: int = 30000
+    mongo_reconcile_indexes: bool = True
+    mongo_drop_stale_indexes: bool = False
+    mongo_explain_query_shapes: bool = True
+    s3_region: str = "ap-south-1"
+    # e.g. a local MinIO/moto server; empty means AWS
+    s3_endpoint_url: str = ""
+    s3_max_pool_connections: int = 32
+    s3_upload_workers: int = 16
+    presigned_url_expiration: int = 3600
+    presigned_url_expiry_margin: int = 600
+    presigned_url_cache_size: int = 10000
+    upload_slot_expiration: int = 900
+    upload_max_bytes: int = 10 * 1024 * 1024
+    upload_request_max_bytes: int = 40 * 1024 * 1024
+    upload_fanout: int = 4
+    s3_upload_chunk_bytes: int = 8 * 1024 * 1024
+    s3_upload_part_concurrency: int = 4
+    upload_extensions: str = "jpg,jpeg,png,webp,heic"
+    token_cache_size: int = 10000
+    token_cache_ttl: int = 3600
+    # how often a worker checks whether users changed on another worker
+    user_version_check_seconds: int = 5
+    profile_cache_size: int = 10000
+    profile_cache_ttl: int = 300
+    bcrypt_rounds: int = 12
+    nightly_job_enabled: bool = False
+    # UTC, 18:30 is midnight IST
+    nightly_job_at: str = "18:30"
+    job_lock_lease_seconds: int = 900
+    availability_refresh_seconds: int = 60
+    # check-in/out must be this close to the visit location, 0 turns it off
+    geofence_radius_m: int = 300
+    # lets app versions that send blank lat/lng through unfenced while they
+    # are still in use; malformed coordinates are rejected either way
+    geofence_allow_missing_location: bool = False
+    nearest_lookback_days: int = 90
+    nearest_max_distance_m: int = 50000
+    bulk_assign_max_rows: int = 500
+    sync_max_events: int = 200
+    # how far back an offline event may have happened
+    sync_max_age_hours: int = 72
+    sync_receipt_ttl_days: int = 30
+    export_max_days: int = 400
+    vitals_trend_max_days: int = 400
+    fast_json_responses: bool = False
+    visit_events_buffer: int = 1000
+    visit_events_queue: int = 100
+    visit_events_heartbeat_seconds: int = 15
+    metrics_enabled: bool = True
+    loop_lag_interval: float = 0.5
+    loop_lag_window: int = 120
+    image_processing: bool = True
+    image_workers: int = 2
+    image_max_dimension: int = 1600
+    image_thumb_dimension: int = 320
+    image_quality: int = 82
+    password_workers: int = 2
+    password_concurrency: int = 8
+    password_queue_timeout: float = 2.0
 
     class Config:
         env_file = os.getcwd() + "/.env"
@@ -20,10 +88,5 @@ class Settings(BaseSettings):
 
 @lru_cache
 def get_settings():
-    for k, v in Settings():
-        os.environ[str(k).upper()] = v
-
+    # validated once per process; everything reads it through here
     return Settings()
-
-
-settings = get_settings()
@@ -0,0 +1,29 @@
+import math
+
+EARTH_RADIUS_M = 6371000
+
+
+def to_coordinate(value):
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def distance_m(lat1, lng1, lat2, lng2):
+    # haversine, same as the old server/middleware/getDistance.js
+    d_lat = math.radians(lat2 - lat1)
+    d_lng = math.radians(lng2 - lng1)
+    a = (
+        math.sin(d_lat / 2) ** 2
+        + math.cos(math.radians(lat1)) * math.cos(math.radians(lat2)) * math.sin(d_lng / 2) ** 2
+    )
+    return EARTH_RADIUS_M * 2 * math.atan2(math.sqrt(a), math.sqrt(1 - a))
+
+
+def geo_point(lat, lng):
+    # GeoJSON wants [lng, lat]; None when either side is missing or out of range
+    lat, lng = to_coordinate(lat), to_coordinate(lng)
+    if lat is None or lng is None or not -90 <= lat <= 90 or not -180 <= lng <= 180:
+        return None
+    return {"type": "Point", "coordinates": [lng, lat]}
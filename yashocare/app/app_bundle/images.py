@@ -0,0 +1,192 @@
+import asyncio
+import io
+import logging
+import os
+import tempfile
+from concurrent.futures import ProcessPoolExecutor
+from functools import lru_cache
+from uuid import uuid4
+
+from app.app_bundle.env_config_settings import get_settings
+from app.app_bundle.s3_utils import (
+    delete_s3_objects_async,
+    download_from_s3_async,
+    upload_fileobj_to_s3_async,
+    upload_to_s3_async,
+)
+
+logger = logging.getLogger(__name__)
+
+SPOOL_CHUNK = 1024 * 1024
+# background normalize jobs for presigned uploads, kept so they are not collected mid-run
+_pending = set()
+
+
+@lru_cache
+def get_image_executor():
+    # decoding and resizing hold the GIL, so they run in processes, not threads
+    return ProcessPoolExecutor(max_workers=get_settings().image_workers)
+
+
+def thumbnail_key(object_name: str):
+    prefix, _, name = object_name.rpartition("/")
+    return f"{prefix}/thumb/{name.rsplit('.', 1)[0]}.jpg"
+
+
+def thumbnail_collection(database):
+    # one document per image whose thumbnail was written; images without one
+    # (legacy, undecodable, processing off or not yet run) are served as is
+    return database[f"{get_settings().service_name}_{get_settings().environment}_image_thumbnail"]
+
+
+def _image_database():
+    from app.user.user_model import Yasho_User
+
+    return Yasho_User.get_motor_collection().database
+
+
+async def record_thumbnail(object_name: str):
+    await thumbnail_collection(_image_database()).update_one(
+        {"_id": object_name}, {"$set": {"key": thumbnail_key(object_name)}}, upsert=True
+    )
+
+
+async def with_thumbnails(object_names):
+    cursor = thumbnail_collection(_image_database()).find({"_id": {"$in": list(object_names)}}, {"_id": 1})
+    return {document["_id"] async for document in cursor}
+
+
+def _encode(image, max_dimension: int, quality: int):
+    image = image.copy()
+    image.thumbnail((max_dimension, max_dimension))
+    buffer = io.BytesIO()
+    # saving without exif= drops the EXIF block (GPS, device, timestamps)
+    image.save(buffer, "JPEG", quality=quality, optimize=True)
+    return buffer.getvalue()
+
+
+def normalize_image(source, max_dimension: int, thumb_dimension: int, quality: int):
+    # runs in a worker process on a file path or bytes; returns (full,
+    # thumbnail) JPEG bytes, or None when Pillow cannot decode the upload
+    # (e.g. HEIC without a plugin)
+    from PIL import Image, ImageOps, UnidentifiedImageError
+
+    try:
+        with Image.open(source if isinstance(source, str) else io.BytesIO(source)) as image:
+            image = ImageOps.exif_transpose(image)
+            if image.mode != "RGB":
+                image = image.convert("RGB")
+            return _encode(image, max_dimension, quality), _encode(image, thumb_dimension, quality)
+    except (UnidentifiedImageError, Image.DecompressionBombError, OSError):
+        return None
+
+
+async def normalize_image_async(source):
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(
+        get_image_executor(),
+        normalize_image,
+        source,
+        get_settings().image_max_dimension,
+        get_settings().image_thumb_dimension,
+        get_settings().image_quality,
+    )
+
+
+def _spool(file, max_bytes: int):
+    # copies the upload to a temp file in chunks, so neither this process nor
+    # the worker (which gets the path) holds it whole; None when it is larger
+    # than max_bytes, checked up front when the file can tell its size
+    if file.seekable():
+        size = file.seek(0, os.SEEK_END)
+        file.seek(0)
+        if size > max_bytes:
+            return None
+    spooled = tempfile.NamedTemporaryFile(prefix="upload-", delete=False)
+    written = 0
+    with spooled:
+        for chunk in iter(lambda: file.read(SPOOL_CHUNK), b""):
+            written += len(chunk)
+            if written > max_bytes:
+                break
+            spooled.write(chunk)
+    if written > max_bytes:
+        os.unlink(spooled.name)
+        return None
+    return spooled.name
+
+
+async def upload_image_async(file, prefix: str, extension: str, bucket_name: str):
+    # stores the normalized image and its thumbnail; uploads Pillow cannot
+    # read are stored as sent, like before. None when the upload is larger
+    # than upload_max_bytes.
+    name = str(uuid4().int)[:10]
+    if not get_settings().image_processing:
+        return await upload_fileobj_to_s3_async(file, f"{prefix}{name}.{extension}", bucket_name, extension)
+    path = await asyncio.to_thread(_spool, file, get_settings().upload_max_bytes)
+    if path is None:
+        return None
+    try:
+        return await _upload_spooled(path, prefix, name, extension, bucket_name)
+    finally:
+        os.unlink(path)
+
+
+async def _upload_spooled(path: str, prefix: str, name: str, extension: str, bucket_name: str):
+    variants = await normalize_image_async(path)
+    if variants is None:
+        with open(path, "rb") as original:
+            return await upload_fileobj_to_s3_async(original, f"{prefix}{name}.{extension}", bucket_name, extension)
+    full, thumb = variants
+    object_name = f"{prefix}{name}.jpg"
+    results = await asyncio.gather(
+        upload_to_s3_async(full, object_name, bucket_name, "jpeg"),
+        upload_to_s3_async(thumb, thumbnail_key(object_name), bucket_name, "jpeg"),
+        return_exceptions=True,
+    )
+    failed = [result for result in results if isinstance(result, BaseException)]
+    if failed:
+        await discard_images([object_name], bucket_name)
+        raise failed[0]
+    await record_thumbnail(object_name)
+    return results[0]
+
+
+async def discard_images(object_names, bucket_name: str):
+    # thumbnails may not exist; deleting a missing key is not an error in S3
+    if object_names:
+        await delete_s3_objects_async(
+            [key for name in object_names for key in (name, thumbnail_key(name))], bucket_name
+        )
+        await thumbnail_collection(_image_database()).delete_many({"_id": {"$in": list(object_names)}})
+
+
+async def normalize_upload(object_name: str, bucket_name: str):
+    # same treatment as upload_image_async, in place: the object is rewritten
+    # as the EXIF-free JPEG (its key keeps the extension the slot was issued
+    # with) and the thumbnail is recorded once both are stored
+    data = await download_from_s3_async(object_name, bucket_name)
+    variants = await normalize_image_async(data) if data else None
+    if not variants:
+        return
+    full, thumb = variants
+    await upload_to_s3_async(full, object_name, bucket_name, "jpeg")
+    await upload_to_s3_async(thumb, thumbnail_key(object_name), bucket_name, "jpeg")
+    await record_thumbnail(object_name)
+
+
+def schedule_normalize(object_name: str, bucket_name: str):
+    # presigned uploads reach S3 without passing through us; normalize them
+    # after the request instead of making the client wait
+    if not get_settings().image_processing:
+        return
+
+    async def run():
+        try:
+            await normalize_upload(object_name, bucket_name)
+        except Exception:
+            logger.exception("normalizing %s failed", object_name)
+
+    task = asyncio.create_task(run())
+    _pending.add(task)
+    task.add_done_callback(_pending.discard)
@@ -0,0 +1,143 @@
+import asyncio
+import os
+import time
+
+from prometheus_client import (
+    CONTENT_TYPE_LATEST,
+    REGISTRY,
+    CollectorRegistry,
+    Counter,
+    Gauge,
+    Histogram,
+    generate_latest,
+    multiprocess,
+)
+from pymongo import monitoring
+
+# the check-in path is a few ms of Mongo plus S3 puts in the 100ms-1s range
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+HTTP_REQUEST_SECONDS = Histogram(
+    "http_request_duration_seconds", "HTTP request latency", ["method", "route"], buckets=LATENCY_BUCKETS
+)
+HTTP_REQUESTS = Counter("http_requests", "HTTP requests by status", ["method", "route", "status"])
+MONGO_COMMAND_SECONDS = Histogram(
+    "mongo_command_duration_seconds", "Mongo command latency", ["command", "collection"], buckets=LATENCY_BUCKETS
+)
+MONGO_COMMAND_FAILURES = Counter("mongo_command_failures", "Failed Mongo commands", ["command", "collection"])
+S3_CALL_SECONDS = Histogram(
+    "s3_call_duration_seconds", "S3 API call latency, retries included", ["operation", "outcome"], buckets=LATENCY_BUCKETS
+)
+PASSWORD_SECONDS = Histogram(
+    "password_duration_seconds", "bcrypt work and admission wait", ["operation", "phase"], buckets=LATENCY_BUCKETS
+)
+VISIT_EVENT_SUBSCRIBERS = Gauge("visit_event_subscribers", "Open visit event streams", multiprocess_mode="livesum")
+LOOP_LAG_SECONDS = Gauge("event_loop_lag_seconds", "Last measured event loop lag", multiprocess_mode="max")
+LOOP_LAG_MAX_SECONDS = Gauge(
+    "event_loop_lag_max_seconds", "Worst event loop lag in the last sampling window", multiprocess_mode="max"
+)
+
+
+def metrics_payload():
+    # under several uvicorn/gunicorn workers every process writes to
+    # PROMETHEUS_MULTIPROC_DIR and the scrape aggregates them
+    if os.environ.get("PROMETHEUS_MULTIPROC_DIR"):
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+    else:
+        registry = REGISTRY
+    return generate_latest(registry), CONTENT_TYPE_LATEST
+
+
+class MetricsMiddleware:
+    # pure ASGI so streamed bodies (allUsers ndjson) are timed to the last chunk
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+        status = {"code": 500}
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                status["code"] = message["status"]
+            await send(message)
+
+        started = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            # the route template, not the raw path, keeps label cardinality bounded
+            route = getattr(scope.get("route"), "path", "unmatched")
+            method = scope["method"]
+            HTTP_REQUEST_SECONDS.labels(method, route).observe(time.perf_counter() - started)
+            HTTP_REQUESTS.labels(method, route, str(status["code"])).inc()
+
+
+class MongoCommandMetrics(monitoring.CommandListener):
+    # collection names only appear on the started event, so they are kept
+    # per (connection, request_id) until the command finishes
+    def __init__(self):
+        self._collections = {}
+
+    def started(self, event):
+        command = event.command
+        collection = command.get(event.command_name)
+        if event.command_name == "getMore":
+            collection = command.get("collection")
+        if not isinstance(collection, str):
+            collection = ""
+        self._collections[(event.connection_id, event.request_id)] = collection
+
+    def _collection(self, event):
+        return self._collections.pop((event.connection_id, event.request_id), "")
+
+    def succeeded(self, event):
+        MONGO_COMMAND_SECONDS.labels(event.command_name, self._collection(event)).observe(
+            event.duration_micros / 1_000_000
+        )
+
+    def failed(self, event):
+        collection = self._collection(event)
+        MONGO_COMMAND_SECONDS.labels(event.command_name, collection).observe(event.duration_micros / 1_000_000)
+        MONGO_COMMAND_FAILURES.labels(event.command_name, collection).inc()
+
+
+def instrument_s3_client(client):
+    # botocore emits before-call/after-call around each API call including
+    # its retries; presigning is local and never shows up here
+    def before_call(context, **kwargs):
+        context["metrics_started"] = time.perf_counter()
+
+    def after_call(context, model, http_response, **kwargs):
+        started = context.get("metrics_started")
+        if started is not None:
+            outcome = "error" if http_response.status_code >= 400 else "ok"
+            S3_CALL_SECONDS.labels(model.name, outcome).observe(time.perf_counter() - started)
+
+    def after_call_error(context, event_name, **kwargs):
+        # emitted with the exception only; the operation is the event's last part
+        started = context.get("metrics_started")
+        if started is not None:
+            S3_CALL_SECONDS.labels(event_name.rsplit(".", 1)[-1], "error").observe(time.perf_counter() - started)
+
+    client.meta.events.register("before-call.s3", before_call)
+    client.meta.events.register("after-call.s3", after_call)
+    client.meta.events.register("after-call-error.s3", after_call_error)
+    return client
+
+
+async def monitor_loop_lag(interval: float, window: int):
+    # a sleep that wakes up late means something held the loop; the lag
+    # gauge is the latest sample, the max gauge the worst of each window
+    worst, samples = 0.0, 0
+    while True:
+        started = time.perf_counter()
+        await asyncio.sleep(interval)
+        lag = max(0.0, time.perf_counter() - started - interval)
+        LOOP_LAG_SECONDS.set(lag)
+        worst, samples = max(worst, lag), samples + 1
+        if samples >= window:
+            LOOP_LAG_MAX_SECONDS.set(worst)
+            worst, samples = 0.0, 0
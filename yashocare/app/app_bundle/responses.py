@@ -0,0 +1,37 @@
+from enum import Enum
+
+from bson import ObjectId
+from pydantic import BaseModel
+from starlette.responses import JSONResponse
+
+from app.app_bundle.env_config_settings import get_settings
+
+
+def _default(value):
+    # same shapes jsonable_encoder produces: models by alias in json mode
+    # (so id comes out as _id), ObjectIds as strings
+    if isinstance(value, BaseModel):
+        return value.model_dump(mode="json", by_alias=True)
+    if isinstance(value, ObjectId):
+        return str(value)
+    if isinstance(value, Enum):
+        return value.value
+    if isinstance(value, (set, frozenset)):
+        return list(value)
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+
+class FastJSONResponse(JSONResponse):
+    # Returned as a Response, so FastAPI skips jsonable_encoder entirely;
+    # pydantic-core dumps the models and orjson writes the envelope.
+    def render(self, content) -> bytes:
+        import orjson
+
+        return orjson.dumps(content, default=_default, option=orjson.OPT_NON_STR_KEYS)
+
+
+def list_response(payload: dict):
+    # opt-in for the list endpoints; the plain dict keeps the default path
+    if get_settings().fast_json_responses:
+        return FastJSONResponse(payload)
+    return payload
@@ -1,10 +1,74 @@
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
 from typing import Literal
+from uuid import uuid4
 
-import boto3
-from botocore.config import Config
-from botocore.exceptions import NoCredentialsError, PartialCredentialsError
-
+from app.app_bundle.cache import TTLCache
 from app.app_bundle.env_config_settings import get_settings
+from app.app_bundle.metrics import instrument_s3_client
+
+@lru_cache
+def get_presigned_url_cache():
+    # presigned GET urls by (bucket, key); entries expire before the urls do
+    return TTLCache(
+        maxsize=get_settings().presigned_url_cache_size,
+        ttl=get_settings().presigned_url_expiration - get_settings().presigned_url_expiry_margin,
+    )
+
+
+# boto3 costs a few hundred ms to import, so it is loaded on the first S3 call
+def _credential_errors():
+    from botocore.exceptions import NoCredentialsError, PartialCredentialsError
+
+    return NoCredentialsError, PartialCredentialsError
+
+
+def _client_error():
+    from botocore.exceptions import ClientError
+
+    return ClientError
+
+
+@lru_cache
+def get_s3_client():
+    import boto3
+    from botocore.config import Config
+
+    # boto3 clients are thread-safe, one per process shares the connection pool
+    return instrument_s3_client(boto3.client(
+        "s3",
+        aws_access_key_id=get_settings().aws_temp_ac_key,
+        aws_secret_access_key=get_settings().aws_temp_sc_key,
+        config=Config(
+            signature_version="s3v4",
+            max_pool_connections=get_settings().s3_max_pool_connections,
+            retries={"max_attempts": 3, "mode": "standard"},
+        ),
+        region_name=get_settings().s3_region,
+        endpoint_url=get_settings().s3_endpoint_url or None,
+    ))
+
+
+@lru_cache
+def get_transfer_config():
+    from boto3.s3.transfer import TransferConfig
+
+    # files above the chunk size go up as multipart, one chunk in memory per part
+    chunk = get_settings().s3_upload_chunk_bytes
+    return TransferConfig(
+        multipart_threshold=chunk,
+        multipart_chunksize=chunk,
+        max_concurrency=get_settings().s3_upload_part_concurrency,
+    )
+
+
+@lru_cache
+def get_upload_executor():
+    return ThreadPoolExecutor(
+        max_workers=get_settings().s3_upload_workers,
+        thread_name_prefix="s3-upload",
+    )
 
 
 def generate_pre_signed_urls(
@@ -13,13 +77,7 @@ def generate_pre_signed_urls(
         type_of_req: Literal["both", "get", "put"],
         expiration=3600,
 ):
-    s3_client = boto3.client(
-        "s3",
-        aws_access_key_id=get_settings().aws_temp_ac_key,
-        aws_secret_access_key=get_settings().aws_temp_sc_key,
-        config=Config(signature_version="s3v4"),
-        region_name="ap-south-1",
-    )
+    s3_client = get_s3_client()
     get_url, put_url = "", ""
     try:
         if type_of_req == "get" or type_of_req == "both":
@@ -34,19 +92,36 @@ def generate_pre_signed_urls(
                 Params={"Bucket": bucket_name, "Key": object_name},
                 ExpiresIn=expiration,
             )
-    except (NoCredentialsError, PartialCredentialsError):
+    except _credential_errors():
         return "Credentials not available"
     return get_url, put_url
 
 
+def generate_pre_signed_get_urls(bucket_name, object_names, expiration=3600):
+    s3_client = get_s3_client()
+    # keep a margin so a cached url is never handed out about to expire
+    ttl = expiration - get_settings().presigned_url_expiry_margin
+    urls = {}
+    for object_name in object_names:
+        if object_name in urls:
+            continue
+        url = get_presigned_url_cache().get((bucket_name, object_name))
+        if url is None:
+            try:
+                url = s3_client.generate_presigned_url(
+                    "get_object",
+                    Params={"Bucket": bucket_name, "Key": object_name},
+                    ExpiresIn=expiration,
+                )
+            except _credential_errors():
+                return "Credentials not available"
+            get_presigned_url_cache().set((bucket_name, object_name), url, ttl)
+        urls[object_name] = url
+    return urls
+
+
 def upload_to_s3(file_content, object_name: str, bucket_name: str,extension:str):
-    s3_client = boto3.client(
-        "s3",
-        aws_access_key_id=get_settings().aws_temp_ac_key,
-        aws_secret_access_key=get_settings().aws_temp_sc_key,
-        config=Config(signature_version="s3v4"),
-        region_name="ap-south-1",
-    )
+    s3_client = get_s3_client()
     try:
         s3_client.put_object(
             Bucket=bucket_name,
@@ -55,5 +130,114 @@ def upload_to_s3(file_content, object_name: str, bucket_name: str,extension:str)
             ContentType=f"image/{extension}",
         )
         return object_name
-    except (NoCredentialsError, PartialCredentialsError):
-        return "Credentials not available"
\ No newline at end of file
+    except _credential_errors():
+        return "Credentials not available"
+
+
+async def upload_to_s3_async(file_content, object_name: str, bucket_name: str,extension:str):
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(
+        get_upload_executor(), upload_to_s3, file_content, object_name, bucket_name, extension
+    )
+
+
+def upload_fileobj_to_s3(fileobj, object_name: str, bucket_name: str, extension: str):
+    # reads fileobj in chunks instead of loading it whole like upload_to_s3
+    try:
+        get_s3_client().upload_fileobj(
+            fileobj,
+            bucket_name,
+            object_name,
+            ExtraArgs={"ContentType": f"image/{extension}"},
+            Config=get_transfer_config(),
+        )
+        return object_name
+    except _credential_errors():
+        return "Credentials not available"
+
+
+async def upload_fileobj_to_s3_async(fileobj, object_name: str, bucket_name: str, extension: str):
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(
+        get_upload_executor(), upload_fileobj_to_s3, fileobj, object_name, bucket_name, extension
+    )
+
+
+def delete_s3_objects(object_names, bucket_name: str):
+    object_names = list(object_names)
+    # delete_objects takes at most 1000 keys per call
+    for start in range(0, len(object_names), 1000):
+        get_s3_client().delete_objects(
+            Bucket=bucket_name,
+            Delete={"Objects": [{"Key": name} for name in object_names[start:start + 1000]], "Quiet": True},
+        )
+
+
+async def delete_s3_objects_async(object_names, bucket_name: str):
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(get_upload_executor(), delete_s3_objects, object_names, bucket_name)
+
+
+def download_from_s3(object_name: str, bucket_name: str):
+    try:
+        return get_s3_client().get_object(Bucket=bucket_name, Key=object_name)["Body"].read()
+    except _client_error() as exc:
+        if exc.response.get("Error", {}).get("Code") in ("404", "NoSuchKey", "NotFound"):
+            return None
+        raise
+
+
+async def download_from_s3_async(object_name: str, bucket_name: str):
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(get_upload_executor(), download_from_s3, object_name, bucket_name)
+
+
+def head_s3_object(object_name: str, bucket_name: str):
+    try:
+        return get_s3_client().head_object(Bucket=bucket_name, Key=object_name)
+    except _client_error() as exc:
+        if exc.response.get("Error", {}).get("Code") in ("404", "NoSuchKey", "NotFound"):
+            return None
+        raise
+
+
+async def head_s3_object_async(object_name: str, bucket_name: str):
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(get_upload_executor(), head_s3_object, object_name, bucket_name)
+
+
+def new_upload_slot(prefix: str, extension: str):
+    # presigned PUT for a fresh key under prefix; the signature pins the
+    # content type so the object lands with the one we verify later
+    extension = extension.lower().lstrip(".")
+    if extension not in get_settings().upload_extensions.split(","):
+        return None
+    object_name = f"{prefix}{str(uuid4().int)[:10]}.{extension}"
+    content_type = f"image/{extension}"
+    try:
+        put_url = get_s3_client().generate_presigned_url(
+            "put_object",
+            Params={"Bucket": get_settings().config_s3_bucket, "Key": object_name, "ContentType": content_type},
+            ExpiresIn=get_settings().upload_slot_expiration,
+        )
+    except _credential_errors():
+        return None
+    return {
+        "object_key": object_name,
+        "upload_url": put_url,
+        "content_type": content_type,
+        "expires_in": get_settings().upload_slot_expiration,
+    }
+
+
+async def verify_uploaded_object(object_name: str, prefix: str):
+    if not object_name or not object_name.startswith(prefix) or ".." in object_name:
+        return "Invalid object key"
+    head = await head_s3_object_async(object_name, get_settings().config_s3_bucket)
+    if not head:
+        return "Uploaded object not found"
+    if head.get("ContentLength", 0) > get_settings().upload_max_bytes:
+        return "Uploaded object too large"
+    if not head.get("ContentType", "").startswith("image/"):
+        return "Uploaded object is not an image"
+    return None
@@ -0,0 +1,95 @@
+import asyncio
+import logging
+import os
+import socket
+from datetime import datetime, timedelta
+from uuid import uuid4
+
+import pytz
+from pymongo import ReturnDocument
+from pymongo.errors import DuplicateKeyError
+
+from app.app_bundle.env_config_settings import get_settings
+
+logger = logging.getLogger(__name__)
+
+_owner = f"{socket.gethostname()}:{os.getpid()}:{str(uuid4().int)[:6]}"
+
+
+def job_lock_collection(database):
+    return database[f"{get_settings().service_name}_{get_settings().environment}_job_lock"]
+
+
+async def acquire_job_lock(database, job_name: str, run_key: str):
+    # one document per job: free when its lease ran out, done for the day once
+    # last_run_for == run_key. The upsert collides with the existing document
+    # when another worker holds the lease or already finished this run.
+    now = datetime.now(tz=pytz.UTC)
+    try:
+        lock = await job_lock_collection(database).find_one_and_update(
+            {"_id": job_name, "locked_until": {"$lte": now}, "last_run_for": {"$ne": run_key}},
+            {"$set": {
+                "owner": _owner,
+                "locked_until": now + timedelta(seconds=get_settings().job_lock_lease_seconds),
+            }},
+            upsert=True,
+            return_document=ReturnDocument.AFTER,
+        )
+    except DuplicateKeyError:
+        return False
+    return lock["owner"] == _owner
+
+
+async def release_job_lock(database, job_name: str, run_key: str = None):
+    update = {"locked_until": datetime.now(tz=pytz.UTC)}
+    if run_key:
+        update["last_run_for"] = run_key
+    await job_lock_collection(database).update_one({"_id": job_name, "owner": _owner}, {"$set": update})
+
+
+async def save_job_progress(database, job_name: str, progress: dict):
+    # also extends the lease, so a long job is not taken over while it is
+    # still making progress
+    now = datetime.now(tz=pytz.UTC)
+    await job_lock_collection(database).update_one(
+        {"_id": job_name, "owner": _owner},
+        {"$set": {"progress": progress, "locked_until": now + timedelta(seconds=get_settings().job_lock_lease_seconds)}},
+    )
+
+
+async def job_progress(database, job_name: str):
+    # what an interrupted run saved, for the next run to resume from
+    lock = await job_lock_collection(database).find_one({"_id": job_name}, {"progress": 1})
+    return (lock or {}).get("progress")
+
+
+async def run_locked(database, job_name: str, run_key: str, job):
+    if not await acquire_job_lock(database, job_name, run_key):
+        logger.info("job %s for %s already running or done elsewhere", job_name, run_key)
+        return None
+    try:
+        result = await job()
+    except Exception:
+        await release_job_lock(database, job_name)
+        raise
+    await release_job_lock(database, job_name, run_key)
+    return result
+
+
+def seconds_until(at: str):
+    hour, minute = (int(part) for part in at.split(":"))
+    now = datetime.now(tz=pytz.UTC)
+    next_run = now.replace(hour=hour, minute=minute, second=0, microsecond=0)
+    if next_run <= now:
+        next_run += timedelta(days=1)
+    return (next_run - now).total_seconds()
+
+
+async def run_daily(at: str, job):
+    # in-process trigger; the job lock keeps several workers from all running it
+    while True:
+        await asyncio.sleep(seconds_until(at))
+        try:
+            await job()
+        except Exception:
+            logger.exception("scheduled job failed")
@@ -0,0 +1,77 @@
+import time
+from functools import lru_cache
+
+from app.app_bundle.cache import TTLCache
+from app.app_bundle.database.tenant import active_tenant
+from app.app_bundle.env_config_settings import get_settings
+
+# Profiles and is_active flags are cached per worker. Every user write bumps
+# one version document per tenant; each worker reads it at most every
+# user_version_check_seconds and drops both caches when it moved, so a
+# deactivation or profile change reaches all workers at the cost of one read
+# per tenant and worker rather than one per user.
+VERSION_ID = "users"
+# tenant_id -> (version, checked_at)
+_versions = {}
+
+
+@lru_cache
+def get_profile_cache():
+    # /me payloads by (tenant_id, user_id)
+    return TTLCache(maxsize=get_settings().profile_cache_size, ttl=get_settings().profile_cache_ttl)
+
+
+@lru_cache
+def get_user_status_cache():
+    # is_active by (tenant_id, user_id)
+    return TTLCache(maxsize=get_settings().token_cache_size, ttl=get_settings().profile_cache_ttl)
+
+
+def user_version_collection(database):
+    return database[f"{get_settings().service_name}_{get_settings().environment}_user_version"]
+
+
+def _user_database():
+    from app.user.user_model import Yasho_User
+
+    return Yasho_User.get_motor_collection().database
+
+
+async def bump_user_version(database=None):
+    await user_version_collection(database if database is not None else _user_database()).update_one(
+        {"_id": VERSION_ID}, {"$inc": {"version": 1}}, upsert=True
+    )
+
+
+async def refresh_user_caches():
+    tenant_id = active_tenant()
+    version, checked_at = _versions.get(tenant_id, (None, 0.0))
+    if time.monotonic() - checked_at < get_settings().user_version_check_seconds:
+        return
+    # claimed before the read so concurrent requests do not all query
+    _versions[tenant_id] = (version, time.monotonic())
+    document = await user_version_collection(_user_database()).find_one({"_id": VERSION_ID})
+    current = (document or {}).get("version", 0)
+    if version is not None and current != version:
+        get_profile_cache().clear()
+        get_user_status_cache().clear()
+    _versions[tenant_id] = (current, time.monotonic())
+
+
+def forget_user(user_id: str, tenant_id: str = None):
+    key = (tenant_id or active_tenant(), user_id)
+    get_profile_cache().pop(key)
+    get_user_status_cache().pop(key)
+
+
+async def is_user_active(user_id: str):
+    await refresh_user_caches()
+    key = (active_tenant(), user_id)
+    active = get_user_status_cache().get(key)
+    if active is None:
+        from app.user.user_model import Yasho_User
+
+        user = await Yasho_User.get_motor_collection().find_one({"user_id": user_id}, {"_id": 0, "is_active": 1})
+        active = bool(user and user.get("is_active", True))
+        get_user_status_cache().set(key, active)
+    return active
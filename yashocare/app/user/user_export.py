@@ -0,0 +1,205 @@
+import argparse
+import asyncio
+import csv
+import io
+import logging
+import tempfile
+import time
+from datetime import datetime, timedelta
+from typing import List, Optional
+
+import pytz
+
+from app.user.user_enum import UserEntity
+from app.user.user_model import Yasho_User
+from app.user.user_service import attendance_range, build_attendance
+from app.visit.visit_model import ExportVisit, Visit
+
+logger = logging.getLogger(__name__)
+
+# one row per employee, visit and day; the day rules are build_attendance's
+EXPORT_COLUMNS = [
+    "date", "emp_id", "emp_name", "client_id", "client_name", "visit_id",
+    "status", "check_in_time", "check_out_time", "hours", "reason",
+]
+CSV_FLUSH_BYTES = 64 * 1024
+PARQUET_ROW_GROUP = 50_000
+
+
+def _midnight(day):
+    return datetime(day.year, day.month, day.day)
+
+
+def export_pipeline(start: datetime, end: datetime, user_ids: Optional[List[str]] = None):
+    first_day, last_day = _midnight(start.date()), _midnight(end.date())
+    in_range = {"$and": [{"$gte": ["$$d.for_date", first_day]}, {"$lte": ["$$d.for_date", last_day]}]}
+    return [
+        {"$match": {
+            "assigned_emp_id": {"$in": user_ids} if user_ids else {"$ne": None},
+            **attendance_range(start, end),
+        }},
+        # emp_range index order, so rows come out grouped by employee
+        {"$sort": {"assigned_emp_id": 1, "from_ts": 1}},
+        # only the requested days, and only the fields a row needs, leave the server
+        {"$project": {
+            "_id": 0,
+            "visit_id": 1,
+            "assigned_emp_id": 1,
+            "assigned_client_id": 1,
+            "from_ts": 1,
+            "to_ts": 1,
+            "details": {"$map": {
+                "input": {"$filter": {"input": {"$ifNull": ["$details", []]}, "as": "d", "cond": in_range}},
+                "as": "d",
+                "in": {
+                    "for_date": "$$d.for_date",
+                    "daily_status": "$$d.daily_status",
+                    "checkIn": {"at": "$$d.checkIn.at"},
+                    "checkOut": {"at": "$$d.checkOut.at"},
+                    "reason": "$$d.reason",
+                },
+            }},
+        }},
+    ]
+
+
+async def _names():
+    # the roster is small next to a year of rows, so names are joined here
+    # rather than with a $lookup per visit
+    names = {}
+    cursor = Yasho_User.get_motor_collection().find(
+        {"entity_type": {"$in": [UserEntity.employee.value, UserEntity.client.value]}},
+        {"_id": 0, "user_id": 1, "name": 1},
+    )
+    async for user in cursor:
+        names[user["user_id"]] = user.get("name")
+    return names
+
+
+async def attendance_rows(start: datetime, end: datetime, user_ids: Optional[List[str]] = None):
+    names = await _names()
+    today = datetime.now(tz=pytz.UTC).date()
+    first_day, last_day = start.date(), end.date()
+    cursor = Visit.get_motor_collection().aggregate(
+        export_pipeline(start, end, user_ids), allowDiskUse=True, batchSize=500
+    )
+    async for document in cursor:
+        visit = ExportVisit.model_validate(document)
+        reasons = {detail.for_date.date(): detail.reason for detail in visit.details if detail.reason}
+        for day, entry in sorted(build_attendance([visit], today).items()):
+            if day < first_day or day > last_day:
+                continue
+            check_in, check_out = entry["check_in_time"], entry["check_out_time"]
+            yield {
+                "date": day,
+                "emp_id": visit.assigned_emp_id,
+                "emp_name": names.get(visit.assigned_emp_id),
+                "client_id": visit.assigned_client_id,
+                "client_name": names.get(visit.assigned_client_id),
+                "visit_id": visit.visit_id,
+                "status": entry["status"],
+                "check_in_time": check_in,
+                "check_out_time": check_out,
+                "hours": round((check_out - check_in).total_seconds() / 3600, 2) if check_in and check_out else None,
+                "reason": reasons.get(day),
+            }
+
+
+def _csv_value(value):
+    if value is None:
+        return ""
+    if isinstance(value, datetime):
+        return value.isoformat()
+    return value
+
+
+async def stream_attendance_csv(start: datetime, end: datetime, user_ids: Optional[List[str]] = None):
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(EXPORT_COLUMNS)
+    async for row in attendance_rows(start, end, user_ids):
+        writer.writerow([_csv_value(row[column]) for column in EXPORT_COLUMNS])
+        if buffer.tell() >= CSV_FLUSH_BYTES:
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+    yield buffer.getvalue()
+
+
+def parquet_available():
+    try:
+        import pyarrow  # noqa: F401
+    except ImportError:
+        return False
+    return True
+
+
+async def write_attendance_parquet(sink, start: datetime, end: datetime, user_ids: Optional[List[str]] = None):
+    # pyarrow is optional; callers check parquet_available() first
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    schema = pa.schema([
+        ("date", pa.date32()), ("emp_id", pa.string()), ("emp_name", pa.string()),
+        ("client_id", pa.string()), ("client_name", pa.string()), ("visit_id", pa.string()),
+        ("status", pa.string()), ("check_in_time", pa.timestamp("us")), ("check_out_time", pa.timestamp("us")),
+        ("hours", pa.float64()), ("reason", pa.string()),
+    ])
+    loop = asyncio.get_running_loop()
+    writer = pq.ParquetWriter(sink, schema)
+    batch = []
+    try:
+        async for row in attendance_rows(start, end, user_ids):
+            batch.append(row)
+            if len(batch) >= PARQUET_ROW_GROUP:
+                table = pa.Table.from_pylist(batch, schema=schema)
+                await loop.run_in_executor(None, writer.write_table, table)
+                batch = []
+        if batch:
+            await loop.run_in_executor(None, writer.write_table, pa.Table.from_pylist(batch, schema=schema))
+    finally:
+        writer.close()
+
+
+async def stream_attendance_parquet(start: datetime, end: datetime, user_ids: Optional[List[str]] = None):
+    # the footer is written last, so the file is built on disk past 16MB
+    # and then sent in chunks
+    with tempfile.SpooledTemporaryFile(max_size=16 * 1024 * 1024) as spool:
+        await write_attendance_parquet(spool, start, end, user_ids)
+        spool.seek(0)
+        while chunk := spool.read(CSV_FLUSH_BYTES):
+            yield chunk
+
+
+async def main(args):
+    from app.app_bundle.database.db_core import get_db_session_db
+    from app.app_bundle.database.tenant import current_tenant
+
+    await get_db_session_db(args.tenant) if args.tenant else await get_db_session_db()
+    if args.tenant:
+        current_tenant.set(args.tenant)
+    start = datetime.fromisoformat(args.from_date)
+    end = datetime.fromisoformat(args.to_date) + timedelta(hours=23, minutes=59, seconds=59)
+    user_ids = [u for u in args.user_ids.split(",") if u] if args.user_ids else None
+    started = time.monotonic()
+    if args.format == "parquet":
+        if not parquet_available():
+            raise SystemExit("parquet export needs pyarrow installed")
+        await write_attendance_parquet(args.out, start, end, user_ids)
+    else:
+        with open(args.out, "w", newline="") as f:
+            async for chunk in stream_attendance_csv(start, end, user_ids):
+                f.write(chunk)
+    logger.info("attendance export written to %s in %.1fs", args.out, time.monotonic() - started)
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    parser = argparse.ArgumentParser(description="Export attendance rows for payroll")
+    parser.add_argument("--from", dest="from_date", required=True, help="first day, YYYY-MM-DD")
+    parser.add_argument("--to", dest="to_date", required=True, help="last day, YYYY-MM-DD")
+    parser.add_argument("--format", choices=["csv", "parquet"], default="csv")
+    parser.add_argument("--user-ids", help="comma-separated employee ids, default all")
+    parser.add_argument("--tenant")
+    parser.add_argument("--out", required=True)
+    asyncio.run(main(parser.parse_args()))
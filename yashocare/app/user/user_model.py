@@ -1,14 +1,16 @@
 from datetime import datetime,timedelta
 from typing import List, Optional, Literal
 
-import bcrypt
-import jwt
 import pytz
 
 from beanie import Indexed
+from pymongo import ASCENDING, IndexModel
 
-from app.app_bundle.database.base import MongoDocument
+from app.app_bundle.auth.passwords import check_password, check_password_async, hash_password
+from app.app_bundle.database.base import MongoDocument, collection_name
+from app.app_bundle.database.tenant import active_tenant
 from app.app_bundle.env_config_settings import get_settings
+from app.user.user_cache import bump_user_version, forget_user
 from app.user.user_enum import UserEntity
 
 
@@ -18,19 +20,36 @@ class Yasho_User(MongoDocument):
     password:Optional[str]=None
     email:Optional[str] = None
     entity_type:UserEntity
-    user_id:str
+    user_id:Indexed(str, unique=True)
 
     class Settings:
-        name = f"{get_settings().service_name}_{get_settings().environment}_user"
+        name = collection_name("user")
+        indexes = [
+            # user directory: filter by entity/active, page by user_id
+            IndexModel(
+                [("entity_type", ASCENDING), ("is_active", ASCENDING), ("user_id", ASCENDING)],
+                name="entity_active_user",
+            ),
+        ]
+
+    async def after_write(self):
+        forget_user(self.user_id)
+        await bump_user_version(self.get_motor_collection().database)
 
     def check_password(self, password):
-        return bcrypt.checkpw(password.encode("utf-8"), self.password.encode())
+        return check_password(password, self.password)
+
+    async def check_password_async(self, password):
+        return await check_password_async(password, self.password)
 
     def token(self, entity_type):
+        import jwt
+
         return jwt.encode(
             {
                 "user_id": str(self.user_id),
                 "entity_type": str(entity_type.value),
+                "tenant_id": active_tenant(),
                 "exp": datetime.now(tz=pytz.UTC) + timedelta(days=7),
             },
             key=get_settings().jwt_secret,
@@ -38,12 +57,6 @@ class Yasho_User(MongoDocument):
             headers={"alg": "HS256", "typ": "JWT"},
         )
 
-def hash_password(password: str) -> bytes:
-    pw = bytes(password, "utf-8")
-    salt = bcrypt.gensalt()
-    return bcrypt.hashpw(pw, salt)
-
-
 class Admin(Yasho_User):
     entity_type:UserEntity = UserEntity.admin
 
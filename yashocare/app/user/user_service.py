@@ -1,11 +1,22 @@
+import asyncio
+import json
 from datetime import datetime, timedelta
+from typing import List, Optional
 from uuid import uuid4
 import pytz
+from pymongo import ASCENDING
 
+from app.app_bundle.auth.passwords import PasswordPoolBusy
+from app.app_bundle.database.tenant import active_tenant
 from app.app_bundle.env_config_settings import get_settings
-from app.app_bundle.s3_utils import upload_to_s3
+from app.app_bundle.images import upload_image_async, schedule_normalize, discard_images
+from app.app_bundle.s3_utils import new_upload_slot, verify_uploaded_object
+from app.user.user_enum import UserEntity
+from app.user.user_cache import get_profile_cache
 from app.user.user_model import Yasho_User, Client, Employee
-from app.visit.visit_model import Visit, VisitStatus
+from app.visit.visit_availability import availability_index
+from app.visit.visit_model import Visit, VisitStatus, AttendanceVisit
+from app.visit.visit_ops import emp_reason_op
 
 
 ist = pytz.timezone('Asia/Kolkata')
@@ -20,6 +31,29 @@ async def get_client(user_id:str):
 async def get_employee(user_id:str):
     return await Employee.find_one({"user_id":user_id})
 
+async def get_profile(user_id:str, entity_type:str):
+    key = (active_tenant(), user_id)
+    profile = get_profile_cache().get(key)
+    if profile is not None:
+        return profile,0
+    if entity_type == "employee":
+        user = await get_employee(user_id=user_id)
+    else:
+        user = await get_user(user_id=user_id)
+    if not user:
+        return "Invalid user",404
+    profile = {
+        "email": user.email,
+        "name": user.name,
+        "mobile": user.mobile,
+        "user_id": user.user_id,
+        "entity_type": user.entity_type,
+        "photo":user.profie_photo if entity_type == "employee" else None
+    }
+    get_profile_cache().set(key, profile)
+    return profile,0
+
+
 async def create_client(
         name,email,mobile, address
 ):
@@ -35,28 +69,103 @@ async def create_client(
     user = user.model_dump(exclude={"id"})
     return user,0
 
+# registration uploads happen before the employee has a user_id
+EMPLOYEE_PENDING_PREFIXES = {
+    "employee_id_proof": "yashocare/employee/id_proof/pending/",
+    "employee_profile": "yashocare/employee/profile/pending/",
+}
+
+
+def user_upload_prefix(kind:str, user_id:Optional[str]=None):
+    if kind == "client_id_proof":
+        return f"yashocare/client/id_proof/{user_id}/" if user_id else None
+    return EMPLOYEE_PENDING_PREFIXES.get(kind)
+
+
+async def create_upload_slot(kind:str, extension:str, user_id:Optional[str]=None):
+    prefix = user_upload_prefix(kind, user_id)
+    if not prefix:
+        return "Provide user_id for client uploads",403
+    if kind == "client_id_proof" and not await get_client(user_id=user_id):
+        return "User don't exists", 401
+    slot = new_upload_slot(prefix, extension)
+    if not slot:
+        return "Unsupported file type",403
+    return slot,0
+
+
+async def store_user_images(prefix:str, files, object_keys):
+    if object_keys:
+        for object_key in object_keys:
+            error = await verify_uploaded_object(object_key, prefix)
+            if error:
+                return None, error
+        for object_key in object_keys:
+            schedule_normalize(object_key, get_settings().config_s3_bucket)
+        return list(object_keys), None
+    files = [img for img in files or [] if img]
+    # at most upload_fanout files are spooled/processed at once; each is
+    # streamed to disk, so a request holds only decoded images in memory
+    if any((img.size or 0) > get_settings().upload_max_bytes for img in files):
+        return None, "Uploaded file too large"
+    if sum(img.size or 0 for img in files) > get_settings().upload_request_max_bytes:
+        return None, "Uploaded files too large"
+    slots = asyncio.Semaphore(get_settings().upload_fanout)
+
+    async def store(img):
+        async with slots:
+            extension = img.filename.split(".")[-1]
+            return await upload_image_async(img.file,prefix,extension,get_settings().config_s3_bucket)
+
+    results = await asyncio.gather(*[store(img) for img in files], return_exceptions=True)
+    object_names = [name for name in results if isinstance(name, str) and name != "Credentials not available"]
+    if len(object_names) != len(files):
+        await discard_images(object_names, get_settings().config_s3_bucket)
+        return None, "Error while uploading id_proofs"
+    return object_names, None
+
+
 async def create_employee(
-        name, email, mobile, address, sex, dob, guard_name, guard_mobile, id_proof, profile
+        name, email, mobile, address, sex, dob, guard_name, guard_mobile, id_proof, profile,
+        id_proof_keys=None, profile_key=None
 ):
-    if not any([name,email,mobile,address,profile,id_proof,sex,dob,guard_name,guard_mobile]):
+    if not any([name,email,mobile,address,profile or profile_key,id_proof or id_proof_keys,sex,dob,guard_name,guard_mobile]):
         return "Please provide all required fields",401
     user = await Yasho_User.find_one({"mobile": mobile})
     if user:
         return "User already exists. Please login", 401
+    if not profile and not profile_key:
+        return "Please provide all required fields",401
     user_id = "E"+str(uuid4().int)[:6]
-    id_proofs=[]
-    for img in id_proof:
-        extension = img.filename.split(".")[-1]
-        id_name = str(uuid4().int)[:10]
-        imgname = id_name+"."+extension
-        object_name = upload_to_s3(img.file,f"yashocare/employee/id_proof/{user_id}/{imgname}",get_settings().config_s3_bucket,extension)
-        if not object_name:
-            return "Error while uploading id_proofs",403
-        id_proofs.append(object_name)
-    extension = profile.filename.split(".")[-1]
-    profileImageName = str(uuid4().int)[:10]
-    imgname = profileImageName+"."+extension
-    profile_name = upload_to_s3(profile.file,f"yashocare/employee/profile/{user_id}/{imgname}",get_settings().config_s3_bucket,extension)
+    id_result, profile_result = await asyncio.gather(
+        store_user_images(
+            user_upload_prefix("employee_id_proof") if id_proof_keys else f"yashocare/employee/id_proof/{user_id}/",
+            id_proof,
+            id_proof_keys,
+        ),
+        store_user_images(
+            user_upload_prefix("employee_profile") if profile_key else f"yashocare/employee/profile/{user_id}/",
+            [profile],
+            [profile_key] if profile_key else None,
+        ),
+        return_exceptions=True,
+    )
+    # only objects uploaded by this request are removed; presigned keys stay
+    uploaded = [
+        name
+        for result, keys in ((id_result, id_proof_keys), (profile_result, profile_key))
+        if not keys and not isinstance(result, BaseException)
+        for name in result[0] or []
+    ]
+    failure = next((result for result in (id_result, profile_result) if isinstance(result, BaseException)), None)
+    if failure:
+        await discard_images(uploaded, get_settings().config_s3_bucket)
+        raise failure
+    (id_proofs, id_error), (profile_names, profile_error) = id_result, profile_result
+    if id_error or profile_error:
+        await discard_images(uploaded, get_settings().config_s3_bucket)
+        return id_error or profile_error,403
+    profile_name = profile_names[0]
     user = Employee(
         user_id=user_id,
         name=name,
@@ -70,7 +179,12 @@ async def create_employee(
         profie_photo = profile_name,
         id_proof = id_proofs
     )
-    await user.save()
+    try:
+        await user.save()
+    except Exception:
+        await discard_images(uploaded, get_settings().config_s3_bucket)
+        raise
+    availability_index().track_employee(user_id, name)
     user = user.model_dump(exclude={"id"})
     return user,0
 
@@ -80,43 +194,95 @@ async def generate_user_login(mobile: str, password: str):
     user = await Yasho_User.find_one({"mobile":mobile})
     if not user:
         return "User Not Found, Please Register!!", 404
-    if not user.check_password(password=password):
+    try:
+        valid = await user.check_password_async(password=password)
+    except PasswordPoolBusy:
+        return "Too many login attempts, please retry", 429
+    if not valid:
         return "Invalid password!!", 403
     return {"token": user.token(entity_type=user.entity_type)}, 0
 
 
-async def get_all_users():
-    clients = await Client.find({"entity_type":"client","is_active":True}).to_list()
-    employees = await Employee.find({"entity_type":"employee","is_active":True}).to_list()
-    users = clients + employees
+DIRECTORY_ENTITIES = [UserEntity.client.value, UserEntity.employee.value]
+# fields the admin directory may ask for; never password
+DIRECTORY_FIELDS = {
+    "user_id", "name", "mobile", "email", "entity_type", "is_active", "address", "id_proof",
+    "dob", "sex", "profie_photo", "guard_name", "guard_mobile", "created_at", "updated_at",
+}
+DEFAULT_DIRECTORY_FIELDS = ["user_id", "name", "entity_type"]
+
+
+async def get_all_users(entity_type:Optional[str]=None, active:bool=True):
+    users = []
+    if entity_type in (None, UserEntity.client.value):
+        users += await Client.find({"entity_type":"client","is_active":active}).to_list()
+    if entity_type in (None, UserEntity.employee.value):
+        users += await Employee.find({"entity_type":"employee","is_active":active}).to_list()
     if not users:
         return "No users found",404
     users = [user.model_dump(exclude={"id"}) for user in users]
     return users,0
 
 
+def _directory_cursor(fields:Optional[List[str]], entity_type:Optional[str], active:bool, after:Optional[str]=None):
+    query = {
+        "entity_type": entity_type or {"$in": DIRECTORY_ENTITIES},
+        "is_active": active,
+    }
+    if after:
+        query["user_id"] = {"$gt": after}
+    projection = {field: 1 for field in (fields or DEFAULT_DIRECTORY_FIELDS) if field in DIRECTORY_FIELDS}
+    projection["user_id"] = 1
+    projection["_id"] = 0
+    return Yasho_User.get_motor_collection().find(query, projection).sort("user_id", ASCENDING)
+
+
+async def get_user_directory(
+        limit:int,
+        cursor:Optional[str]=None,
+        fields:Optional[List[str]]=None,
+        entity_type:Optional[str]=None,
+        active:bool=True,
+):
+    users = await _directory_cursor(fields, entity_type, active, cursor).limit(limit).to_list(length=limit)
+    next_cursor = users[-1]["user_id"] if len(users) == limit else None
+    return {"users": users, "next_cursor": next_cursor},0
+
+
+async def stream_user_directory(
+        fields:Optional[List[str]]=None,
+        cursor:Optional[str]=None,
+        entity_type:Optional[str]=None,
+        active:bool=True,
+):
+    async for user in _directory_cursor(fields, entity_type, active, cursor).batch_size(500):
+        yield json.dumps(user, default=str) + "\n"
+
+
 async def deactivate(user_id):
     user = await  get_user(user_id)
     if not user:
         return "User not found",404
     await user.delete()
+    availability_index().forget_employee(user_id)
     return "User deactivated successfully",0
 
 
-async def get_attendance(user_id, start: datetime, end: datetime):
-    today = datetime.now(tz=pytz.UTC).date()
+ATTENDANCE_STATUSES = {
+    VisitStatus.checkedOut.value: "present",
+    VisitStatus.checkedIn.value: "half_day",
+    VisitStatus.vitalUpdate.value: "half_day",
+}
+
+
+def attendance_range(start: datetime, end: datetime):
     start = ist.localize(start).astimezone(pytz.UTC)
     end = ist.localize(end).astimezone(pytz.UTC)
-    visits = await Visit.find({
-        "assigned_emp_id": user_id,
-        "from_ts": {"$lte": end},
-        "to_ts": {"$gte": start}
-    }).to_list()
+    return {"from_ts": {"$lte": end}, "to_ts": {"$gte": start}}
 
-    if not visits:
-        return "No visits available for this range", 0
 
-    attendance = {}
+def build_attendance(visits, today, attendance=None):
+    attendance = {} if attendance is None else attendance
 
     for visit in visits:
         from_date = visit.from_ts.date()
@@ -125,65 +291,78 @@ async def get_attendance(user_id, start: datetime, end: datetime):
         if from_date > to_date:
             continue
 
-        total_days = (to_date - from_date).days + 1
+        # first detail per day that counts towards attendance, so every
+        # day below is a dict lookup instead of a scan over visit.details
+        marked = {}
+        for detail in visit.details or []:
+            day = detail.for_date.date()
+            if day not in marked and detail.daily_status.value in ATTENDANCE_STATUSES:
+                marked[day] = detail
 
-        for i in range(total_days):
+        for i in range((to_date - from_date).days + 1):
             curr_date = from_date + timedelta(days=i)
-            status = "absent"
-            check_in = None
-            check_out = None
-
-            for detail in visit.details:
-                if detail.for_date.date() == curr_date:
-                    if detail.daily_status.value == VisitStatus.checkedOut.value:
-                        status = "present"
-                        check_in = detail.checkIn.at if detail.checkIn else None
-                        check_out = detail.checkOut.at if detail.checkOut else None
-                        break
-                    elif detail.daily_status.value in [VisitStatus.checkedIn.value, VisitStatus.vitalUpdate.value]:
-                        status = "half_day"
-                        check_in = detail.checkIn.at if detail.checkIn else None
-                        break
-
+            detail = marked.get(curr_date)
+            if not detail:
+                attendance[curr_date] = {"status": "absent", "check_in_time": None, "check_out_time": None}
+                continue
+            status = ATTENDANCE_STATUSES[detail.daily_status.value]
             attendance[curr_date] = {
                 "status": status,
-                "check_in_time": check_in if status in ["half_day", "present"] else None,
-                "check_out_time": check_out if status == "present" else None
+                "check_in_time": detail.checkIn.at if detail.checkIn else None,
+                "check_out_time": detail.checkOut.at if detail.checkOut and status == "present" else None
             }
 
+    return attendance
+
+
+async def get_attendance(user_id, start: datetime, end: datetime):
+    today = datetime.now(tz=pytz.UTC).date()
+    visits = await Visit.find({
+        "assigned_emp_id": user_id,
+        **attendance_range(start, end)
+    }).project(AttendanceVisit).to_list()
+
+    if not visits:
+        return "No visits available for this range", 0
+
+    return build_attendance(visits, today), 0
+
+
+async def get_bulk_attendance(user_ids: Optional[List[str]], start: datetime, end: datetime):
+    today = datetime.now(tz=pytz.UTC).date()
+    emp_filter = {"$in": user_ids} if user_ids else {"$ne": None}
+    query = Visit.find({
+        "assigned_emp_id": emp_filter,
+        **attendance_range(start, end)
+    }).project(AttendanceVisit)
+
+    attendance = {}
+    async for visit in query:
+        build_attendance([visit], today, attendance.setdefault(visit.assigned_emp_id, {}))
+
+    if not attendance:
+        return "No visits available for this range", 0
     return attendance, 0
 
 
 async def update_reason(user_id:str,date:datetime,reason:str):
-    visit = await Visit.find({"assigned_emp_id":user_id,"from_ts":{"$gte":date}}).to_list()
-    updated = False
-    for v in visit:
-        for i in v.details:
-            if i.for_date.date() == date.date():
-                i.reason = reason
-                await v.save()
-                updated=True
-                break
-
-        if updated:
-            break
-    if updated:
+    result = await Visit.get_motor_collection().update_one(*emp_reason_op(user_id, date.date(), reason))
+    if result.matched_count:
         return "Reason updated",0
     return "Reason not updated",402
 
-async def client_id_proof(user_id:str,id_proof):
+async def client_id_proof(user_id:str,id_proof,id_proof_keys=None):
     user = await get_client(user_id=user_id)
     if not user:
         return "User don't exists", 401
-    id_proofs=[]
-    for img in id_proof:
-        extension = img.filename.split(".")[-1]
-        id_name = str(uuid4().int)[:10]
-        imgname = id_name+"."+extension
-        object_name = upload_to_s3(img.file,f"yashocare/client/id_proof/{user_id}/{imgname}",get_settings().config_s3_bucket,extension)
-        if not object_name:
-            return "Error while uploading id_proofs",403
-        id_proofs.append(object_name)
+    id_proofs, error = await store_user_images(user_upload_prefix("client_id_proof", user_id), id_proof, id_proof_keys)
+    if error:
+        return error,403
     user.id_proof = id_proofs
-    await user.save()
+    try:
+        await user.save()
+    except Exception:
+        if not id_proof_keys:
+            await discard_images(id_proofs, get_settings().config_s3_bucket)
+        raise
     return "Id proofs uploaded successfully",0
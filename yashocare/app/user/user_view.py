@@ -1,21 +1,29 @@
 from datetime import datetime
 from typing import Optional, Literal, Annotated, List
 
-from fastapi import APIRouter, Depends, UploadFile, File, Form
+from fastapi import APIRouter, Depends, UploadFile, File, Form, Query
+from fastapi.responses import StreamingResponse
 from pydantic import BaseModel
 
 from app.app_bundle.auth.authorized_req_user import CurrentUserInfo, get_current_user
+from app.app_bundle.env_config_settings import get_settings
+from app.app_bundle.responses import list_response
 from app.user.user_enum import UserEntity
+from app.user.user_export import parquet_available, stream_attendance_csv, stream_attendance_parquet
 from app.user.user_service import (
     generate_user_login,
-    get_user,
+    get_profile,
     create_client,
     create_employee,
     get_all_users,
+    get_user_directory,
+    stream_user_directory,
     deactivate,
-    get_attendance, get_employee,
+    get_attendance,
+    get_bulk_attendance,
     update_reason,
-    client_id_proof
+    client_id_proof,
+    create_upload_slot
 )
 
 user_router = APIRouter()
@@ -43,6 +51,12 @@ class Attendance(BaseModel):
     to_ts:datetime
 
 
+class BulkAttendance(BaseModel):
+    user_ids:Optional[List[str]]=None
+    from_ts:datetime
+    to_ts:datetime
+
+
 class Update(BaseModel):
     reason:str
     date:datetime
@@ -51,6 +65,12 @@ class Update(BaseModel):
 class ClientIdProof(BaseModel):
     user_id:str
 
+
+class UploadSlot(BaseModel):
+    kind:Literal["employee_id_proof","employee_profile","client_id_proof"]
+    extension:str
+    user_id:Optional[str]=None
+
 @user_router.post("/register")
 async def handler_user_register(create_req:ClientRegister):
     response,status_code = await create_client(
@@ -65,8 +85,11 @@ async def handler_user_register(create_req:ClientRegister):
 
 @user_router.post("/employee-register")
 async def handler_user_register(
-        id_proof:Annotated[List[UploadFile], File()],name:str= Form(...),email:str = Form(...),mobile:str=Form(...),address:str=Form(...),sex:Literal["male","female"]=Form(...),dob:str=Form(...),guard_name:str=Form(...),guard_mobile:str=Form(...),
-        photo : UploadFile = File(...),
+        name:str= Form(...),email:str = Form(...),mobile:str=Form(...),address:str=Form(...),sex:Literal["male","female"]=Form(...),dob:str=Form(...),guard_name:str=Form(...),guard_mobile:str=Form(...),
+        id_proof:Annotated[Optional[List[UploadFile]], File()] = None,
+        photo : Optional[UploadFile] = File(None),
+        id_proof_keys:Annotated[Optional[List[str]], Form()] = None,
+        photo_key:Optional[str] = Form(None),
         curr_user: CurrentUserInfo = Depends(get_current_user)
 ):
     if curr_user["entity_type"] != UserEntity.admin.value:
@@ -80,7 +103,9 @@ async def handler_user_register(
         guard_name=guard_name,
         guard_mobile=guard_mobile,
         id_proof=id_proof,
-        profile=photo
+        profile=photo,
+        id_proof_keys=id_proof_keys,
+        profile_key=photo_key,
     )
     if status_code == 0:
         return {"status_code": status_code, "data": response}
@@ -108,49 +133,76 @@ class ResetSubMerchantPassword(BaseModel):
 async def handler_get_me_detail(
         curr_user: CurrentUserInfo = Depends(get_current_user)
 ):
-    user_id = curr_user["user_id"]
-    if curr_user["entity_type"] == "employee":
-        user = await get_employee(user_id=user_id)
-    else:
-        user = await get_user(user_id=user_id)
-    if not user:
-        return {"status_code":404,"data":"Invalid user"}
+    response, status_code = await get_profile(user_id=curr_user["user_id"],entity_type=curr_user["entity_type"])
+    if status_code != 0:
+        return {"status_code":status_code,"data":response}
     return {
         "status_code": 0,
         "data": {
-            "profile": {
-                "email": user.email,
-                "name": user.name,
-                "mobile": user.mobile,
-                "user_id": user.user_id,
-                "entity_type": user.entity_type,
-                "photo":user.profie_photo if curr_user["entity_type"]== "employee" else None
-            },
+            "profile": response,
         },
     }
 
 
 @user_router.get("/allUsers")
 async def handler_get_all_users(
+        limit: Optional[int] = Query(None, ge=1, le=1000),
+        cursor: Optional[str] = None,
+        fields: Optional[str] = None,
+        entity_type: Optional[Literal["client","employee"]] = None,
+        active: bool = True,
+        format: Literal["json","ndjson"] = "json",
         curr_user: CurrentUserInfo = Depends(get_current_user),
 ):
     if curr_user["entity_type"] != UserEntity.admin.value:
         return {"error":"Not Authorized","status_code":401}
-    response, status_code = await get_all_users()
+    field_list = [f.strip() for f in fields.split(",") if f.strip()] if fields else None
+    if format == "ndjson":
+        return StreamingResponse(
+            stream_user_directory(fields=field_list,cursor=cursor,entity_type=entity_type,active=active),
+            media_type="application/x-ndjson",
+        )
+    # a cursor only comes from a paged response, so it keeps paging
+    if limit is None and field_list is None and cursor is None:
+        response, status_code = await get_all_users(entity_type=entity_type,active=active)
+    else:
+        response, status_code = await get_user_directory(
+            limit=limit or 100,
+            cursor=cursor,
+            fields=field_list,
+            entity_type=entity_type,
+            active=active,
+        )
     if status_code == 0:
-        return {"status_code": status_code, "data": response}
+        return list_response({"status_code": status_code, "data": response})
     return {"status_code": status_code, "error": response}
 
 
 @user_router.post("/client-id-proof")
 async def handler_add_client_id_proof(
-        id_proof:Annotated[List[UploadFile], File()],
         user_id:str=Form(...),
+        id_proof:Annotated[Optional[List[UploadFile]], File()] = None,
+        id_proof_keys:Annotated[Optional[List[str]], Form()] = None,
+        curr_user: CurrentUserInfo = Depends(get_current_user)
+):
+    if curr_user["entity_type"] != UserEntity.admin.value:
+        return {"error":"Not Authorized","status_code":401}
+    if not id_proof and not id_proof_keys:
+        return {"error":"Provide id proofs","status_code":403}
+    response, status_code = await client_id_proof(user_id=user_id,id_proof=id_proof,id_proof_keys=id_proof_keys)
+    if status_code == 0:
+        return {"status_code": status_code, "data": response}
+    return {"status_code": status_code, "error": response}
+
+
+@user_router.post("/upload-slot")
+async def handler_create_upload_slot(
+        slot_req:UploadSlot,
         curr_user: CurrentUserInfo = Depends(get_current_user)
 ):
     if curr_user["entity_type"] != UserEntity.admin.value:
         return {"error":"Not Authorized","status_code":401}
-    response, status_code = await client_id_proof(user_id=user_id,id_proof=id_proof)
+    response, status_code = await create_upload_slot(kind=slot_req.kind,extension=slot_req.extension,user_id=slot_req.user_id)
     if status_code == 0:
         return {"status_code": status_code, "data": response}
     return {"status_code": status_code, "error": response}
@@ -178,10 +230,50 @@ async def handler_get_attendance(
         return {"error":"Not Authorized","status_code":401}
     response, status_code = await get_attendance(user_id=att_req.user_id,start=att_req.from_ts,end=att_req.to_ts)
     if status_code == 0:
-        return {"status_code": status_code, "data": response}
+        return list_response({"status_code": status_code, "data": response})
+    return {"status_code": status_code, "error": response}
+
+
+@user_router.post("/attendance/bulk")
+async def handler_get_bulk_attendance(
+        att_req:BulkAttendance,
+        curr_user: CurrentUserInfo = Depends(get_current_user),
+):
+    if curr_user["entity_type"] != UserEntity.admin.value:
+        return {"error":"Not Authorized","status_code":401}
+    response, status_code = await get_bulk_attendance(user_ids=att_req.user_ids,start=att_req.from_ts,end=att_req.to_ts)
+    if status_code == 0:
+        return list_response({"status_code": status_code, "data": response})
     return {"status_code": status_code, "error": response}
 
 
+@user_router.get("/attendance/export")
+async def handler_export_attendance(
+        from_ts: datetime,
+        to_ts: datetime,
+        user_ids: Optional[str] = None,
+        format: Literal["csv","parquet"] = "csv",
+        curr_user: CurrentUserInfo = Depends(get_current_user),
+):
+    if curr_user["entity_type"] != UserEntity.admin.value:
+        return {"error":"Not Authorized","status_code":401}
+    if to_ts < from_ts or (to_ts - from_ts).days > get_settings().export_max_days:
+        return {"error":f"Range must be within {get_settings().export_max_days} days","status_code":403}
+    if format == "parquet" and not parquet_available():
+        return {"error":"Parquet export is not available","status_code":501}
+    id_list = [u.strip() for u in user_ids.split(",") if u.strip()] if user_ids else None
+    filename = f"attendance_{from_ts:%Y%m%d}_{to_ts:%Y%m%d}.{format}"
+    if format == "parquet":
+        body, media_type = stream_attendance_parquet(from_ts, to_ts, id_list), "application/vnd.apache.parquet"
+    else:
+        body, media_type = stream_attendance_csv(from_ts, to_ts, id_list), "text/csv"
+    return StreamingResponse(
+        body,
+        media_type=media_type,
+        headers={"Content-Disposition": f'attachment; filename="{filename}"'},
+    )
+
+
 @user_router.post("/update-reason")
 async def handler_update_reason(
         reason_req: Update,
@@ -0,0 +1,137 @@
+import asyncio
+import bisect
+import time
+from datetime import date, datetime
+
+import pytz
+
+from app.app_bundle.database.tenant import active_tenant
+from app.app_bundle.env_config_settings import get_settings
+from app.user.user_enum import UserEntity
+from app.user.user_model import Yasho_User
+from app.visit.visit_model import Visit
+from app.visit.visit_ops import OPEN_STATUSES
+
+
+def _day(value):
+    return value.date() if isinstance(value, datetime) else value
+
+
+class AvailabilityIndex:
+    # Per-employee interval lists of open visits, sorted by start day, so an
+    # overlap check is a bisect plus a short scan instead of a Mongo query.
+    # Ranges are inclusive whole days like the assign/extend overlap queries.
+    # Writes in this process keep it current; other workers' writes are
+    # picked up by a full reload every availability_refresh_seconds, so it
+    # serves searches while assign and extend decide with Mongo.
+    def __init__(self):
+        self._intervals = {}
+        self._visits = {}
+        self._employees = {}
+        self._loaded_at = None
+        self._pending = None
+        self._lock = asyncio.Lock()
+
+    def _insert(self, visit_id, emp_id, from_day, to_day):
+        if from_day is None or to_day is None:
+            # the overlap queries never match a missing bound either
+            return
+        self._visits[visit_id] = (emp_id, from_day, to_day)
+        bisect.insort(self._intervals.setdefault(emp_id, []), (from_day, to_day, visit_id))
+
+    def track(self, visit_id: str, emp_id: str, from_ts, to_ts):
+        self._journal("track", visit_id, emp_id, from_ts, to_ts)
+        if self._loaded_at is None or not emp_id:
+            return
+        self._remove(visit_id)
+        self._insert(visit_id, emp_id, _day(from_ts), _day(to_ts))
+
+    def track_employee(self, emp_id: str, name: str):
+        self._journal("track_employee", emp_id, name)
+        if self._loaded_at is not None:
+            self._employees[emp_id] = name
+
+    def forget_employee(self, emp_id: str):
+        self._journal("forget_employee", emp_id)
+        self._employees.pop(emp_id, None)
+
+    def forget(self, visit_id: str):
+        self._journal("forget", visit_id)
+        self._remove(visit_id)
+
+    def _remove(self, visit_id):
+        entry = self._visits.pop(visit_id, None)
+        if entry:
+            emp_id, from_day, to_day = entry
+            self._intervals[emp_id].remove((from_day, to_day, visit_id))
+
+    def _journal(self, change, *args):
+        # writes that land while a reload is reading are replayed on top of
+        # it, since the reload may have read the visit before or after them
+        if self._pending is not None:
+            self._pending.append((change, args))
+
+    def is_free(self, emp_id: str, from_ts, to_ts):
+        from_day, to_day = _day(from_ts), _day(to_ts)
+        intervals = self._intervals.get(emp_id, [])
+        # only intervals starting on or before to_day can overlap
+        end = bisect.bisect_right(intervals, (to_day, date.max, ""))
+        return not any(interval_to >= from_day for _, interval_to, _ in intervals[:end])
+
+    def free_employees(self, from_ts, to_ts):
+        return [
+            {"user_id": emp_id, "name": name}
+            for emp_id, name in self._employees.items()
+            if self.is_free(emp_id, from_ts, to_ts)
+        ]
+
+    def is_stale(self):
+        return self._loaded_at is None or time.monotonic() - self._loaded_at > get_settings().availability_refresh_seconds
+
+    async def ensure_loaded(self):
+        if not self.is_stale():
+            return self
+        async with self._lock:
+            if self.is_stale():
+                await self._load()
+        return self
+
+    async def _load(self):
+        # built aside and swapped in at once, so lookups and writes meanwhile
+        # keep using the previous maps
+        fresh = AvailabilityIndex()
+        self._pending = []
+        try:
+            async for user in Yasho_User.get_motor_collection().find(
+                {"entity_type": UserEntity.employee.value, "is_active": True},
+                {"_id": 0, "user_id": 1, "name": 1},
+            ):
+                fresh._employees[user["user_id"]] = user.get("name")
+            today = datetime.now(tz=pytz.UTC).date()
+            async for visit in Visit.get_motor_collection().find(
+                {
+                    "main_status": {"$in": OPEN_STATUSES},
+                    "assigned_emp_id": {"$ne": None},
+                    "to_ts": {"$gte": datetime(today.year, today.month, today.day)},
+                },
+                {"_id": 0, "visit_id": 1, "assigned_emp_id": 1, "from_ts": 1, "to_ts": 1},
+            ).sort("from_ts", 1):
+                fresh._insert(visit["visit_id"], visit["assigned_emp_id"], _day(visit["from_ts"]), _day(visit["to_ts"]))
+            fresh._loaded_at = time.monotonic()
+            for change, args in self._pending:
+                getattr(fresh, change)(*args)
+        finally:
+            self._pending = None
+        self._intervals, self._visits, self._employees = fresh._intervals, fresh._visits, fresh._employees
+        self._loaded_at = fresh._loaded_at
+
+
+_indexes = {}
+
+
+def availability_index():
+    tenant_id = active_tenant()
+    index = _indexes.get(tenant_id)
+    if index is None:
+        index = _indexes[tenant_id] = AvailabilityIndex()
+    return index
@@ -0,0 +1,243 @@
+import asyncio
+import json
+import logging
+from collections import deque
+from datetime import datetime
+
+from pymongo.errors import OperationFailure, PyMongoError
+
+from app.app_bundle.database.tenant import active_tenant, current_tenant
+from app.app_bundle.env_config_settings import get_settings
+from app.app_bundle.metrics import VISIT_EVENT_SUBSCRIBERS
+from app.visit.visit_model import VISIT_OWNER_FIELDS, Visit, VisitStatus
+
+logger = logging.getLogger(__name__)
+
+# resume token no longer in the oplog
+CHANGE_STREAM_HISTORY_LOST = 286
+
+# only the owner fields and what a dashboard row shows leave the server;
+# updateLookup would otherwise ship the whole visit on every check-in
+CHANGE_PIPELINE = [
+    {"$match": {"operationType": {"$in": ["insert", "update", "replace"]}}},
+    {"$project": {
+        "operationType": 1,
+        "clusterTime": 1,
+        "updateDescription.updatedFields": 1,
+        **{f"fullDocument.{field}": 1 for field in VISIT_OWNER_FIELDS.values()},
+        "fullDocument.visit_id": 1,
+        "fullDocument.main_status": 1,
+        "fullDocument.from_ts": 1,
+        "fullDocument.to_ts": 1,
+    }},
+]
+# updatedFields keys look like details.3.checkIn or details.3.vitals.sugar
+DETAIL_EVENTS = (("checkIn", "checkin"), ("checkOut", "checkout"), ("vitals", "vitals"), ("reason", "reason"))
+
+
+def to_delta(change):
+    visit = change.get("fullDocument")
+    if not visit:
+        return None
+    updated = (change.get("updateDescription") or {}).get("updatedFields") or {}
+    if change["operationType"] == "insert":
+        kind = "assigned"
+    elif visit.get("main_status") == VisitStatus.cancelledVisit.value and (
+        "main_status" in updated or change["operationType"] == "replace"
+    ):
+        kind = "cancelled"
+    else:
+        parts = {part for key in updated for part in key.split(".")}
+        kind = next((name for field, name in DETAIL_EVENTS if field in parts), "updated")
+    changes = {}
+    for key, value in updated.items():
+        if key.startswith("details.") and any(field in key.split(".") for field, _ in DETAIL_EVENTS):
+            # the detail index means nothing to the client, the field path does
+            changes[".".join(key.split(".")[2:])] = value
+    return {
+        "event": kind,
+        "visit_id": visit.get("visit_id"),
+        "main_status": visit.get("main_status"),
+        "from_ts": visit.get("from_ts"),
+        "to_ts": visit.get("to_ts"),
+        "changes": changes,
+        "at": change["clusterTime"].as_datetime() if change.get("clusterTime") else None,
+    }, {field: visit.get(field) for field in VISIT_OWNER_FIELDS.values()}
+
+
+class VisitEventHub:
+    # One change stream per tenant and process, fanned out to the SSE
+    # subscribers, so dashboards cost one getMore loop instead of one each.
+    # The last visit_events_buffer deltas are kept with their resume tokens
+    # so a reconnect with Last-Event-ID replays what it missed.
+    def __init__(self, tenant_id: str):
+        self.tenant_id = tenant_id
+        self._subscribers = {}
+        self._recent = deque(maxlen=get_settings().visit_events_buffer)
+        self._token = None
+        self._task = None
+
+    def subscribe(self, owner_field: str, user_id: str):
+        queue = asyncio.Queue(maxsize=get_settings().visit_events_queue)
+        self._subscribers[queue] = (owner_field, user_id)
+        VISIT_EVENT_SUBSCRIBERS.inc()
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._run())
+        return queue
+
+    def unsubscribe(self, queue):
+        if self._subscribers.pop(queue, None) is not None:
+            VISIT_EVENT_SUBSCRIBERS.dec()
+        if not self._subscribers and self._task:
+            # the token is kept, so the next subscriber resumes without a gap
+            self._task.cancel()
+            self._task = None
+
+    def replay(self, owner_field: str, user_id: str, last_event_id: str):
+        # None when the id is no longer buffered and the client has to refetch
+        for position, (token, _, _) in enumerate(self._recent):
+            if token == last_event_id:
+                return [
+                    (token, delta)
+                    for token, delta, owners in list(self._recent)[position + 1:]
+                    if owners.get(owner_field) == user_id
+                ]
+        return None
+
+    async def catch_up(self, owner_field: str, user_id: str, last_event_id: str):
+        # a short-lived stream of the user's own changes since last_event_id,
+        # read until it has caught up; None when Mongo can no longer resume
+        missed = []
+        pipeline = [CHANGE_PIPELINE[0], {"$match": {f"fullDocument.{owner_field}": user_id}}, *CHANGE_PIPELINE[1:]]
+        try:
+            async with Visit.get_motor_collection().watch(
+                pipeline,
+                full_document="updateLookup",
+                resume_after={"_data": last_event_id},
+                max_await_time_ms=200,
+            ) as stream:
+                while len(missed) < self._recent.maxlen:
+                    change = await stream.try_next()
+                    if change is None:
+                        return missed
+                    result = to_delta(change)
+                    if result:
+                        missed.append((change["_id"]["_data"], result[0]))
+        except PyMongoError:
+            logger.info("could not resume visit events from %s", last_event_id)
+        return None
+
+    def _publish(self, token, delta, owners):
+        self._recent.append((token, delta, owners))
+        for queue, (owner_field, user_id) in list(self._subscribers.items()):
+            if owners.get(owner_field) != user_id:
+                continue
+            try:
+                queue.put_nowait((token, delta))
+            except asyncio.QueueFull:
+                # a stalled client is cut off; what it had queued is dropped
+                # and comes back through replay when it reconnects
+                self.unsubscribe(queue)
+                while not queue.empty():
+                    queue.get_nowait()
+                queue.put_nowait(None)
+
+    async def _run(self):
+        current_tenant.set(self.tenant_id)
+        backoff = 1
+        while True:
+            try:
+                async with Visit.get_motor_collection().watch(
+                    CHANGE_PIPELINE,
+                    full_document="updateLookup",
+                    resume_after={"_data": self._token} if self._token else None,
+                    max_await_time_ms=1000,
+                ) as stream:
+                    backoff = 1
+                    async for change in stream:
+                        self._token = change["_id"]["_data"]
+                        result = to_delta(change)
+                        if result:
+                            self._publish(self._token, *result)
+            except asyncio.CancelledError:
+                raise
+            except OperationFailure as e:
+                if e.code == CHANGE_STREAM_HISTORY_LOST:
+                    logger.warning("visit change stream for %s fell off the oplog, restarting", self.tenant_id)
+                    self._token = None
+                    self._recent.clear()
+                else:
+                    logger.exception("visit change stream for %s failed", self.tenant_id)
+            except PyMongoError:
+                logger.exception("visit change stream for %s failed", self.tenant_id)
+            await asyncio.sleep(backoff)
+            backoff = min(backoff * 2, 30)
+
+
+_hubs = {}
+
+
+def visit_event_hub():
+    tenant_id = active_tenant()
+    hub = _hubs.get(tenant_id)
+    if hub is None:
+        hub = _hubs[tenant_id] = VisitEventHub(tenant_id)
+    return hub
+
+
+def stop_visit_event_hubs():
+    for hub in _hubs.values():
+        if hub._task:
+            hub._task.cancel()
+
+
+def _default(value):
+    if isinstance(value, datetime):
+        return value.isoformat()
+    return str(value)
+
+
+def _sse(token, delta):
+    return f"id: {token}\nevent: visit\ndata: {json.dumps(delta, default=_default)}\n\n"
+
+
+async def stream_visit_events(request, curr_user, last_event_id=None):
+    owner_field = VISIT_OWNER_FIELDS[curr_user["entity_type"]]
+    user_id = curr_user["user_id"]
+    hub = visit_event_hub()
+    queue = hub.subscribe(owner_field, user_id)
+    # no await between subscribing and replaying, so nothing published in
+    # between can be missed
+    missed = hub.replay(owner_field, user_id, last_event_id) if last_event_id else []
+    heartbeat = get_settings().visit_events_heartbeat_seconds
+    try:
+        # EventSource waits this long before reconnecting
+        yield "retry: 3000\n\n"
+        if missed is None:
+            # not buffered here, e.g. the reconnect landed on another worker
+            missed = await hub.catch_up(owner_field, user_id, last_event_id)
+        if missed is None:
+            # too old to resume; the dashboard reloads get-visits once
+            yield f"event: reset\ndata: {json.dumps({'reason': 'resume point expired'})}\n\n"
+        last_sent = last_event_id or ""
+        for token, delta in missed or []:
+            yield _sse(token, delta)
+            last_sent = token
+        while True:
+            try:
+                item = await asyncio.wait_for(queue.get(), timeout=heartbeat)
+            except asyncio.TimeoutError:
+                if await request.is_disconnected():
+                    return
+                # comment line, keeps proxies from closing an idle stream
+                yield ": keepalive\n\n"
+                continue
+            if item is None:
+                return
+            # resume tokens sort in oplog order; a catch-up may already
+            # have sent what was queued meanwhile
+            if item[0] <= last_sent:
+                continue
+            yield _sse(*item)
+    finally:
+        hub.unsubscribe(queue)
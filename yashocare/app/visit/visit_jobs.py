@@ -0,0 +1,95 @@
+import argparse
+import asyncio
+import logging
+from datetime import datetime
+
+import pytz
+from pymongo import UpdateOne
+
+from app.app_bundle.database.db_core import get_db_session_db, tenant_router
+from app.app_bundle.database.tenant import current_tenant, allowed_tenants
+from app.app_bundle.env_config_settings import get_settings
+from app.app_bundle.geo import geo_point
+from app.app_bundle.scheduler import run_locked, run_daily
+from app.visit.visit_model import Visit
+from app.visit.visit_service import create_missing_details_for_today
+
+logger = logging.getLogger(__name__)
+
+NIGHTLY_JOB = "visit_nightly_details"
+_scheduler_task = None
+
+
+async def run_nightly_job():
+    run_key = datetime.now(tz=pytz.UTC).date().isoformat()
+    results = {}
+    for tenant_id in sorted(allowed_tenants()):
+        await tenant_router.activate(tenant_id)
+        token = current_tenant.set(tenant_id)
+        try:
+            result = await run_locked(
+                Visit.get_motor_collection().database,
+                NIGHTLY_JOB,
+                run_key,
+                create_missing_details_for_today,
+            )
+        finally:
+            current_tenant.reset(token)
+        if result is None:
+            results[tenant_id] = {"skipped": True}
+            continue
+        logger.info(
+            "%s %s: added %s details, closed %s visits in %sms",
+            NIGHTLY_JOB, tenant_id, result["details_added"], result["visits_closed"], result["duration_ms"],
+        )
+        results[tenant_id] = result
+    return results
+
+
+def start_nightly_scheduler():
+    global _scheduler_task
+    _scheduler_task = asyncio.create_task(run_daily(get_settings().nightly_job_at, run_nightly_job))
+    return _scheduler_task
+
+
+async def backfill_geo_locations(batch_size: int = 1000):
+    # visits written before geo_location existed only carry the lat/lng strings
+    collection = Visit.get_motor_collection()
+    scanned, updated, batch = 0, 0, []
+    async for visit in collection.find(
+        {"geo_location": {"$exists": False}, "location.lat": {"$nin": ["", None]}},
+        {"_id": 1, "location": 1},
+    ):
+        scanned += 1
+        point = geo_point(visit["location"].get("lat"), visit["location"].get("lng"))
+        # unparsable coordinates get an explicit null so a rerun skips them
+        batch.append(UpdateOne({"_id": visit["_id"], "geo_location": {"$exists": False}}, {"$set": {"geo_location": point}}))
+        if len(batch) >= batch_size:
+            updated += (await collection.bulk_write(batch, ordered=False)).modified_count
+            batch = []
+    if batch:
+        updated += (await collection.bulk_write(batch, ordered=False)).modified_count
+    return {"scanned": scanned, "updated": updated}
+
+
+async def main(args):
+    await get_db_session_db()
+    if args.job == "backfill-geo":
+        for tenant_id in sorted(allowed_tenants()):
+            await tenant_router.activate(tenant_id)
+            token = current_tenant.set(tenant_id)
+            try:
+                result = await backfill_geo_locations()
+                logger.info("backfill-geo %s: scanned %s, updated %s", tenant_id, result["scanned"], result["updated"])
+            finally:
+                current_tenant.reset(token)
+        return
+    # run_nightly_job and run_locked log each tenant's outcome
+    await run_nightly_job()
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    parser = argparse.ArgumentParser()
+    parser.add_argument("job", nargs="?", choices=["nightly", "backfill-geo"], default="nightly")
+    asyncio.run(main(parser.parse_args()))
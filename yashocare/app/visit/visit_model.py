@@ -1,12 +1,15 @@
 import enum
 from datetime import datetime
-from typing import Optional, List
+from typing import Optional, List, Literal
 import pytz
 
+from beanie import Indexed
 from pydantic import BaseModel, Field
+from pymongo import ASCENDING, GEOSPHERE, IndexModel
 
-from app.app_bundle.database.base import MongoDocument
+from app.app_bundle.database.base import MongoDocument, collection_name, from_settings
 from app.app_bundle.env_config_settings import get_settings
+from app.user.user_enum import UserEntity
 
 
 
@@ -20,6 +23,10 @@ class Location(BaseModel):
     lng:Optional[str] = ""
     lat:Optional[str] = ""
 
+class GeoPoint(BaseModel):
+    type:Literal["Point"]="Point"
+    coordinates:List[float]
+
 class VisitStatus(enum.Enum):
     initiated="INITIATED"
     checkedIn="CHECKEDIN"
@@ -27,11 +34,19 @@ class VisitStatus(enum.Enum):
     vitalUpdate="VITALUPDATE"
     cancelledVisit="CANCELLEDVISIT"
 
+# the Visit field that ties a visit to a user of each entity type
+VISIT_OWNER_FIELDS = {
+    UserEntity.admin.value: "assigned_admin_id",
+    UserEntity.client.value: "assigned_client_id",
+    UserEntity.employee.value: "assigned_emp_id",
+}
+
 class CheckInOut(BaseModel):
     at:Optional[datetime]=None
     lat:Optional[str]=None
     lng:Optional[str]=None
     img:Optional[str]=None
+    geo:Optional[GeoPoint]=None
 
 class Details(BaseModel):
     checkIn:Optional[CheckInOut]={}
@@ -47,12 +62,114 @@ class Visit(MongoDocument):
     assigned_pract_id:Optional[str]=None
     assigned_emp_id:Optional[str]=None
     location: Optional[Location]={}
+    geo_location: Optional[GeoPoint]=None
     main_status: VisitStatus = VisitStatus.initiated
     details:Optional[List[Details]]=[]
     from_ts:Optional[datetime]=None
     to_ts:Optional[datetime]=None
+    visit_id:Indexed(str, unique=True)
+
+    class Settings:
+        name = collection_name("visit")
+        indexes = [
+            # overlap checks in assign/extend, attendance and get-visits
+            IndexModel(
+                [("assigned_emp_id", ASCENDING), ("from_ts", ASCENDING), ("to_ts", ASCENDING)],
+                name="emp_range",
+            ),
+            IndexModel(
+                [("assigned_client_id", ASCENDING), ("from_ts", ASCENDING), ("to_ts", ASCENDING)],
+                name="client_range",
+            ),
+            IndexModel(
+                [("assigned_admin_id", ASCENDING), ("from_ts", ASCENDING), ("to_ts", ASCENDING)],
+                name="admin_range",
+            ),
+            # nightly cron
+            IndexModel([("main_status", ASCENDING), ("to_ts", ASCENDING)], name="status_to_ts"),
+            # $geoNear for nearest employees; location keeps the submitted strings
+            IndexModel([("geo_location", GEOSPHERE)], name="geo_location_2dsphere"),
+        ]
+
+
+class SyncReceipt(MongoDocument):
+    # result of an offline sync event, returned again when the app retries
+    # the same idempotency key
+    emp_id:str
+    key:str
+    result:dict
+
+    class Settings:
+        name = collection_name("sync_receipt")
+        indexes = from_settings(lambda: [
+            IndexModel([("emp_id", ASCENDING), ("key", ASCENDING)], name="emp_key", unique=True),
+            IndexModel(
+                [("created_at", ASCENDING)],
+                name="created_at_ttl",
+                expireAfterSeconds=get_settings().sync_receipt_ttl_days * 86400,
+            ),
+        ])
+
+
+class VisitSummary(BaseModel):
+    id:str = Field(alias="_id")
     visit_id:str
+    assigned_client_id:str
+    assigned_admin_id:str
+    assigned_pract_id:Optional[str]=None
+    assigned_emp_id:Optional[str]=None
+    location: Optional[Location]={}
+    main_status: VisitStatus = VisitStatus.initiated
+    from_ts:Optional[datetime]=None
+    to_ts:Optional[datetime]=None
+    created_at:Optional[datetime]=None
+    updated_at:Optional[datetime]=None
+    is_active:bool=True
 
     class Settings:
-        name = f"{get_settings().service_name}_{get_settings().environment}_visit"
+        projection = {"details": 0}
 
+
+class VisitCheckpoint(BaseModel):
+    # what check-in/out reads: status, geofence and the day's detail
+    visit_id:str
+    location: Optional[Location]={}
+    geo_location: Optional[GeoPoint]=None
+    main_status: VisitStatus = VisitStatus.initiated
+    details:Optional[List[Details]]=[]
+    to_ts:Optional[datetime]=None
+
+
+class AttendanceDetail(BaseModel):
+    checkIn:Optional[CheckInOut]=None
+    checkOut:Optional[CheckInOut]=None
+    daily_status: VisitStatus = VisitStatus.initiated
+    for_date:datetime
+
+
+class AttendanceVisit(BaseModel):
+    assigned_emp_id:Optional[str]=None
+    from_ts:datetime
+    to_ts:datetime
+    details:Optional[List[AttendanceDetail]]=[]
+
+    class Settings:
+        projection = {
+            "assigned_emp_id": 1,
+            "from_ts": 1,
+            "to_ts": 1,
+            "details.for_date": 1,
+            "details.daily_status": 1,
+            "details.checkIn.at": 1,
+            "details.checkOut.at": 1,
+        }
+
+
+class ExportDetail(AttendanceDetail):
+    reason:Optional[str]=None
+
+
+class ExportVisit(AttendanceVisit):
+    visit_id:str
+    assigned_client_id:str
+    details:Optional[List[ExportDetail]]=[]
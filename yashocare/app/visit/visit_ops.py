@@ -0,0 +1,126 @@
+from datetime import date, datetime, timedelta
+
+import pytz
+from beanie.odm.utils.encoder import Encoder
+
+from app.app_bundle.geo import geo_point
+from app.visit.visit_model import Details, VisitCheckpoint, VisitStatus
+
+# Targeted (filter, update) pairs for the visit collection. Each one touches a
+# single entry of the details array through the positional operator and only
+# matches while that entry is in the expected daily_status, so a write that
+# lost a race matches nothing instead of overwriting the winner.
+
+OPEN_STATUSES = [VisitStatus.initiated.value, VisitStatus.checkedIn.value]
+
+
+def day_range(day: date):
+    start = datetime(day.year, day.month, day.day)
+    return {"$gte": start, "$lt": start + timedelta(days=1)}
+
+
+def details_match(day: date, statuses=None, **conditions):
+    match = {"for_date": day_range(day), **conditions}
+    if statuses:
+        match["daily_status"] = {"$in": [status.value for status in statuses]}
+    return {"details": {"$elemMatch": match}}
+
+
+def checkpoint_projection(day: date):
+    # VisitCheckpoint fields, with details cut down to the day's entry
+    return {
+        **dict.fromkeys(VisitCheckpoint.model_fields.keys() - {"details"}, 1),
+        "details": {"$elemMatch": {"for_date": day_range(day)}},
+    }
+
+
+def _now():
+    return datetime.now(tz=pytz.UTC)
+
+
+def check_in_op(visit_id: str, at: datetime, lat, lng, img):
+    return (
+        {
+            "visit_id": visit_id,
+            "main_status": {"$in": OPEN_STATUSES},
+            **details_match(at.date(), [VisitStatus.initiated]),
+        },
+        {"$set": {
+            "details.$.checkIn": {"at": at, "lat": lat, "lng": lng, "img": img, "geo": geo_point(lat, lng)},
+            "details.$.daily_status": VisitStatus.checkedIn.value,
+            "main_status": VisitStatus.checkedIn.value,
+            "updated_at": _now(),
+        }},
+    )
+
+
+def check_out_op(visit_id: str, at: datetime, lat, lng, img, last_day: bool):
+    update = {
+        "details.$.checkOut": {"at": at, "lat": lat, "lng": lng, "img": img, "geo": geo_point(lat, lng)},
+        "details.$.daily_status": VisitStatus.checkedOut.value,
+        "updated_at": _now(),
+    }
+    if last_day:
+        update["main_status"] = VisitStatus.checkedOut.value
+    return (
+        {
+            "visit_id": visit_id,
+            "main_status": VisitStatus.checkedIn.value,
+            **details_match(at.date(), [VisitStatus.vitalUpdate], **{"vitals.notes": {"$nin": ["", None]}}),
+        },
+        {"$set": update},
+    )
+
+
+def vitals_op(visit_id: str, day: date, bloodPressure, sugar, notes):
+    return (
+        {
+            "visit_id": visit_id,
+            "main_status": {"$ne": VisitStatus.cancelledVisit.value},
+            **details_match(day, [VisitStatus.checkedIn, VisitStatus.vitalUpdate]),
+        },
+        {"$set": {
+            "details.$.vitals.notes": notes,
+            "details.$.vitals.sugar": sugar,
+            "details.$.vitals.bloodPressure": bloodPressure,
+            "details.$.daily_status": VisitStatus.vitalUpdate.value,
+            "updated_at": _now(),
+        }},
+    )
+
+
+def reason_op(visit_id: str, emp_id: str, day: date, reason: str):
+    return (
+        {
+            "visit_id": visit_id,
+            "assigned_emp_id": emp_id,
+            "main_status": {"$ne": VisitStatus.cancelledVisit.value},
+            **details_match(day),
+        },
+        {"$set": {"details.$.reason": reason, "updated_at": _now()}},
+    )
+
+
+def emp_reason_op(emp_id: str, day: date, reason: str):
+    # update_reason names no visit, so whichever live visit of the employee
+    # has that day is the one updated
+    return (
+        {
+            "assigned_emp_id": emp_id,
+            "main_status": {"$ne": VisitStatus.cancelledVisit.value},
+            **details_match(day),
+        },
+        {"$set": {"details.$.reason": reason, "updated_at": _now()}},
+    )
+
+
+def new_day_detail(day: date):
+    return Encoder().encode(Details(daily_status=VisitStatus.initiated, for_date=day))
+
+
+def next_day_op(visit_id: str, day: date):
+    # no-op when the day already exists, whoever (checkout or cron) added it first
+    return (
+        {"visit_id": visit_id, "details": {"$not": {"$elemMatch": {"for_date": day_range(day)}}}},
+        {"$push": {"details": new_day_detail(day)}, "$set": {"updated_at": _now()}},
+    )
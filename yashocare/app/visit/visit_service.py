@@ -1,14 +1,39 @@
+import base64
+import json
+import time
 from datetime import datetime, timedelta
+from typing import Optional
 from uuid import uuid4
 
 import pytz
-from fastapi import UploadFile, File
+from fastapi import UploadFile
+from pymongo import DESCENDING
+from pymongo.errors import BulkWriteError
 
 from app.app_bundle.env_config_settings import get_settings
-from app.app_bundle.s3_utils import generate_pre_signed_urls, upload_to_s3
+from app.app_bundle.geo import distance_m, geo_point, to_coordinate
+from app.app_bundle.images import upload_image_async, schedule_normalize, thumbnail_key, with_thumbnails, discard_images
+from app.app_bundle.s3_utils import (
+    generate_pre_signed_get_urls,
+    new_upload_slot,
+    verify_uploaded_object,
+)
 from app.user.user_enum import UserEntity
+from app.user.user_model import Yasho_User
 from app.user.user_service import get_user, get_client, get_employee
-from app.visit.visit_model import Visit, VisitStatus, Details
+from app.visit.visit_availability import availability_index
+from app.visit.visit_model import VISIT_OWNER_FIELDS, Visit, VisitCheckpoint, VisitStatus, VisitSummary
+from app.visit.visit_ops import (
+    OPEN_STATUSES,
+    check_in_op,
+    checkpoint_projection,
+    check_out_op,
+    next_day_op,
+    vitals_op,
+    day_range,
+    new_day_detail,
+)
+from app.vitals.vitals_service import record_reading
 
 
 ist = pytz.timezone('Asia/Kolkata')
@@ -22,8 +47,13 @@ async def assign(admin_id:str,client_id:str,emp_id:str, from_ts:datetime,to_ts:d
         "lat":lat,
         "lng":lng
     }
-    visit = await Visit.find_one({"assigned_client_id":client_id,"from_ts": {"$lte": to_ts},"to_ts": {"$gte": from_ts},"main_status":{"$nin":[VisitStatus.cancelledVisit,VisitStatus.checkedOut]}})
-    emp_visit = await Visit.find_one({"assigned_emp_id":emp_id,"from_ts": {"$lte": to_ts},"to_ts": {"$gte": from_ts},"main_status":{"$nin":[VisitStatus.cancelledVisit,VisitStatus.checkedOut]}})
+    geo_location = geo_point(lat, lng)
+    # the availability index may lag other workers by a refresh interval in
+    # either direction, so the decision is one query covering both the client
+    # and the employee
+    overlapping = await Visit.find({"from_ts": {"$lte": to_ts},"to_ts": {"$gte": from_ts},"main_status":{"$nin":[VisitStatus.cancelledVisit,VisitStatus.checkedOut]},"$or":[{"assigned_client_id":client_id},{"assigned_emp_id":emp_id}]}).to_list()
+    visit = next((v for v in overlapping if v.assigned_client_id == client_id), None)
+    emp_visit = next((v for v in overlapping if v.assigned_emp_id == emp_id), None)
 
     if visit:
         return "Client Already assigned for the date",403
@@ -42,11 +72,13 @@ async def assign(admin_id:str,client_id:str,emp_id:str, from_ts:datetime,to_ts:d
         visit.main_status = VisitStatus.initiated
         visit.assigned_admin_id = admin_id
         visit.location = location
+        visit.geo_location = geo_location
         visit.details = details
         await visit.save()
     else :
-        visit = Visit(assigned_admin_id=admin_id,assigned_client_id=client_id,assigned_emp_id=emp_id,main_status=status,visit_id=visit_id, from_ts=from_ts.date(),to_ts=to_ts.date(),location=location,details=details)
+        visit = Visit(assigned_admin_id=admin_id,assigned_client_id=client_id,assigned_emp_id=emp_id,main_status=status,visit_id=visit_id, from_ts=from_ts.date(),to_ts=to_ts.date(),location=location,geo_location=geo_location,details=details)
         await visit.save()
+    availability_index().track(visit.visit_id, emp_id, from_ts, to_ts)
 
     return {
         "client_id":client.user_id,
@@ -58,124 +90,354 @@ async def assign(admin_id:str,client_id:str,emp_id:str, from_ts:datetime,to_ts:d
     }, 0
 
 
+def _overlaps(ranges, from_day, to_day):
+    return any(start <= to_day and end >= from_day for start, end in ranges)
+
+
+def _day_start(day):
+    return datetime(day.year, day.month, day.day)
+
+
+async def bulk_assign(admin_id:str, assignments:list):
+    # per-row results in request order: {"index", "status_code", "data"|"error"}
+    if len(assignments) > get_settings().bulk_assign_max_rows:
+        return f"At most {get_settings().bulk_assign_max_rows} assignments per request",403
+    today = datetime.now(tz=pytz.UTC).date()
+    results = [None] * len(assignments)
+    rows = []
+    for index, row in enumerate(assignments):
+        from_day, to_day = row["from_ts"].date(), row["to_ts"].date()
+        if from_day < today or to_day < today:
+            results[index] = {"index": index, "status_code": 401, "error": "Dates must not be in the past"}
+        elif from_day > to_day:
+            results[index] = {"index": index, "status_code": 403, "error": "from_ts must be before to_ts"}
+        else:
+            rows.append((index, row, from_day, to_day))
+    if not rows:
+        return results,0
+
+    client_ids = {row["client_id"] for _, row, _, _ in rows}
+    emp_ids = {row["emp_id"] for _, row, _, _ in rows}
+    users = {}
+    async for user in Yasho_User.get_motor_collection().find(
+        {"user_id": {"$in": list(client_ids | emp_ids)}},
+        {"_id": 0, "user_id": 1, "name": 1, "entity_type": 1},
+    ):
+        users[(user["user_id"], user["entity_type"])] = user["name"]
+
+    # every open visit of an involved client or employee inside the batch window
+    client_ranges, emp_ranges = {}, {}
+    async for visit in Visit.get_motor_collection().find(
+        {
+            "main_status": {"$nin": [VisitStatus.cancelledVisit.value, VisitStatus.checkedOut.value]},
+            "from_ts": {"$lte": _day_start(max(to_day for _, _, _, to_day in rows))},
+            "to_ts": {"$gte": _day_start(min(from_day for _, _, from_day, _ in rows))},
+            "$or": [{"assigned_client_id": {"$in": list(client_ids)}}, {"assigned_emp_id": {"$in": list(emp_ids)}}],
+        },
+        {"_id": 0, "assigned_client_id": 1, "assigned_emp_id": 1, "from_ts": 1, "to_ts": 1},
+    ):
+        if not visit.get("from_ts") or not visit.get("to_ts"):
+            # legacy visits without dates block nothing, as in assign
+            continue
+        span = (visit["from_ts"].date(), visit["to_ts"].date())
+        client_ranges.setdefault(visit.get("assigned_client_id"), []).append(span)
+        emp_ranges.setdefault(visit.get("assigned_emp_id"), []).append(span)
+
+    visits, accepted, visit_ids = [], [], set()
+    for index, row, from_day, to_day in rows:
+        client_id, emp_id = row["client_id"], row["emp_id"]
+        client_name = users.get((client_id, UserEntity.client.value))
+        emp_name = users.get((emp_id, UserEntity.employee.value))
+        error = None
+        if client_name is None:
+            error = (404, "Client not found")
+        elif emp_name is None:
+            error = (404, "Employee not found")
+        elif _overlaps(client_ranges.get(client_id, []), from_day, to_day):
+            error = (403, "Client Already assigned for the date")
+        elif _overlaps(emp_ranges.get(emp_id, []), from_day, to_day):
+            error = (403, "Employee Already assigned for the date")
+        if error:
+            results[index] = {"index": index, "status_code": error[0], "error": error[1]}
+            continue
+        # later rows conflict with earlier accepted rows of the same batch
+        client_ranges.setdefault(client_id, []).append((from_day, to_day))
+        emp_ranges.setdefault(emp_id, []).append((from_day, to_day))
+        visit_id = "V" + str(uuid4().int)[:6]
+        while visit_id in visit_ids:
+            visit_id = "V" + str(uuid4().int)[:6]
+        visit_ids.add(visit_id)
+        location = {"lat": row["lat"], "lng": row["lng"]}
+        visits.append(Visit(
+            assigned_admin_id=admin_id, assigned_client_id=client_id, assigned_emp_id=emp_id,
+            main_status=VisitStatus.initiated, visit_id=visit_id, from_ts=from_day, to_ts=to_day,
+            location=location, geo_location=geo_point(row["lat"], row["lng"]),
+            details=[{"daily_status": VisitStatus.initiated, "for_date": from_day}],
+        ))
+        accepted.append((index, {
+            "visit_id": visit_id,
+            "client_id": client_id,
+            "client_name": client_name,
+            "emp_id": emp_id,
+            "emp_name": emp_name,
+            "from_ts": from_day,
+            "to_ts": to_day,
+        }))
+
+    failed = set()
+    if visits:
+        try:
+            await Visit.insert_many(visits, ordered=False)
+        except BulkWriteError as e:
+            failed = {error["index"] for error in e.details.get("writeErrors", [])}
+    for position, (index, data) in enumerate(accepted):
+        if position in failed:
+            results[index] = {"index": index, "status_code": 500, "error": "Could not save visit, please retry"}
+            continue
+        visit = visits[position]
+        availability_index().track(visit.visit_id, visit.assigned_emp_id, visit.from_ts, visit.to_ts)
+        results[index] = {"index": index, "status_code": 0, "data": data}
+    return results,0
+
+
+def visit_upload_prefix(kind:str, visit_id:str, date:datetime):
+    return f"yashocare/{kind}/{visit_id}/{date.date()}/"
+
+
+async def verify_visit_upload(kind:str, visit_id:str, object_key:Optional[str], *dates:datetime):
+    # a slot issued just before midnight is confirmed after it, so each day
+    # also accepts keys from the day a slot still valid now was issued on
+    lifetime = timedelta(seconds=get_settings().upload_slot_expiration)
+    prefixes = list(dict.fromkeys(
+        visit_upload_prefix(kind, visit_id, day) for date in dates for day in (date, date - lifetime)
+    ))
+    prefix = next((p for p in prefixes if object_key and object_key.startswith(p)), prefixes[0])
+    return await verify_uploaded_object(object_key, prefix)
+
+
+async def create_upload_slot(emp_id:str, visit_id:str, kind:str, extension:str):
+    visit = await Visit.find_one({"visit_id":visit_id,"assigned_emp_id":emp_id,"main_status":{"$in":OPEN_STATUSES}})
+    if not visit:
+        return "No visit assigned for today",403
+    slot = new_upload_slot(visit_upload_prefix(kind, visit_id, datetime.now(tz=pytz.UTC)), extension)
+    if not slot:
+        return "Unsupported file type",403
+    return slot,0
+
+
+async def store_visit_image(kind:str, visit_id:str, date:datetime, img:Optional[UploadFile], object_key:Optional[str]):
+    if object_key:
+        error = await verify_visit_upload(kind, visit_id, object_key, date)
+        if error:
+            return None, error
+        schedule_normalize(object_key, get_settings().config_s3_bucket)
+        return object_key, None
+    if (img.size or 0) > get_settings().upload_max_bytes:
+        return None, "Uploaded file too large"
+    extension = img.filename.split(".")[-1]
+    object_name = await upload_image_async(img.file,visit_upload_prefix(kind, visit_id, date),extension,get_settings().config_s3_bucket)
+    if not object_name:
+        return None, "Error while uploading"
+    return object_name, None
+
+
+async def discard_lost_upload(object_name:str, object_key:Optional[str]):
+    # a write that lost the race leaves its image unreferenced; a presigned
+    # object_key may be the winner's own upload retried, so only what this
+    # request uploaded itself is removed
+    if not object_key:
+        await discard_images([object_name], get_settings().config_s3_bucket)
+
+
+def geofence_error(visit, lat, lng):
+    # same check the old server/middleware/getDistance.js did; visits
+    # assigned without usable coordinates are not fenced
+    radius = get_settings().geofence_radius_m
+    if not radius:
+        return None
+    if visit.geo_location:
+        site_lng, site_lat = visit.geo_location.coordinates
+    else:
+        site_lat, site_lng = to_coordinate(visit.location.lat if visit.location else None), to_coordinate(visit.location.lng if visit.location else None)
+        if site_lat is None or site_lng is None:
+            return None
+    point = geo_point(lat, lng)
+    if not point:
+        if get_settings().geofence_allow_missing_location and not lat and not lng:
+            return None
+        return "Invalid location"
+    distance = distance_m(point["coordinates"][1], point["coordinates"][0], site_lat, site_lng)
+    if distance > radius:
+        return f"You are {round(distance)}m from the visit location, allowed {radius}m"
+    return None
+
+
 async def check_in_out(
         visit_id:str,
         lat:str,
         lng:str,
-        img:UploadFile = File(...)
+        img:Optional[UploadFile] = None,
+        object_key:Optional[str] = None,
 ):
+    if not img and not object_key:
+        return "Provide an image or an uploaded object key",403
     date = datetime.now(tz=pytz.UTC)
     tomorrow = date+timedelta(days=1)
-    extension = img.filename.split(".")[-1]
-    name = str(uuid4().int)[:10]
-    imgname = name+"."+extension
-    visit = await Visit.find_one({"visit_id":visit_id})
+    collection = Visit.get_motor_collection()
+    visit = await collection.find_one({"visit_id":visit_id}, projection=checkpoint_projection(date.date()))
     if not visit:
         return "No visit assigned for today",0
+    visit = VisitCheckpoint.model_validate(visit)
+    if visit.main_status.value not in OPEN_STATUSES:
+        return "Already checkedOut",0
 
-    if visit.main_status.value == VisitStatus.initiated.value:
-        for i in visit.details:
-            if i.for_date.date() == date.date():
-                if i.daily_status.value == VisitStatus.initiated.value:
-                    check_in_object_name = upload_to_s3(img.file,f"yashocare/checkin/{visit_id}/{date.date()}/{imgname}",get_settings().config_s3_bucket,extension)
-                    if not check_in_object_name:
-                        return "Error while uploading",403
-                    i.checkIn.at = date
-                    i.checkIn.lat = lat
-                    i.checkIn.lng = lng
-                    i.checkIn.img = check_in_object_name
-                    i.daily_status = VisitStatus.checkedIn
-
-                visit.main_status = VisitStatus.checkedIn
-                await visit.save()
-    elif visit.main_status.value == VisitStatus.checkedIn.value :
-        for i in visit.details:
-            if i.for_date.date() == date.date():
-                if i.daily_status.value == VisitStatus.initiated.value:
-                    check_in_object_name = upload_to_s3(img.file,f"yashocare/checkin/{visit_id}/{date.date()}/{imgname}",get_settings().config_s3_bucket,extension)
-                    if not check_in_object_name:
-                        return "Error while uploading",403
-                    i.checkIn.at = date
-                    i.checkIn.lat = lat
-                    i.checkIn.lng = lng
-                    i.daily_status = VisitStatus.checkedIn
-                    i.checkIn.img = check_in_object_name
-
-                elif i.daily_status.value == VisitStatus.vitalUpdate.value:
-                    if i.for_date.date() == visit.to_ts.date():
-                        visit.main_status = VisitStatus.checkedOut
-                    if not i.vitals.notes:
-                        return "Provide vitals before checkout",0
-                    check_out_object_name = upload_to_s3(img.file,f"yashocare/checkout/{visit_id}/{date.date()}/{imgname}",get_settings().config_s3_bucket,extension)
-                    if not check_out_object_name:
-                        return "Error while uploading",403
-                    i.checkOut.at = date
-                    i.checkOut.lat = lat
-                    i.checkOut.lng = lng
-                    i.checkOut.img = check_out_object_name
-                    i.daily_status = VisitStatus.checkedOut
-                    if tomorrow.date() <= visit.to_ts.date():
-                        obj = Details(**{
-                            "daily_status": VisitStatus.initiated,
-                            "for_date": tomorrow.date()
-                        })
-                        visit.details.append(obj)
-                        break
-                else:
-                    return "Provide vitals before checkout",0
-        await visit.save()
+    detail = next((i for i in visit.details if i.for_date.date() == date.date()), None)
+    if not detail:
+        return "Success",0
+
+    if detail.daily_status.value == VisitStatus.initiated.value:
+        error = geofence_error(visit, lat, lng)
+        if error:
+            return error,403
+        check_in_object_name, error = await store_visit_image("checkin", visit_id, date, img, object_key)
+        if error:
+            return error,403
+        result = await collection.update_one(*check_in_op(visit_id, date, lat, lng, check_in_object_name))
+        if not result.matched_count:
+            await discard_lost_upload(check_in_object_name, object_key)
+            return "Already checkedIn",0
+    elif detail.daily_status.value == VisitStatus.vitalUpdate.value and visit.main_status.value == VisitStatus.checkedIn.value:
+        if not detail.vitals.notes:
+            return "Provide vitals before checkout",0
+        error = geofence_error(visit, lat, lng)
+        if error:
+            return error,403
+        check_out_object_name, error = await store_visit_image("checkout", visit_id, date, img, object_key)
+        if error:
+            return error,403
+        last_day = detail.for_date.date() == visit.to_ts.date()
+        result = await collection.update_one(*check_out_op(visit_id, date, lat, lng, check_out_object_name, last_day))
+        if not result.matched_count:
+            await discard_lost_upload(check_out_object_name, object_key)
+            return "Already checkedOut",0
+        if last_day:
+            availability_index().forget(visit_id)
+        if tomorrow.date() <= visit.to_ts.date():
+            await collection.update_one(*next_day_op(visit_id, tomorrow.date()))
     else:
-        return "Already checkedOut",0
+        return "Provide vitals before checkout",0
 
     return "Success",0
 
 
 async def update_vitals(visit_id,bloodPressure,sugar,notes):
-    visit = await Visit.find_one({"visit_id":visit_id,"main_status": {"$ne": VisitStatus.cancelledVisit.value}})
-    if not visit:
-        return "No visit assigned today",0
     if not notes:
         return "Provide notes",403
     today = datetime.now(tz=pytz.UTC)
-    for i in visit.details:
-        if i.for_date.date() == today.date():
-            i.vitals.notes=notes
-            i.vitals.sugar=sugar
-            i.vitals.bloodPressure=bloodPressure
-            i.daily_status = VisitStatus.vitalUpdate
-    await visit.save()
+    updated = await Visit.get_motor_collection().find_one_and_update(
+        *vitals_op(visit_id, today.date(), bloodPressure, sugar, notes),
+        projection={"assigned_client_id": 1, "assigned_emp_id": 1},
+    )
+    if not updated:
+        visit = await Visit.find_one({"visit_id":visit_id,"main_status": {"$ne": VisitStatus.cancelledVisit.value}})
+        if not visit:
+            return "No visit assigned today",0
+        return "Check in before updating vitals",403
+    await record_reading(updated["assigned_client_id"], visit_id, updated.get("assigned_emp_id"), today, bloodPressure, sugar)
     return "Vitals Updated Successfully", 0
 
-async def get_visits(curr_user):
-    if curr_user["entity_type"] == UserEntity.admin.value:
-        visits =await Visit.find({"assigned_admin_id":curr_user["user_id"],"main_status": {"$ne": VisitStatus.cancelledVisit.value}}).to_list()
-        if not visits:
-            return "No visits available",403
-        return visits,0
 
-    if curr_user["entity_type"] == UserEntity.client.value:
-        visits = await Visit.find({"assigned_client_id":curr_user["user_id"],"main_status": {"$ne": VisitStatus.cancelledVisit.value}}).to_list()
+def encode_visit_cursor(visit):
+    # legacy visits without from_ts encode as null
+    raw = json.dumps({"ts": visit.from_ts.isoformat() if visit.from_ts else None, "id": visit.id})
+    return base64.urlsafe_b64encode(raw.encode()).decode()
+
+
+def decode_visit_cursor(cursor:str):
+    try:
+        raw = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+        return datetime.fromisoformat(raw["ts"]) if raw["ts"] is not None else None, raw["id"]
+    except (ValueError, KeyError, TypeError):
+        return None
+
+
+def after_visit_cursor(last_ts, last_id):
+    # a descending sort puts null from_ts after every date, so those visits
+    # come last and page by _id alone
+    if last_ts is None:
+        return [{"from_ts": None, "_id": {"$lt": last_id}}]
+    return [
+        {"from_ts": {"$lt": last_ts}},
+        {"from_ts": last_ts, "_id": {"$lt": last_id}},
+        {"from_ts": None},
+    ]
+
+
+async def get_visits(
+        curr_user,
+        limit:Optional[int]=None,
+        cursor:Optional[str]=None,
+        summary:bool=False,
+        from_ts:Optional[datetime]=None,
+        to_ts:Optional[datetime]=None,
+        status:Optional[VisitStatus]=None,
+):
+    owner_field = VISIT_OWNER_FIELDS.get(curr_user["entity_type"])
+    if not owner_field:
+        return "Not Authorized",401
+    query = {
+        owner_field: curr_user["user_id"],
+        "main_status": status.value if status else {"$ne": VisitStatus.cancelledVisit.value},
+    }
+    if from_ts:
+        query["to_ts"] = {"$gte": from_ts}
+    if to_ts:
+        query["from_ts"] = {"$lte": to_ts}
+    projection = VisitSummary if summary else None
+
+    if limit is None:
+        visits = await Visit.find(query, projection_model=projection).to_list()
         if not visits:
+            if curr_user["entity_type"] == UserEntity.employee.value:
+                return "No visits assigned",403
             return "No visits available",403
         return visits,0
 
+    if cursor:
+        position = decode_visit_cursor(cursor)
+        if not position:
+            return "Invalid cursor",400
+        query = {"$and": [query, {"$or": after_visit_cursor(*position)}]}
+    visits = await Visit.find(query, projection_model=projection).sort(
+        [("from_ts", DESCENDING), ("_id", DESCENDING)]
+    ).limit(limit).to_list()
+    next_cursor = encode_visit_cursor(visits[-1]) if len(visits) == limit else None
+    return {"visits": visits, "next_cursor": next_cursor},0
 
-    if curr_user["entity_type"] == UserEntity.employee.value:
-        visits = await Visit.find({"assigned_emp_id":curr_user["user_id"],"main_status": {"$ne": VisitStatus.cancelledVisit.value}}).to_list()
-        if not visits:
-            return "No visits assigned",403
 
-        return visits,0
+async def get_visit_details(curr_user, visit_id:str):
+    owner_field = VISIT_OWNER_FIELDS.get(curr_user["entity_type"])
+    if not owner_field:
+        return "Not Authorized",401
+    visit = await Visit.find_one({"visit_id": visit_id, owner_field: curr_user["user_id"]})
+    if not visit:
+        return "No visit found",404
+    return visit,0
 
 
-async def get_image_urls(object_names):
-    response = []
-    for object_name in object_names:
-        get_url, put_url = generate_pre_signed_urls(get_settings().config_s3_bucket,object_name,"get")
-        obj ={
-            object_name:get_url
-        }
-        response.append(obj)
+async def get_image_urls(object_names, variant:str="original"):
+    # responses stay keyed by the stored name whichever variant is signed;
+    # images without a recorded thumbnail are signed as the original
+    thumbnails = await with_thumbnails(object_names) if variant == "thumb" else set()
+    keys = {name: thumbnail_key(name) if name in thumbnails else name for name in object_names}
+    urls = generate_pre_signed_get_urls(
+        get_settings().config_s3_bucket,
+        list(keys.values()),
+        get_settings().presigned_url_expiration,
+    )
+    if isinstance(urls, str):
+        return urls,403
+    response = [{object_name: urls[keys[object_name]]} for object_name in object_names]
     return response,0
 
 async def unassign(visit_id:str):
@@ -189,47 +451,95 @@ async def unassign(visit_id:str):
         visit.main_status = VisitStatus.checkedOut
 
     await visit.save()
+    availability_index().forget(visit_id)
     return "Unassigned successfully",0
 
 async def extend(visit_id:str,to_ts:datetime):
     visit = await Visit.find_one({"visit_id": visit_id,"main_status":{"$nin":[VisitStatus.cancelledVisit,VisitStatus.checkedOut]}})
+    if not visit:
+        return "Wrong visit to extend",403
     if visit.to_ts.date() >= to_ts.date():
         return "Extend date must be greater than assigned date",403
     emp_visit = await Visit.find_one({"assigned_emp_id":visit.assigned_emp_id,"from_ts": {"$lte": to_ts},"to_ts": {"$gt": visit.to_ts},"main_status":{"$nin":[VisitStatus.cancelledVisit,VisitStatus.checkedOut]}})
     if emp_visit :
         return "Employee Already assigned for the date",403
-    if not visit:
-        return "Wrong visit to extend",403
     visit.to_ts = to_ts.date()
     await visit.save()
+    availability_index().track(visit.visit_id, visit.assigned_emp_id, visit.from_ts, visit.to_ts)
     return "To date extended successfully", 0
 
 
+async def nearest_employee_distances(point, emp_ids):
+    # distance from point to the closest recent visit of each employee, from
+    # the geo_location 2dsphere index; employees with none nearby are left out
+    if not emp_ids:
+        return {}
+    since = datetime.now(tz=pytz.UTC) - timedelta(days=get_settings().nearest_lookback_days)
+    cursor = Visit.get_motor_collection().aggregate([
+        {"$geoNear": {
+            "near": point,
+            "key": "geo_location",
+            "distanceField": "distance_m",
+            "spherical": True,
+            "maxDistance": get_settings().nearest_max_distance_m,
+            "query": {
+                "assigned_emp_id": {"$in": emp_ids},
+                "main_status": {"$ne": VisitStatus.cancelledVisit.value},
+                "to_ts": {"$gte": since},
+            },
+        }},
+        # $geoNear output is nearest first, so $first is each employee's closest
+        {"$group": {"_id": "$assigned_emp_id", "distance_m": {"$first": "$distance_m"}}},
+    ])
+    return {row["_id"]: row["distance_m"] async for row in cursor}
+
+
+async def get_available_employees(from_ts:datetime, to_ts:datetime, client_id:Optional[str]=None, lat:Optional[float]=None, lng:Optional[float]=None, limit:Optional[int]=None):
+    if from_ts.date() > to_ts.date():
+        return "from_ts must be before to_ts",403
+    point = geo_point(lat, lng)
+    if client_id and not point:
+        last_visit = await Visit.find({"assigned_client_id":client_id}).sort([("from_ts", DESCENDING)]).limit(1).to_list()
+        if last_visit:
+            visit = last_visit[0]
+            point = visit.geo_location.model_dump() if visit.geo_location else geo_point(visit.location.lat, visit.location.lng) if visit.location else None
+    index = await availability_index().ensure_loaded()
+    free = index.free_employees(from_ts, to_ts)
+    # distance_m is always present, None when there is no point to measure from
+    distances = await nearest_employee_distances(point, [e["user_id"] for e in free]) if point else {}
+    for employee in free:
+        distance = distances.get(employee["user_id"])
+        employee["distance_m"] = round(distance) if distance is not None else None
+    if point:
+        free.sort(key=lambda e: (e["distance_m"] is None, e["distance_m"] or 0))
+    return free[:limit] if limit else free,0
+
+
 async def create_missing_details_for_today():
+    started = time.monotonic()
     now_ist = datetime.now(tz=pytz.UTC)+ timedelta(days=1)
     today = now_ist.date()
     tomorrow = today + timedelta(days=1)
-    yesterday = today - timedelta(days=1)
-
-    visits = await Visit.find({
-        "main_status": {"$in": [VisitStatus.checkedIn, VisitStatus.initiated]},
-        "to_ts": {"$gte": now_ist}
-    }).to_list()
-
-    for visit in visits:
-        if not any(d.for_date.date() == tomorrow for d in visit.details):
-            if visit.to_ts.date() >= tomorrow:
-                visit.details.append(Details(
-                    daily_status=VisitStatus.initiated,
-                    for_date=tomorrow
-                ))
-                await visit.save()
-
-    stale_visits = await Visit.find({
-        "main_status":{"$ne":VisitStatus.cancelledVisit},
-        "to_ts": yesterday
-    }).to_list()
-
-    for visit in stale_visits:
-        visit.main_status = VisitStatus.checkedOut
-        await visit.save()
+    collection = Visit.get_motor_collection()
+
+    added = await collection.update_many(
+        {
+            "main_status": {"$in": OPEN_STATUSES},
+            "to_ts": {"$gte": day_range(tomorrow)["$gte"]},
+            "details": {"$not": {"$elemMatch": {"for_date": day_range(tomorrow)}}},
+        },
+        {"$push": {"details": new_day_detail(tomorrow)}, "$set": {"updated_at": datetime.now(tz=pytz.UTC)}},
+    )
+    closed = await collection.update_many(
+        {
+            "main_status": {"$nin": [VisitStatus.cancelledVisit.value, VisitStatus.checkedOut.value]},
+            "to_ts": {"$lt": day_range(today)["$gte"]},
+        },
+        {"$set": {"main_status": VisitStatus.checkedOut.value, "updated_at": datetime.now(tz=pytz.UTC)}},
+    )
+    return {
+        "for_date": tomorrow,
+        "details_added": added.modified_count,
+        "visits_closed": closed.modified_count,
+        "duration_ms": round((time.monotonic() - started) * 1000, 1),
+    }
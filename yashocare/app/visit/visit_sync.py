@@ -0,0 +1,237 @@
+import asyncio
+from datetime import datetime, timedelta
+
+import pytz
+from pymongo import UpdateOne
+from pymongo.errors import BulkWriteError
+
+from app.app_bundle.env_config_settings import get_settings
+from app.app_bundle.images import schedule_normalize
+from app.visit.visit_availability import availability_index
+from app.visit.visit_model import SyncReceipt, Visit, VisitStatus
+from app.visit.visit_ops import (
+    OPEN_STATUSES,
+    check_in_op,
+    check_out_op,
+    next_day_op,
+    reason_op,
+    vitals_op,
+)
+from app.visit.visit_service import geofence_error, verify_visit_upload
+from app.vitals.vitals_service import build_reading, record_readings
+
+SYNC_EVENT_TYPES = ("checkin", "vitals", "checkout", "reason")
+IMAGE_EVENTS = {"checkin": "checkin", "checkout": "checkout"}
+# devices are never quite in step with the server
+CLOCK_SKEW = timedelta(minutes=5)
+
+
+def _event_time(at: datetime):
+    # Mongo keeps milliseconds; trimming here lets the write be compared
+    # with what is read back
+    at = at.astimezone(pytz.UTC) if at.tzinfo else pytz.UTC.localize(at)
+    return at.replace(microsecond=at.microsecond // 1000 * 1000)
+
+
+def _day_state(visit):
+    # the first detail per day is the one the positional $ updates hit
+    days = {}
+    for detail in visit.details or []:
+        days.setdefault(detail.for_date.date(), {
+            "status": detail.daily_status.value,
+            "notes": detail.vitals.notes if detail.vitals else "",
+        })
+    return {"main_status": visit.main_status.value, "days": days}
+
+
+async def _verify_image(kind, visit_id, at, now, object_key):
+    # the slot is requested once the app is back online, so the key may
+    # carry the upload day rather than the day of the event
+    if not object_key:
+        return "Provide an uploaded object key"
+    error = await verify_visit_upload(kind, visit_id, object_key, at, now)
+    if not error:
+        schedule_normalize(object_key, get_settings().config_s3_bucket)
+    return error
+
+
+def _plan(emp_id, event, at, visit, state, image_error):
+    # validates one event against the visit as the earlier events of the
+    # batch left it; returns (error, status_code) or the ops to run
+    kind = event["type"]
+    if not visit or state["main_status"] == VisitStatus.cancelledVisit.value:
+        return ("Visit not found", 404), None
+    day = at.date()
+    detail = state["days"].get(day)
+
+    if kind == "checkin":
+        if state["main_status"] not in OPEN_STATUSES:
+            return ("Already checkedOut", 0), None
+        if not detail:
+            return ("No visit scheduled for this day", 403), None
+        if detail["status"] != VisitStatus.initiated.value:
+            return ("Already checkedIn", 0), None
+        error = geofence_error(visit, event["lat"], event["lng"]) or image_error
+        if error:
+            return (error, 403), None
+        detail["status"] = VisitStatus.checkedIn.value
+        state["main_status"] = VisitStatus.checkedIn.value
+        return None, [check_in_op(visit.visit_id, at, event["lat"], event["lng"], event["object_key"])]
+
+    if kind == "vitals":
+        if not event["notes"]:
+            return ("Provide notes", 403), None
+        if not detail or detail["status"] not in (VisitStatus.checkedIn.value, VisitStatus.vitalUpdate.value):
+            return ("Check in before updating vitals", 403), None
+        detail["status"], detail["notes"] = VisitStatus.vitalUpdate.value, event["notes"]
+        return None, [vitals_op(visit.visit_id, day, event["bloodPressure"], event["sugar"], event["notes"])]
+
+    if kind == "checkout":
+        if state["main_status"] not in OPEN_STATUSES:
+            return ("Already checkedOut", 0), None
+        if not detail:
+            return ("No visit scheduled for this day", 403), None
+        if detail["status"] == VisitStatus.checkedOut.value:
+            return ("Already checkedOut", 0), None
+        if detail["status"] != VisitStatus.vitalUpdate.value or state["main_status"] != VisitStatus.checkedIn.value or not detail["notes"]:
+            return ("Provide vitals before checkout", 0), None
+        error = geofence_error(visit, event["lat"], event["lng"]) or image_error
+        if error:
+            return (error, 403), None
+        last_day = day == visit.to_ts.date()
+        detail["status"] = VisitStatus.checkedOut.value
+        ops = [check_out_op(visit.visit_id, at, event["lat"], event["lng"], event["object_key"], last_day)]
+        if last_day:
+            state["main_status"] = VisitStatus.checkedOut.value
+        elif day + timedelta(days=1) not in state["days"]:
+            state["days"][day + timedelta(days=1)] = {"status": VisitStatus.initiated.value, "notes": ""}
+            ops.append(next_day_op(visit.visit_id, day + timedelta(days=1)))
+        return None, ops
+
+    if not detail:
+        return ("Reason not updated", 402), None
+    return None, [reason_op(visit.visit_id, emp_id, day, event["reason"])]
+
+
+def _took_effect(event, at, visit):
+    # read-back check after a bulk write that matched fewer ops than planned
+    detail = next((d for d in visit.details or [] if d.for_date.date() == at.date()), None) if visit else None
+    if not detail:
+        return False
+    naive = at.replace(tzinfo=None)
+    if event["type"] == "checkin":
+        return bool(detail.checkIn and detail.checkIn.at and detail.checkIn.at.replace(tzinfo=None) == naive)
+    if event["type"] == "checkout":
+        return bool(detail.checkOut and detail.checkOut.at and detail.checkOut.at.replace(tzinfo=None) == naive)
+    if event["type"] == "vitals":
+        # an earlier vitals write already left notes, so only this event's own count
+        return bool(detail.vitals) and detail.vitals.notes == event["notes"]
+    return detail.reason == event["reason"]
+
+
+SUCCESS_MESSAGES = {
+    "checkin": "Success",
+    "checkout": "Success",
+    "vitals": "Vitals Updated Successfully",
+    "reason": "Reason updated",
+}
+
+
+async def sync_events(emp_id: str, events: list):
+    # per-event results in request order: {"index", "status_code", "data"|"error"}
+    if len(events) > get_settings().sync_max_events:
+        return f"At most {get_settings().sync_max_events} events per request",403
+    now = datetime.now(tz=pytz.UTC)
+    results = [None] * len(events)
+    receipts = {}
+    keys = [event["idempotency_key"] for event in events]
+    async for receipt in SyncReceipt.get_motor_collection().find(
+        {"emp_id": emp_id, "key": {"$in": keys}}, {"_id": 0, "key": 1, "result": 1}
+    ):
+        receipts[receipt["key"]] = receipt["result"]
+
+    pending, seen = [], set()
+    for index, event in enumerate(events):
+        key = event["idempotency_key"]
+        at = _event_time(event["at"])
+        if key in receipts:
+            results[index] = {"index": index, **receipts[key], "replayed": True}
+        elif not key or key in seen:
+            results[index] = {"index": index, "status_code": 409, "error": "Missing or repeated idempotency key"}
+        elif event["type"] not in SYNC_EVENT_TYPES:
+            results[index] = {"index": index, "status_code": 403, "error": "Unknown event type"}
+        elif at > now + CLOCK_SKEW:
+            results[index] = {"index": index, "status_code": 403, "error": "Event time is in the future"}
+        elif now - at > timedelta(hours=get_settings().sync_max_age_hours):
+            results[index] = {"index": index, "status_code": 403, "error": "Event is too old to sync"}
+        else:
+            pending.append((index, event, at))
+        seen.add(key)
+
+    visit_ids = list({event["visit_id"] for _, event, _ in pending})
+    visits = {
+        visit.visit_id: visit
+        for visit in await Visit.find({"visit_id": {"$in": visit_ids}, "assigned_emp_id": emp_id}).to_list()
+    }
+    states = {visit_id: _day_state(visit) for visit_id, visit in visits.items()}
+    # HEAD requests for every uploaded image at once, before any planning
+    image_events = [(index, event, at) for index, event, at in pending if event["type"] in IMAGE_EVENTS]
+    image_errors = dict(zip(
+        [index for index, _, _ in image_events],
+        await asyncio.gather(*[
+            _verify_image(IMAGE_EVENTS[event["type"]], event["visit_id"], at, now, event["object_key"])
+            for _, event, at in image_events
+        ]),
+    ))
+
+    ops, applied = [], []
+    for index, event, at in pending:
+        visit = visits.get(event["visit_id"])
+        error, planned = _plan(emp_id, event, at, visit, states.get(event["visit_id"]), image_errors.get(index))
+        if error:
+            results[index] = {"index": index, "status_code": error[1], "error": error[0]}
+            continue
+        ops.extend(UpdateOne(*op) for op in planned)
+        applied.append((index, event, at))
+
+    confirmed = applied
+    if ops:
+        # ordered, so each guarded filter sees the writes of the events before it
+        try:
+            result = await Visit.get_motor_collection().bulk_write(ops, ordered=True)
+            matched = result.matched_count
+        except BulkWriteError:
+            matched = -1
+        if matched != len(ops):
+            # something else wrote these visits meanwhile; keep what landed
+            fresh = {
+                visit.visit_id: visit
+                for visit in await Visit.find({"visit_id": {"$in": visit_ids}, "assigned_emp_id": emp_id}).to_list()
+            }
+            confirmed = [item for item in applied if _took_effect(item[1], item[2], fresh.get(item[1]["visit_id"]))]
+            for index, _, _ in applied:
+                results[index] = {"index": index, "status_code": 409, "error": "Visit changed during sync, please retry"}
+
+    readings = []
+    for index, event, at in confirmed:
+        visit = visits[event["visit_id"]]
+        results[index] = {"index": index, "status_code": 0, "data": SUCCESS_MESSAGES[event["type"]]}
+        if event["type"] == "vitals":
+            readings.append(build_reading(visit.assigned_client_id, visit.visit_id, emp_id, at, event["bloodPressure"], event["sugar"]))
+        if event["type"] == "checkout" and at.date() == visit.to_ts.date():
+            availability_index().forget(visit.visit_id)
+    await record_readings(readings)
+
+    # retries of a 409 must run again, everything else is final
+    new_receipts = [
+        SyncReceipt(emp_id=emp_id, key=events[result["index"]]["idempotency_key"], result={k: v for k, v in result.items() if k != "index"})
+        for result in results
+        if result["status_code"] != 409 and "replayed" not in result
+    ]
+    if new_receipts:
+        try:
+            await SyncReceipt.insert_many(new_receipts, ordered=False)
+        except BulkWriteError:
+            # a concurrent retry stored the same keys first
+            pass
+    return results,0
@@ -1,22 +1,31 @@
 from datetime import datetime
-from typing import List
+from typing import List, Optional, Literal
 
-from fastapi import APIRouter, Depends, UploadFile, File, Form
+from fastapi import APIRouter, Depends, UploadFile, File, Form, Query, Header, Request
+from fastapi.responses import StreamingResponse
 from pydantic import BaseModel
 
 from app.app_bundle.auth.authorized_req_user import CurrentUserInfo, get_current_user
+from app.app_bundle.responses import list_response
 from app.user.user_enum import UserEntity
+from app.visit.visit_model import VISIT_OWNER_FIELDS, VisitStatus
+from app.visit.visit_events import stream_visit_events
 # from app.user.user_service import generate_user_login, get_user, create_user, change_sub_merchant_password
 from app.visit.visit_service import (
     assign,
+    bulk_assign,
     check_in_out,
+    create_upload_slot,
     update_vitals,
     get_visits,
+    get_visit_details,
     get_image_urls,
     unassign,
     extend,
-    create_missing_details_for_today
+    get_available_employees,
 )
+from app.visit.visit_jobs import run_nightly_job
+from app.visit.visit_sync import sync_events
 
 visit_router = APIRouter()
 
@@ -28,10 +37,35 @@ class Assign(BaseModel):
     from_ts:datetime
     to_ts:datetime
 
+class BulkAssign(BaseModel):
+    assignments:List[Assign]
+
+class SyncEvent(BaseModel):
+    idempotency_key:str
+    type:Literal["checkin","vitals","checkout","reason"]
+    visit_id:str
+    at:datetime
+    lat:Optional[str]=None
+    lng:Optional[str]=None
+    object_key:Optional[str]=None
+    bloodPressure:str=""
+    sugar:str=""
+    notes:str=""
+    reason:Optional[str]=None
+
+class SyncBatch(BaseModel):
+    events:List[SyncEvent]
+
 class Unassign(BaseModel):
     visit_id:str
 
 
+class UploadSlot(BaseModel):
+    visit_id:str
+    kind:Literal["checkin","checkout"]
+    extension:str
+
+
 class Extend(BaseModel):
     visit_id:str
     to_ts:datetime
@@ -52,16 +86,60 @@ async def handler_assign(
 
 @visit_router.post("/checkInOut")
 async def handler_check_in_out(
-        lat : str =Form(...),lng : str=Form(...),visit_id:str=Form(...),img : UploadFile = File(...),
+        lat : str =Form(...),lng : str=Form(...),visit_id:str=Form(...),img : Optional[UploadFile] = File(None),
+        object_key : Optional[str] = Form(None),
         curr_user: CurrentUserInfo = Depends(get_current_user)
 ):
     if curr_user["entity_type"] != UserEntity.employee.value:
         return {"error":"Not Authorized","status_code":401}
-    response, status_code = await check_in_out(visit_id = visit_id,lat = lat,lng = lng, img = img)
+    response, status_code = await check_in_out(visit_id = visit_id,lat = lat,lng = lng, img = img, object_key = object_key)
     if status_code == 0:
         return {"status_code": status_code, "data": response}
     return {"status_code": status_code, "error": response}
 
+
+@visit_router.post("/assign/bulk")
+async def handler_bulk_assign(
+        bulk_req:BulkAssign,
+        curr_user: CurrentUserInfo = Depends(get_current_user)
+):
+    if curr_user["entity_type"] != UserEntity.admin.value:
+        return {"error":"Not Authorized","status_code":401}
+    assignments = [
+        {"client_id":a.clientId,"emp_id":a.empId,"from_ts":a.from_ts,"to_ts":a.to_ts,"lat":a.lat,"lng":a.lng}
+        for a in bulk_req.assignments
+    ]
+    response, status_code = await bulk_assign(admin_id=curr_user["user_id"],assignments=assignments)
+    if status_code == 0:
+        return list_response({"status_code": status_code, "data": response})
+    return {"status_code": status_code, "error": response}
+
+
+@visit_router.post("/upload-slot")
+async def handler_create_upload_slot(
+        slot_req: UploadSlot,
+        curr_user: CurrentUserInfo = Depends(get_current_user)
+):
+    if curr_user["entity_type"] != UserEntity.employee.value:
+        return {"error":"Not Authorized","status_code":401}
+    response, status_code = await create_upload_slot(emp_id=curr_user["user_id"],visit_id=slot_req.visit_id,kind=slot_req.kind,extension=slot_req.extension)
+    if status_code == 0:
+        return {"status_code": status_code, "data": response}
+    return {"status_code": status_code, "error": response}
+
+@visit_router.post("/sync")
+async def handler_sync(
+        sync_req:SyncBatch,
+        curr_user: CurrentUserInfo = Depends(get_current_user)
+):
+    # offline replay: events apply in order, images go up first through upload-slot
+    if curr_user["entity_type"] != UserEntity.employee.value:
+        return {"error":"Not Authorized","status_code":401}
+    response, status_code = await sync_events(emp_id=curr_user["user_id"],events=[e.model_dump() for e in sync_req.events])
+    if status_code == 0:
+        return list_response({"status_code": status_code, "data": response})
+    return {"status_code": status_code, "error": response}
+
 @visit_router.post("/update-vitals")
 async def handler_update_vitals(
         notes:str= Form(...),visit_id:str= Form(...),
@@ -82,9 +160,34 @@ async def handler_update_vitals(
 
 @visit_router.get("/get-visits")
 async def handler_get_visits(
+        limit: Optional[int] = Query(None, ge=1, le=500),
+        cursor: Optional[str] = None,
+        summary: bool = False,
+        from_ts: Optional[datetime] = None,
+        to_ts: Optional[datetime] = None,
+        status: Optional[VisitStatus] = None,
         curr_user: CurrentUserInfo = Depends(get_current_user)
 ):
-    response, status_code = await get_visits(curr_user)
+    response, status_code = await get_visits(
+        curr_user,
+        limit=limit,
+        cursor=cursor,
+        summary=summary,
+        from_ts=from_ts,
+        to_ts=to_ts,
+        status=status,
+    )
+    if status_code == 0:
+        return list_response({"status_code": status_code, "data": response})
+    return {"status_code": status_code, "error": response}
+
+
+@visit_router.get("/get-visit-details")
+async def handler_get_visit_details(
+        visit_id: str,
+        curr_user: CurrentUserInfo = Depends(get_current_user)
+):
+    response, status_code = await get_visit_details(curr_user, visit_id)
     if status_code == 0:
         return {"status_code": status_code, "data": response}
     return {"status_code": status_code, "error": response}
@@ -93,13 +196,14 @@ async def handler_get_visits(
 @visit_router.post("/get-image-url")
 async def handler_get_presigned_urls(
         object_names:List[str],
+        variant:Literal["original","thumb"] = "original",
         curr_user: CurrentUserInfo = Depends(get_current_user)
 ):
     if curr_user["entity_type"] == UserEntity.pract.value:
         return {"error":"Not Authorized","status_code":401}
-    response, status_code = await get_image_urls(object_names)
+    response, status_code = await get_image_urls(object_names, variant=variant)
     if status_code == 0:
-        return {"status_code": status_code, "data": response}
+        return list_response({"status_code": status_code, "data": response})
     return {"status_code": status_code, "error": response}
 
 @visit_router.post("/unassign")
@@ -128,7 +232,42 @@ async def handler_extend(
     return {"status_code": status_code, "error": response}
 
 
+@visit_router.get("/available-employees")
+async def handler_get_available_employees(
+        from_ts: datetime,
+        to_ts: datetime,
+        client_id: Optional[str] = None,
+        lat: Optional[float] = None,
+        lng: Optional[float] = None,
+        limit: Optional[int] = Query(None, ge=1, le=500),
+        curr_user: CurrentUserInfo = Depends(get_current_user),
+):
+    if curr_user["entity_type"] != UserEntity.admin.value:
+        return {"error":"Not Authorized","status_code":401}
+    response, status_code = await get_available_employees(from_ts=from_ts,to_ts=to_ts,client_id=client_id,lat=lat,lng=lng,limit=limit)
+    if status_code == 0:
+        return list_response({"status_code": status_code, "data": response})
+    return {"status_code": status_code, "error": response}
+
+
+@visit_router.get("/events")
+async def handler_visit_events(
+        request: Request,
+        last_event_id: Optional[str] = Header(None),
+        curr_user: CurrentUserInfo = Depends(get_current_user),
+):
+    # server-sent events: assigned/checkin/vitals/checkout/cancelled deltas
+    # for the caller's visits; reconnects send Last-Event-ID to resume
+    if curr_user["entity_type"] not in VISIT_OWNER_FIELDS:
+        return {"error":"Not Authorized","status_code":401}
+    return StreamingResponse(
+        stream_visit_events(request, curr_user, last_event_id),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
 @visit_router.post("/cron-job", tags=["Cron Tasks"])
 async def midnight_cron_task():
-    await create_missing_details_for_today()
-    return {"message": "Details created successfully"}
\ No newline at end of file
+    result = await run_nightly_job()
+    return {"message": "Details created successfully", "data": result}
\ No newline at end of file
@@ -0,0 +1,129 @@
+import argparse
+import asyncio
+import logging
+from datetime import datetime, timedelta
+
+from app.app_bundle.database.db_core import get_db_session_db
+from app.app_bundle.database.tenant import current_tenant
+from app.app_bundle.scheduler import job_progress, run_locked, save_job_progress
+from app.visit.visit_model import Visit
+from app.vitals.vitals_model import VitalReading
+from app.vitals.vitals_service import build_reading
+
+logger = logging.getLogger(__name__)
+
+BATCH = 1000
+BACKFILL_JOB = "vitals_backfill"
+# the backfill copies history once; a finished run is recorded under this key
+BACKFILL_RUN_KEY = "complete"
+
+
+def backfill_pipeline(cutoff:datetime, after_visit_id=None):
+    visit_match = {"details.vitals.notes": {"$nin": ["", None]}, "from_ts": {"$lt": cutoff}}
+    if after_visit_id:
+        visit_match["visit_id"] = {"$gt": after_visit_id}
+    return [
+        {"$match": visit_match},
+        # visit_id order is what a resumed run continues from
+        {"$sort": {"visit_id": 1}},
+        {"$unwind": "$details"},
+        {"$match": {"details.for_date": {"$lt": cutoff}, "details.vitals.notes": {"$nin": ["", None]}}},
+        {"$project": {
+            "_id": 0,
+            "visit_id": 1,
+            "assigned_client_id": 1,
+            "assigned_emp_id": 1,
+            "for_date": "$details.for_date",
+            "checkIn": "$details.checkIn.at",
+            "bloodPressure": "$details.vitals.bloodPressure",
+            "sugar": "$details.vitals.sugar",
+        }},
+    ]
+
+
+async def _without_written(batch):
+    # a run that stopped between an insert and its checkpoint already wrote
+    # part of the next batch; time-series collections keep no unique key, so
+    # those points are found by visit and time and left out
+    written = set()
+    async for reading in VitalReading.get_motor_collection().find(
+        {"source": "backfill", "visit_id": {"$in": list({reading.visit_id for reading in batch})}},
+        {"_id": 0, "visit_id": 1, "at": 1},
+    ):
+        written.add((reading["visit_id"], reading["at"].replace(tzinfo=None)))
+    return [reading for reading in batch if (reading.visit_id, reading.at.replace(tzinfo=None)) not in written]
+
+
+async def _copy_readings(database, cutoff:datetime):
+    progress = await job_progress(database, BACKFILL_JOB) or {}
+    if progress.get("cutoff") and progress["cutoff"] != cutoff:
+        # the readings already copied were cut off there; mixing cutoffs
+        # would leave a gap or copy days twice
+        cutoff = progress["cutoff"]
+        logger.info("resuming the vitals backfill with its original cutoff %s", cutoff.date())
+    after_visit_id = progress.get("after_visit_id")
+    if after_visit_id:
+        logger.info("resuming the vitals backfill after visit %s", after_visit_id)
+    cursor = Visit.get_motor_collection().aggregate(
+        backfill_pipeline(cutoff, after_visit_id), allowDiskUse=True, batchSize=BATCH
+    )
+    scanned, written, batch = 0, 0, []
+    resuming = bool(after_visit_id)
+
+    async def flush(last_visit_id):
+        nonlocal written, resuming
+        rows = await _without_written(batch) if resuming else batch
+        if rows:
+            await VitalReading.insert_many(rows)
+        written += len(rows)
+        resuming = False
+        await save_job_progress(database, BACKFILL_JOB, {"cutoff": cutoff, "after_visit_id": last_visit_id})
+
+    last_visit_id = None
+    async for row in cursor:
+        scanned += 1
+        # batches end on a visit boundary, so the checkpoint covers whole visits
+        if len(batch) >= BATCH and row["visit_id"] != last_visit_id:
+            await flush(last_visit_id)
+            batch = []
+        last_visit_id = row["visit_id"]
+        # the day's vitals carry no time of their own; check-in is the
+        # closest known moment, midday otherwise
+        at = row.get("checkIn") or row["for_date"] + timedelta(hours=12)
+        reading = build_reading(
+            row["assigned_client_id"], row["visit_id"], row.get("assigned_emp_id"), at,
+            row.get("bloodPressure"), row.get("sugar"), source="backfill",
+        )
+        if reading is not None:
+            batch.append(reading)
+    if last_visit_id:
+        await flush(last_visit_id)
+    return {"scanned": scanned, "written": written}
+
+
+async def backfill_readings(before:datetime):
+    # runs under the job lock: a finished backfill is never repeated, and
+    # an interrupted one resumes from its last checkpoint
+    database = Visit.get_motor_collection().database
+    cutoff = datetime(before.year, before.month, before.day)
+    return await run_locked(database, BACKFILL_JOB, BACKFILL_RUN_KEY, lambda: _copy_readings(database, cutoff))
+
+
+async def main(args):
+    await get_db_session_db(args.tenant) if args.tenant else await get_db_session_db()
+    if args.tenant:
+        current_tenant.set(args.tenant)
+    before = datetime.fromisoformat(args.before)
+    result = await backfill_readings(before)
+    if result is None:
+        logger.info("vitals backfill already completed or running elsewhere, nothing done")
+        return
+    logger.info("vitals backfill: scanned %s visit days, wrote %s readings", result["scanned"], result["written"])
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    parser = argparse.ArgumentParser(description="Copy vitals stored on visits into the readings collection")
+    parser.add_argument("--before", required=True, help="first day update_vitals recorded readings, YYYY-MM-DD")
+    parser.add_argument("--tenant")
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,44 @@
+from datetime import datetime
+from typing import Optional
+
+from beanie import TimeSeriesConfig, Granularity
+from pydantic import BaseModel
+from pymongo import ASCENDING, IndexModel
+
+from app.app_bundle.database.base import MongoDocument, collection_name
+
+
+class VitalReading(MongoDocument):
+    # one parsed update_vitals call; the visit detail keeps the raw strings
+    client_id:str
+    at:datetime
+    visit_id:str
+    emp_id:Optional[str]=None
+    systolic:Optional[float]=None
+    diastolic:Optional[float]=None
+    sugar:Optional[float]=None
+    source:str="visit"
+
+    class Settings:
+        name = collection_name("vital_reading")
+        # buckets are per client, a handful of readings a day
+        timeseries = TimeSeriesConfig(time_field="at", meta_field="client_id", granularity=Granularity.hours)
+        indexes = [
+            # what 6.3+ builds on its own for meta + time; declared so it is
+            # kept on older servers and not reported as undeclared
+            IndexModel([("client_id", ASCENDING), ("at", ASCENDING)], name="client_id_1_at_1"),
+        ]
+
+
+class VitalTrendPoint(BaseModel):
+    at:datetime
+    count:int
+    systolic_min:Optional[float]=None
+    systolic_max:Optional[float]=None
+    systolic_avg:Optional[float]=None
+    diastolic_min:Optional[float]=None
+    diastolic_max:Optional[float]=None
+    diastolic_avg:Optional[float]=None
+    sugar_min:Optional[float]=None
+    sugar_max:Optional[float]=None
+    sugar_avg:Optional[float]=None
@@ -0,0 +1,132 @@
+import logging
+import re
+from datetime import datetime
+from typing import Optional
+
+import pytz
+from pymongo.errors import PyMongoError
+
+from app.user.user_enum import UserEntity
+from app.visit.visit_model import VISIT_OWNER_FIELDS, Visit, VisitStatus
+from app.vitals.vitals_model import VitalReading, VitalTrendPoint
+
+logger = logging.getLogger(__name__)
+
+ist = pytz.timezone('Asia/Kolkata')
+
+# "120/80", "120 / 80 mmHg", "BP 130/85"
+BLOOD_PRESSURE = re.compile(r"(\d{2,3}(?:\.\d+)?)\s*/\s*(\d{2,3}(?:\.\d+)?)")
+# "110", "110 mg/dL", "fasting 95.5"
+NUMBER = re.compile(r"\d+(?:\.\d+)?")
+TREND_BUCKETS = ("raw", "day", "week")
+METRICS = ("systolic", "diastolic", "sugar")
+
+
+def parse_blood_pressure(value:Optional[str]):
+    match = BLOOD_PRESSURE.search(value or "")
+    if not match:
+        return None, None
+    return float(match.group(1)), float(match.group(2))
+
+
+def parse_sugar(value:Optional[str]):
+    match = NUMBER.search(value or "")
+    return float(match.group(0)) if match else None
+
+
+def build_reading(client_id:str, visit_id:str, emp_id:Optional[str], at:datetime, bloodPressure, sugar, source="visit"):
+    systolic, diastolic = parse_blood_pressure(bloodPressure)
+    sugar = parse_sugar(sugar)
+    if systolic is None and sugar is None:
+        return None
+    return VitalReading(
+        client_id=client_id,
+        at=at,
+        visit_id=visit_id,
+        emp_id=emp_id,
+        systolic=systolic,
+        diastolic=diastolic,
+        sugar=sugar,
+        source=source,
+    )
+
+
+async def record_reading(client_id:str, visit_id:str, emp_id:Optional[str], at:datetime, bloodPressure, sugar):
+    # the visit detail is the record of truth; a lost reading only leaves a
+    # gap in the trend, so it must not fail the vitals update
+    reading = build_reading(client_id, visit_id, emp_id, at, bloodPressure, sugar)
+    if reading is None:
+        return None
+    try:
+        await reading.insert()
+    except PyMongoError:
+        logger.exception("could not record vital reading for visit %s", visit_id)
+        return None
+    return reading
+
+
+async def record_readings(readings):
+    readings = [reading for reading in readings if reading is not None]
+    if not readings:
+        return
+    try:
+        await VitalReading.insert_many(readings)
+    except PyMongoError:
+        logger.exception("could not record %s vital readings", len(readings))
+
+
+async def can_read_vitals(curr_user, client_id:str):
+    if curr_user["entity_type"] == UserEntity.client.value:
+        return curr_user["user_id"] == client_id
+    owner_field = VISIT_OWNER_FIELDS.get(curr_user["entity_type"])
+    if not owner_field:
+        return False
+    visit = await Visit.get_motor_collection().find_one(
+        {
+            "assigned_client_id": client_id,
+            owner_field: curr_user["user_id"],
+            "main_status": {"$ne": VisitStatus.cancelledVisit.value},
+        },
+        {"_id": 1},
+    )
+    return visit is not None
+
+
+def trend_pipeline(client_id:str, start:datetime, end:datetime, bucket:str):
+    match = {"$match": {"client_id": client_id, "at": {"$gte": start, "$lte": end}}}
+    if bucket == "raw":
+        return [
+            match,
+            {"$sort": {"at": 1}},
+            {"$project": {"_id": 0, "at": 1, "visit_id": 1, **{metric: 1 for metric in METRICS}}},
+        ]
+    # days and weeks are cut in IST, the clinic's calendar
+    truncated = {"$dateTrunc": {"date": "$at", "unit": bucket, "timezone": ist.zone}}
+    if bucket == "week":
+        truncated["$dateTrunc"]["startOfWeek"] = "monday"
+    group = {"_id": truncated, "count": {"$sum": 1}}
+    for metric in METRICS:
+        group[f"{metric}_min"] = {"$min": f"${metric}"}
+        group[f"{metric}_max"] = {"$max": f"${metric}"}
+        group[f"{metric}_avg"] = {"$avg": f"${metric}"}
+    return [
+        match,
+        {"$group": group},
+        {"$sort": {"_id": 1}},
+        {"$set": {"at": "$_id"}},
+        {"$unset": "_id"},
+    ]
+
+
+async def get_vital_trend(curr_user, client_id:str, start:datetime, end:datetime, bucket:str="day"):
+    if bucket not in TREND_BUCKETS:
+        return "Unknown bucket",403
+    if end < start:
+        return "Invalid range",403
+    if not await can_read_vitals(curr_user, client_id):
+        return "Not Authorized",401
+    cursor = VitalReading.get_motor_collection().aggregate(trend_pipeline(client_id, start, end, bucket))
+    points = await cursor.to_list(length=None)
+    if bucket != "raw":
+        points = [VitalTrendPoint.model_validate(point) for point in points]
+    return {"client_id": client_id, "bucket": bucket, "points": points},0
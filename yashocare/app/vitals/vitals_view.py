@@ -0,0 +1,27 @@
+from datetime import datetime
+from typing import Literal
+
+from fastapi import APIRouter, Depends
+
+from app.app_bundle.auth.authorized_req_user import CurrentUserInfo, get_current_user
+from app.app_bundle.env_config_settings import get_settings
+from app.app_bundle.responses import list_response
+from app.vitals.vitals_service import get_vital_trend
+
+vitals_router = APIRouter()
+
+
+@vitals_router.get("/trend")
+async def handler_get_vital_trend(
+        client_id: str,
+        from_ts: datetime,
+        to_ts: datetime,
+        bucket: Literal["raw","day","week"] = "day",
+        curr_user: CurrentUserInfo = Depends(get_current_user),
+):
+    if (to_ts - from_ts).days > get_settings().vitals_trend_max_days:
+        return {"error":f"Range must be within {get_settings().vitals_trend_max_days} days","status_code":403}
+    response, status_code = await get_vital_trend(curr_user, client_id=client_id, start=from_ts, end=to_ts, bucket=bucket)
+    if status_code == 0:
+        return list_response({"status_code": status_code, "data": response})
+    return {"status_code": status_code, "error": response}
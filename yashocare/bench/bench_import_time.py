@@ -0,0 +1,75 @@
+# Cold-start budget: how long `import main` takes in a fresh interpreter.
+#
+#   cd yashocare && python -m bench.bench_import_time --budget-ms 1500
+#
+# tests/test_import_time.py runs the same probe under pytest, but compares
+# against the framework baseline below instead of this wall-clock budget.
+#
+# Each run is a new process, so nothing is warm except the OS page cache
+# and the .pyc files. Exits 1 when the median is over budget or when a
+# module that is supposed to load on first use was imported at startup.
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+for key, value in {
+    "MONGO_URI": "mongodb://localhost:27017",
+    "CONFIG_S3_BUCKET": "bench",
+    "AWS_TEMP_AC_KEY": "bench",
+    "AWS_TEMP_SC_KEY": "bench",
+    "ENVIRONMENT": "bench",
+    "SERVICE_NAME": "bench",
+    "JWT_SECRET": "bench",
+}.items():
+    os.environ.setdefault(key, value)
+
+# loaded on first S3 call, password check or token use, never at import
+LAZY_MODULES = ("boto3", "botocore", "bcrypt", "jwt", "PIL")
+
+# what any app on this stack imports before its own code runs
+BASELINE_MODULES = ("fastapi", "beanie", "motor.motor_asyncio", "pydantic_settings", "prometheus_client")
+
+PROBE = (
+    "import json, sys, time\n"
+    "started = time.perf_counter()\n"
+    "import {modules}\n"
+    "elapsed = (time.perf_counter() - started) * 1000\n"
+    "print(json.dumps({{'ms': elapsed, 'modules': sorted(sys.modules)}}))\n"
+)
+
+
+def probe(modules=("main",)):
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    output = subprocess.run(
+        [sys.executable, "-c", PROBE.format(modules=", ".join(modules))],
+        capture_output=True, text=True, check=True, cwd=root,
+    ).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def main(args):
+    # first run compiles .pyc files, it is not counted
+    probe()
+    runs = [probe() for _ in range(args.runs)]
+    timings = [run["ms"] for run in runs]
+    median = statistics.median(timings)
+    eager = sorted({m.split(".")[0] for m in runs[-1]["modules"]} & set(LAZY_MODULES))
+    print(f"import main: median {median:.0f} ms, min {min(timings):.0f} ms, max {max(timings):.0f} ms ({args.runs} runs)")
+    failed = False
+    if eager:
+        print(f"imported at startup but should load lazily: {', '.join(eager)}")
+        failed = True
+    if median > args.budget_ms:
+        print(f"over budget: {median:.0f} ms > {args.budget_ms} ms")
+        failed = True
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--budget-ms", type=int, default=1500)
+    main(parser.parse_args())
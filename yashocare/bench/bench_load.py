@@ -0,0 +1,303 @@
+# Load scenarios against the app in-process, with results kept for comparison.
+#
+#   cd yashocare && python -m bench.bench_load --seed --drop
+#   cd yashocare && python -m bench.bench_load --compare bench/results/baseline.json
+#   cd yashocare && python -m bench.bench_load --stand-ins --employees 200 --visits-per-employee 5
+#
+# Requests go through httpx's ASGI transport into main.app, so routing,
+# auth, validation and serialization are measured but no socket is. Mongo
+# and S3 come from the settings (MONGO_URI, S3_ENDPOINT_URL, e.g. a local
+# mongod and MinIO); --stand-ins swaps in mongomock-motor and moto instead,
+# which is fine for smoke runs but says little about real latencies.
+# Needs bench/req.txt on top of req.txt (httpx; mongomock-motor and moto
+# only for --stand-ins).
+#
+# Scenarios:
+#   checkin_burst     every seeded employee checks in to today's visit at once
+#   admin_get_visits  admins page through get-visits, 100 summaries a page
+#   month_attendance  month attendance for random employees
+#   nightly_job       create_missing_details_for_today over the whole tenant
+#
+# Each run is written to bench/results/<timestamp>.json. With --compare the
+# run is checked against an earlier file and exits 1 when any scenario's p95
+# got worse by more than --threshold.
+import argparse
+import asyncio
+import io
+import json
+import os
+import platform
+import random
+import statistics
+import subprocess
+import sys
+import time
+from datetime import datetime, timedelta
+
+for key, value in {
+    "MONGO_URI": "mongodb://localhost:27017",
+    "CONFIG_S3_BUCKET": "bench",
+    "AWS_TEMP_AC_KEY": "bench",
+    "AWS_TEMP_SC_KEY": "bench",
+    "ENVIRONMENT": "bench",
+    "SERVICE_NAME": "bench",
+    "JWT_SECRET": "bench",
+    "MONGO_EXPLAIN_QUERY_SHAPES": "false",
+}.items():
+    os.environ.setdefault(key, value)
+
+RESULTS_DIR = os.path.join(os.path.dirname(__file__), "results")
+SCENARIOS = ("checkin_burst", "admin_get_visits", "month_attendance", "nightly_job")
+
+
+def percentile(values, pct):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * pct / 100))]
+
+
+def summarize(latencies, errors, elapsed):
+    if not latencies:
+        return {"requests": 0, "errors": errors}
+    return {
+        "requests": len(latencies),
+        "errors": errors,
+        "seconds": round(elapsed, 3),
+        "throughput_rps": round(len(latencies) / elapsed, 1),
+        "p50_ms": round(statistics.median(latencies), 2),
+        "p95_ms": round(percentile(latencies, 95), 2),
+        "p99_ms": round(percentile(latencies, 99), 2),
+        "max_ms": round(max(latencies), 2),
+    }
+
+
+async def drive(calls, concurrency):
+    # calls are zero-argument coroutine factories returning an httpx
+    # response; a non-zero status_code in the body counts as an error too
+    latencies, errors = [], 0
+    slots = asyncio.Semaphore(concurrency)
+
+    async def one(call):
+        nonlocal errors
+        async with slots:
+            started = time.perf_counter()
+            try:
+                response = await call()
+            except Exception:
+                errors += 1
+                return
+            latencies.append((time.perf_counter() - started) * 1000)
+            if response.status_code >= 400 or response.json().get("status_code", 0) != 0:
+                errors += 1
+
+    started = time.perf_counter()
+    await asyncio.gather(*[one(call) for call in calls])
+    return summarize(latencies, errors, time.perf_counter() - started)
+
+
+def token_for(user_id, entity):
+    from app.user.user_enum import UserEntity
+    from app.user.user_model import Yasho_User
+
+    return Yasho_User.model_construct(user_id=user_id).token(UserEntity(entity))
+
+
+def sample_jpeg():
+    try:
+        from PIL import Image
+    except ImportError:
+        return b"\xff\xd8\xff\xe0" + os.urandom(200_000)
+    buffer = io.BytesIO()
+    Image.effect_noise((1600, 1200), 40).convert("RGB").save(buffer, "JPEG", quality=90)
+    return buffer.getvalue()
+
+
+async def checkin_burst(client, args):
+    from bench.seed import employee_id, visit_location
+
+    image = sample_jpeg()
+    calls = []
+    for n in range(min(args.employees, args.requests)):
+        headers = {"Authorization": f"Bearer {token_for(employee_id(n), 'employee')}"}
+        # at the visit location, inside the check-in geofence
+        lat, lng = visit_location(n)
+        calls.append(lambda n=n, headers=headers, lat=lat, lng=lng: client.post(
+            "/api/v1/visit/checkInOut",
+            data={"lat": lat, "lng": lng, "visit_id": f"V{n:06d}000"},
+            files={"img": ("checkin.jpg", image, "image/jpeg")},
+            headers=headers,
+        ))
+    return await drive(calls, args.concurrency)
+
+
+async def admin_get_visits(client, args):
+    from bench.seed import ADMINS, admin_id
+
+    # pages depend on the previous cursor, so each admin walks sequentially
+    # and the admins run side by side; every page is one timed request
+    latencies, errors = [], 0
+
+    async def walk(admin):
+        nonlocal errors
+        headers = {"Authorization": f"Bearer {token_for(admin, 'admin')}"}
+        cursor = None
+        for _ in range(args.pages):
+            params = {"limit": 100, "summary": "true"}
+            if cursor:
+                params["cursor"] = cursor
+            started = time.perf_counter()
+            response = await client.get("/api/v1/visit/get-visits", params=params, headers=headers)
+            latencies.append((time.perf_counter() - started) * 1000)
+            body = response.json()
+            if response.status_code >= 400 or body.get("status_code", 0) != 0:
+                errors += 1
+                return
+            cursor = body["data"].get("next_cursor")
+            if not cursor:
+                return
+
+    started = time.perf_counter()
+    await asyncio.gather(*[walk(admin_id(n)) for n in range(ADMINS)])
+    return summarize(latencies, errors, time.perf_counter() - started)
+
+
+async def month_attendance(client, args):
+    from bench.seed import ADMINS, admin_id, employee_id
+
+    end = datetime.now()
+    start = end - timedelta(days=30)
+    rng = random.Random(args.random_seed)
+    calls = []
+    for i in range(args.requests):
+        headers = {"Authorization": f"Bearer {token_for(admin_id(i % ADMINS), 'admin')}"}
+        body = {"user_id": employee_id(rng.randrange(args.employees)), "from_ts": start.isoformat(), "to_ts": end.isoformat()}
+        calls.append(lambda body=body, headers=headers: client.post("/api/v1/user/attendance", json=body, headers=headers))
+    return await drive(calls, args.concurrency)
+
+
+async def nightly_job(client, args):
+    from app.visit.visit_service import create_missing_details_for_today
+
+    # sequential runs: the first one does the pushes, later ones only scan
+    latencies = []
+    started = time.perf_counter()
+    for _ in range(args.nightly_runs):
+        run_started = time.perf_counter()
+        await create_missing_details_for_today()
+        latencies.append((time.perf_counter() - run_started) * 1000)
+    return summarize(latencies, 0, time.perf_counter() - started)
+
+
+def git_revision():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True,
+            cwd=os.path.dirname(__file__),
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(current, baseline_path, threshold):
+    with open(baseline_path) as f:
+        baseline = json.load(f)
+    regressed = []
+    print(f"\ncompared with {baseline_path} ({baseline['meta'].get('git_revision')})")
+    for name, result in current["scenarios"].items():
+        before = baseline["scenarios"].get(name)
+        if not before or "p95_ms" not in before or "p95_ms" not in result:
+            continue
+        change = (result["p95_ms"] - before["p95_ms"]) / before["p95_ms"]
+        flag = "REGRESSED" if change > threshold else ""
+        print(f"{name:>18}: p95 {before['p95_ms']:.1f} -> {result['p95_ms']:.1f} ms ({change:+.0%}) {flag}")
+        if flag:
+            regressed.append(name)
+    return regressed
+
+
+async def run(args):
+    import httpx
+
+    import main
+    from app.app_bundle.database.db_core import get_db_session_db
+    from bench.seed import seed
+
+    await get_db_session_db()
+    if args.seed:
+        print("seeded", await seed(args.employees, args.visits_per_employee, args.days, args.drop))
+    results = {}
+    transport = httpx.ASGITransport(app=main.app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=120) as client:
+        for name in args.scenarios:
+            results[name] = await globals()[name](client, args)
+            print(f"{name:>18}: {results[name]}")
+    return results
+
+
+def start_stand_ins():
+    # in-process Mongo and S3; both stay up until the process exits
+    from moto import mock_aws
+    from mongomock_motor import AsyncMongoMockClient
+
+    from app.app_bundle.database import db_core
+    from app.app_bundle.env_config_settings import get_settings
+    from app.app_bundle.s3_utils import get_s3_client
+    from app.vitals.vitals_model import VitalReading
+
+    # mongomock has no time-series collections; none of the scenarios read
+    # vitals, so a plain collection stands in
+    VitalReading.Settings.timeseries = None
+    mock = mock_aws()
+    mock.start()
+    client = AsyncMongoMockClient()
+    db_core.get_mongo_client = lambda: client
+    get_s3_client().create_bucket(
+        Bucket=get_settings().config_s3_bucket,
+        CreateBucketConfiguration={"LocationConstraint": get_settings().s3_region},
+    )
+
+
+def main(args):
+    if args.stand_ins:
+        start_stand_ins()
+        args.seed = True
+    scenarios = asyncio.run(run(args))
+    from app.app_bundle.images import get_image_executor
+
+    get_image_executor().shutdown(wait=True)
+    current = {
+        "meta": {
+            "timestamp": datetime.now().isoformat(timespec="seconds"),
+            "git_revision": git_revision(),
+            "python": platform.python_version(),
+            "stand_ins": args.stand_ins,
+            "args": {k: v for k, v in vars(args).items() if k not in ("compare", "out")},
+        },
+        "scenarios": scenarios,
+    }
+    os.makedirs(args.out, exist_ok=True)
+    path = os.path.join(args.out, f"{datetime.now():%Y%m%d-%H%M%S}.json")
+    with open(path, "w") as f:
+        json.dump(current, f, indent=2)
+    print(f"results written to {path}")
+    if args.compare and compare(current, args.compare, args.threshold):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--scenarios", nargs="+", choices=SCENARIOS, default=list(SCENARIOS))
+    parser.add_argument("--seed", action="store_true", help="seed the bench tenant first")
+    parser.add_argument("--drop", action="store_true", help="empty the bench collections before seeding")
+    parser.add_argument("--stand-ins", action="store_true", help="use mongomock-motor and moto (implies --seed)")
+    parser.add_argument("--employees", type=int, default=2000)
+    parser.add_argument("--visits-per-employee", type=int, default=20)
+    parser.add_argument("--days", type=int, default=5)
+    parser.add_argument("--requests", type=int, default=2000)
+    parser.add_argument("--concurrency", type=int, default=100)
+    parser.add_argument("--pages", type=int, default=20)
+    parser.add_argument("--nightly-runs", type=int, default=3)
+    parser.add_argument("--random-seed", type=int, default=7)
+    parser.add_argument("--out", default=RESULTS_DIR)
+    parser.add_argument("--compare")
+    parser.add_argument("--threshold", type=float, default=0.2)
+    main(parser.parse_args())
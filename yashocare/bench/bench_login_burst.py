@@ -0,0 +1,82 @@
+# Latency of unrelated requests while a burst of logins verifies passwords.
+#
+#   cd yashocare && python -m bench.bench_login_burst --logins 200
+#
+# A probe coroutine stands in for every other endpoint on the worker: it
+# sleeps briefly and records how late the event loop wakes it up. "inline"
+# runs bcrypt on the loop like the old login path, "pooled" goes through
+# app.app_bundle.auth.passwords.
+import argparse
+import asyncio
+import os
+import statistics
+import time
+
+for key, value in {
+    "MONGO_URI": "mongodb://localhost:27017",
+    "CONFIG_S3_BUCKET": "bench",
+    "AWS_TEMP_AC_KEY": "bench",
+    "AWS_TEMP_SC_KEY": "bench",
+    "ENVIRONMENT": "bench",
+    "SERVICE_NAME": "bench",
+    "JWT_SECRET": "bench",
+}.items():
+    os.environ.setdefault(key, value)
+
+import bcrypt  # noqa: E402
+
+from app.app_bundle.auth import passwords  # noqa: E402
+from app.app_bundle.env_config_settings import get_settings  # noqa: E402
+
+
+def percentile(values, pct):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * pct / 100))]
+
+
+async def probe(lags, stop, interval):
+    while not stop.is_set():
+        start = time.perf_counter()
+        await asyncio.sleep(interval)
+        lags.append((time.perf_counter() - start - interval) * 1000)
+
+
+async def inline_login(password, hashed):
+    return bcrypt.checkpw(password.encode("utf-8"), hashed.encode())
+
+
+async def pooled_login(password, hashed):
+    try:
+        return await passwords.check_password_async(password, hashed)
+    except passwords.PasswordPoolBusy:
+        return None
+
+
+async def run(mode, login, logins, password, hashed, interval):
+    lags, stop = [], asyncio.Event()
+    probe_task = asyncio.create_task(probe(lags, stop, interval))
+    start = time.perf_counter()
+    results = await asyncio.gather(*[login(password, hashed) for _ in range(logins)])
+    elapsed = time.perf_counter() - start
+    stop.set()
+    await probe_task
+    rejected = sum(1 for r in results if r is None)
+    print(
+        f"{mode:>7}: {logins} logins in {elapsed:.2f}s ({rejected} rejected) | "
+        f"probe lag ms p50={statistics.median(lags):.1f} "
+        f"p99={percentile(lags, 99):.1f} max={max(lags):.1f} samples={len(lags)}"
+    )
+
+
+async def main(args):
+    password = "bench-password"
+    hashed = bcrypt.hashpw(password.encode(), bcrypt.gensalt(rounds=get_settings().bcrypt_rounds)).decode()
+    await run("inline", inline_login, args.logins, password, hashed, args.interval)
+    await run("pooled", pooled_login, args.logins, password, hashed, args.interval)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--logins", type=int, default=100)
+    parser.add_argument("--interval", type=float, default=0.005)
+    asyncio.run(main(parser.parse_args()))
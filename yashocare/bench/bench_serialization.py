@@ -0,0 +1,102 @@
+# Serialization cost of a get-visits sized payload, default vs fast path.
+#
+#   cd yashocare && python -m bench.bench_serialization --visits 1000 --days 7
+#
+# "default" is what FastAPI does with the dicts our views return:
+# jsonable_encoder followed by JSONResponse's json.dumps. "fast" is
+# app.app_bundle.responses.FastJSONResponse (FAST_JSON_RESPONSES=true).
+# Both bodies are decoded and compared before anything is timed.
+import argparse
+import json
+import os
+import statistics
+import time
+from datetime import datetime, timedelta
+
+for key, value in {
+    "MONGO_URI": "mongodb://localhost:27017",
+    "CONFIG_S3_BUCKET": "bench",
+    "AWS_TEMP_AC_KEY": "bench",
+    "AWS_TEMP_SC_KEY": "bench",
+    "ENVIRONMENT": "bench",
+    "SERVICE_NAME": "bench",
+    "JWT_SECRET": "bench",
+}.items():
+    os.environ.setdefault(key, value)
+
+from fastapi.encoders import jsonable_encoder  # noqa: E402
+from starlette.responses import JSONResponse  # noqa: E402
+
+from app.app_bundle.responses import FastJSONResponse  # noqa: E402
+from app.visit.visit_model import Details, Location, Visit, VisitStatus  # noqa: E402
+
+
+def make_visits(count, days):
+    start = datetime(2025, 1, 1, 9, 30)
+    visits = []
+    for n in range(count):
+        details = []
+        for d in range(days):
+            day = start + timedelta(days=d)
+            details.append({
+                "daily_status": VisitStatus.checkedOut,
+                "for_date": day.date(),
+                "checkIn": {"at": day, "lat": "12.9716", "lng": "77.5946", "img": f"yashocare/checkin/V{n}/{day.date()}/1234567890.jpg"},
+                "checkOut": {"at": day + timedelta(hours=8), "lat": "12.9716", "lng": "77.5946", "img": f"yashocare/checkout/V{n}/{day.date()}/1234567890.jpg"},
+                "vitals": {"bloodPressure": "120/80", "sugar": "110", "notes": "stable, had lunch, walked 20 minutes"},
+                "reason": "",
+            })
+        # Document.__init__ needs init_beanie, so the fields are validated on
+        # their own and the document is assembled with model_construct
+        visits.append(Visit.model_construct(
+            visit_id=f"V{n:06d}",
+            assigned_admin_id="A000001",
+            assigned_client_id=f"C{n % 300:06d}",
+            assigned_emp_id=f"E{n % 120:06d}",
+            main_status=VisitStatus.checkedIn,
+            from_ts=datetime.combine(start.date(), datetime.min.time()),
+            to_ts=datetime.combine((start + timedelta(days=days)).date(), datetime.min.time()),
+            location=Location(lat="12.9716", lng="77.5946"),
+            details=[Details.model_validate(detail) for detail in details],
+        ))
+    return visits
+
+
+def default_path(payload):
+    return JSONResponse(jsonable_encoder(payload)).body
+
+
+def fast_path(payload):
+    return FastJSONResponse(payload).body
+
+
+def timed(fn, payload, rounds):
+    samples = []
+    for _ in range(rounds):
+        start = time.perf_counter()
+        body = fn(payload)
+        samples.append((time.perf_counter() - start) * 1000)
+    return samples, len(body)
+
+
+def main(args):
+    payload = {"status_code": 0, "data": make_visits(args.visits, args.days)}
+    if json.loads(default_path(payload)) != json.loads(fast_path(payload)):
+        raise SystemExit("fast path output differs from the default path")
+    results = {}
+    for name, fn in (("default", default_path), ("fast", fast_path)):
+        samples, size = timed(fn, payload, args.rounds)
+        results[name] = statistics.median(samples)
+        print(
+            f"{name:>7}: median {results[name]:.1f} ms  min {min(samples):.1f} ms  "
+            f"body {size / 1024:.0f} KiB  ({args.visits} visits x {args.days} days, {args.rounds} rounds)"
+        )
+    print(f"speedup: {results['default'] / results['fast']:.1f}x")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--visits", type=int, default=1000)
+    parser.add_argument("--days", type=int, default=7)
+    parser.add_argument("--rounds", type=int, default=20)
+    main(parser.parse_args())
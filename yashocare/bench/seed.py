@@ -0,0 +1,182 @@
+# Seeds the bench tenant with employees, clients and visit history.
+#
+#   cd yashocare && python -m bench.seed --employees 2000 --visits-per-employee 20 --drop
+#
+# Every employee gets one client and visits_per_employee visits of `days`
+# days each: closed visits in the past with full daily details, plus one open
+# visit around today whose past days are checked out and whose today is
+# still initiated, which is what the morning check-in burst hits. Documents
+# are written with insert_many straight to the tenant collections, with the
+# same field layout Beanie writes.
+import argparse
+import asyncio
+import os
+import time
+from datetime import datetime, timedelta
+
+for key, value in {
+    "MONGO_URI": "mongodb://localhost:27017",
+    "CONFIG_S3_BUCKET": "bench",
+    "AWS_TEMP_AC_KEY": "bench",
+    "AWS_TEMP_SC_KEY": "bench",
+    "ENVIRONMENT": "bench",
+    "SERVICE_NAME": "bench",
+    "JWT_SECRET": "bench",
+}.items():
+    os.environ.setdefault(key, value)
+
+import pytz  # noqa: E402
+
+from app.app_bundle.auth.passwords import hash_password  # noqa: E402
+from app.app_bundle.geo import geo_point  # noqa: E402
+from app.user.user_enum import UserEntity  # noqa: E402
+from app.user.user_model import Yasho_User  # noqa: E402
+from app.visit.visit_model import Visit, VisitStatus  # noqa: E402
+
+BATCH = 1000
+PASSWORD = "bench-password"
+ADMINS = 5
+
+
+def employee_id(n):
+    return f"E{n:06d}"
+
+
+def client_id(n):
+    return f"C{n:06d}"
+
+
+def admin_id(n):
+    return f"A{n:06d}"
+
+
+def visit_location(n):
+    return f"{12.9 + (n % 100) / 1000:.4f}", f"{77.5 + (n % 97) / 1000:.4f}"
+
+
+def _midnight(day):
+    return datetime(day.year, day.month, day.day)
+
+
+def _user(user_id, entity_type, n, password, now, **extra):
+    return {
+        "_id": f"{user_id}-{n}",
+        "created_at": now,
+        "updated_at": now,
+        "is_active": True,
+        "name": f"{entity_type} {n}",
+        "mobile": f"{9000000000 + n if entity_type == 'employee' else 8000000000 + n}",
+        "password": password,
+        "email": f"{user_id.lower()}@bench.local",
+        "entity_type": entity_type,
+        "user_id": user_id,
+        **extra,
+    }
+
+
+def _check(at, visit_id, kind, lat, lng):
+    return {
+        "at": at, "lat": lat, "lng": lng, "img": f"yashocare/{kind}/{visit_id}/{at.date()}/0000000000.jpg",
+        "geo": geo_point(lat, lng),
+    }
+
+
+def _detail(day, visit_id, done, lat, lng):
+    if not done:
+        return {"checkIn": {}, "checkOut": {}, "daily_status": VisitStatus.initiated.value, "vitals": {}, "reason": None, "for_date": _midnight(day)}
+    check_in = _midnight(day) + timedelta(hours=8, minutes=30)
+    return {
+        "checkIn": _check(check_in, visit_id, "checkin", lat, lng),
+        "checkOut": _check(check_in + timedelta(hours=9), visit_id, "checkout", lat, lng),
+        "daily_status": VisitStatus.checkedOut.value,
+        "vitals": {"bloodPressure": "120/80", "sugar": "110", "notes": "stable", "prescription_images": []},
+        "reason": None,
+        "for_date": _midnight(day),
+    }
+
+
+def _visit(n, k, emp, client, from_day, to_day, today, now):
+    visit_id = f"V{n:06d}{k:03d}"
+    is_open = to_day >= today
+    days = [from_day + timedelta(days=d) for d in range((min(to_day, today) - from_day).days + 1)]
+    lat, lng = visit_location(n)
+    return {
+        "_id": visit_id,
+        "created_at": now,
+        "updated_at": now,
+        "is_active": True,
+        "assigned_client_id": client,
+        "assigned_admin_id": admin_id(n % ADMINS),
+        "assigned_pract_id": None,
+        "assigned_emp_id": emp,
+        "location": {"lat": lat, "lng": lng},
+        "geo_location": geo_point(lat, lng),
+        "main_status": (VisitStatus.checkedIn if is_open else VisitStatus.checkedOut).value,
+        "details": [_detail(day, visit_id, day < today, lat, lng) for day in days],
+        "from_ts": _midnight(from_day),
+        "to_ts": _midnight(to_day),
+        "visit_id": visit_id,
+    }
+
+
+def _visits_for(n, visits_per_employee, days, today, now):
+    emp, client = employee_id(n), client_id(n)
+    # the open visit started a couple of days ago; history goes back from it
+    open_from = today - timedelta(days=min(2, days - 1))
+    yield _visit(n, 0, emp, client, open_from, open_from + timedelta(days=days - 1), today, now)
+    for k in range(1, visits_per_employee):
+        to_day = open_from - timedelta(days=1 + (k - 1) * days)
+        yield _visit(n, k, emp, client, to_day - timedelta(days=days - 1), to_day, today, now)
+
+
+async def _insert(collection, documents):
+    batch = []
+    for document in documents:
+        batch.append(document)
+        if len(batch) >= BATCH:
+            await collection.insert_many(batch, ordered=False)
+            batch = []
+    if batch:
+        await collection.insert_many(batch, ordered=False)
+
+
+async def seed(employees, visits_per_employee, days, drop=False):
+    started = time.perf_counter()
+    users, visits = Yasho_User.get_motor_collection(), Visit.get_motor_collection()
+    if drop:
+        await users.delete_many({})
+        await visits.delete_many({})
+    now = datetime.now(tz=pytz.UTC)
+    today = now.date()
+    password = hash_password(PASSWORD).decode("utf-8")
+    employee_extra = {
+        "dob": "1990-01-01", "sex": "female", "address": "bench", "profie_photo": "yashocare/employee/profile/bench.jpg",
+        "id_proof": [], "guard_name": "guard", "guard_mobile": "7000000000",
+    }
+    await _insert(users, (_user(admin_id(n), UserEntity.admin.value, n, password, now) for n in range(ADMINS)))
+    await _insert(users, (_user(employee_id(n), UserEntity.employee.value, n, password, now, **employee_extra) for n in range(employees)))
+    await _insert(users, (_user(client_id(n), UserEntity.client.value, n, None, now, address="bench", id_proof=[]) for n in range(employees)))
+    await _insert(visits, (v for n in range(employees) for v in _visits_for(n, visits_per_employee, days, today, now)))
+    return {
+        "employees": employees,
+        "clients": employees,
+        "admins": ADMINS,
+        "visits": employees * visits_per_employee,
+        "seconds": round(time.perf_counter() - started, 1),
+    }
+
+
+async def main(args):
+    from app.app_bundle.database.db_core import get_db_session_db
+
+    await get_db_session_db()
+    print(await seed(args.employees, args.visits_per_employee, args.days, args.drop))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--employees", type=int, default=2000)
+    parser.add_argument("--visits-per-employee", type=int, default=20)
+    parser.add_argument("--days", type=int, default=5)
+    parser.add_argument("--drop", action="store_true")
+    asyncio.run(main(parser.parse_args()))
@@ -1,15 +1,33 @@
+import asyncio
+import logging
 import time
 import uvicorn
 from fastapi import FastAPI
 from starlette.middleware import Middleware
 from starlette.middleware.cors import CORSMiddleware
-from starlette.requests import Request
 from starlette.responses import Response, JSONResponse
 
-from app.app_bundle.database.db_core import get_db_session_db
+from app.app_bundle.auth.passwords import get_password_executor
+from app.app_bundle.correlation import CorrelationIdFilter, CorrelationIdMiddleware
+from app.app_bundle.database.db_core import TenantMiddleware, get_db_session_db
 from app.app_bundle.env_config_settings import get_settings
+from app.app_bundle.images import get_image_executor
+from app.app_bundle.metrics import MetricsMiddleware, metrics_payload, monitor_loop_lag
+from app.app_bundle.s3_utils import get_upload_executor
 from app.user.user_view import user_router
+from app.visit.visit_events import stop_visit_event_hubs
+from app.visit.visit_jobs import start_nightly_scheduler
 from app.visit.visit_view import visit_router
+from app.vitals.vitals_view import vitals_router
+
+logging.basicConfig(
+    level=logging.INFO,
+    format="%(asctime)s %(levelname)s [%(correlation_id)s] %(name)s: %(message)s",
+)
+for handler in logging.getLogger().handlers:
+    handler.addFilter(CorrelationIdFilter())
+
+_background_tasks = set()
 
 # app = FastAPI(title=get_settings().tenant_id.title())
 app = FastAPI(
@@ -20,19 +38,44 @@ app = FastAPI(
             allow_credentials=True,
             allow_methods=["*"],
             allow_headers=["*"],
-        )
+            expose_headers=["X-Request-ID"],
+        ),
+        Middleware(MetricsMiddleware),
+        Middleware(CorrelationIdMiddleware),
+        Middleware(TenantMiddleware),
     ],
     title=get_settings().tenant_id.title()
 )
-# app.add_middleware(CorrelationIdMiddleware)
+
+
+@app.get("/metrics", include_in_schema=False)
+async def metrics():
+    if not get_settings().metrics_enabled:
+        return JSONResponse({"status_code": 404, "error": "Not Found"}, status_code=404)
+    body, content_type = metrics_payload()
+    return Response(body, media_type=content_type)
 
 
 async def start_db():
     await get_db_session_db()
+    if get_settings().metrics_enabled:
+        task = asyncio.create_task(monitor_loop_lag(get_settings().loop_lag_interval, get_settings().loop_lag_window))
+        _background_tasks.add(task)
+    if get_settings().nightly_job_enabled:
+        _background_tasks.add(start_nightly_scheduler())
 
 
 async def shutdown_event():
     print("Shutting down API")
+    stop_visit_event_hubs()
+    # the scheduler and loop-lag monitor go before the executors they may use
+    for task in _background_tasks:
+        task.cancel()
+    await asyncio.gather(*_background_tasks, return_exceptions=True)
+    _background_tasks.clear()
+    get_upload_executor().shutdown(wait=True)
+    get_password_executor().shutdown(wait=True)
+    get_image_executor().shutdown(wait=True)
 
 # @app.middleware("http")
 # async def add_cors_headers(request: Request, call_next):
@@ -53,6 +96,7 @@ app.add_event_handler("shutdown", shutdown_event)
 
 app.include_router(user_router, prefix="/api/v1/user")
 app.include_router(visit_router, prefix="/api/v1/visit")
+app.include_router(vitals_router, prefix="/api/v1/vitals")
 
 
 if __name__ == "__main__":
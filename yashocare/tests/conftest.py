@@ -0,0 +1,31 @@
+import asyncio
+import os
+
+import pytest
+
+# the required settings, so app modules can be imported without a .env
+for key, value in {
+    "MONGO_URI": "mongodb://localhost:27017",
+    "CONFIG_S3_BUCKET": "test",
+    "AWS_TEMP_AC_KEY": "test",
+    "AWS_TEMP_SC_KEY": "test",
+    "ENVIRONMENT": "test",
+    "SERVICE_NAME": "test",
+    "JWT_SECRET": "test",
+}.items():
+    os.environ.setdefault(key, value)
+
+
+@pytest.fixture(scope="session")
+def beanie_db():
+    # Beanie documents can only be built once their model is initialised;
+    # mongomock stands in for the server
+    from beanie import init_beanie
+    from mongomock_motor import AsyncMongoMockClient
+
+    from app.user.user_model import Yasho_User
+    from app.visit.visit_model import SyncReceipt, Visit
+
+    database = AsyncMongoMockClient()["test"]
+    asyncio.run(init_beanie(database=database, document_models=[Yasho_User, Visit, SyncReceipt], skip_indexes=True))
+    return database
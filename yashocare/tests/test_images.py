@@ -0,0 +1,132 @@
+import asyncio
+import io
+import os
+from urllib.parse import urlparse
+
+import pytest
+from PIL import Image
+
+from app.app_bundle import images
+from app.app_bundle.env_config_settings import get_settings
+from app.app_bundle.images import normalize_upload, thumbnail_key, upload_image_async
+from app.visit.visit_service import get_image_urls
+
+BUCKET = "test"
+
+
+def photo(size=(1200, 800)):
+    buffer = io.BytesIO()
+    exif = Image.Exif()
+    exif[0x010F] = "phone maker"
+    Image.new("RGB", size, "red").save(buffer, "JPEG", exif=exif)
+    return buffer.getvalue()
+
+
+@pytest.fixture
+def s3(beanie_db, monkeypatch):
+    objects = {}
+
+    async def upload(content, object_name, bucket_name, extension):
+        objects[object_name] = content
+        return object_name
+
+    async def upload_fileobj(fileobj, object_name, bucket_name, extension):
+        return await upload(fileobj.read(), object_name, bucket_name, extension)
+
+    async def download(object_name, bucket_name):
+        return objects.get(object_name)
+
+    async def delete(object_names, bucket_name):
+        for name in object_names:
+            objects.pop(name, None)
+
+    monkeypatch.setattr(images, "upload_to_s3_async", upload)
+    monkeypatch.setattr(images, "upload_fileobj_to_s3_async", upload_fileobj)
+    monkeypatch.setattr(images, "download_from_s3_async", download)
+    monkeypatch.setattr(images, "delete_s3_objects_async", delete)
+    # Pillow in a thread here; the process pool is only for the GIL
+    monkeypatch.setattr(images, "get_image_executor", lambda: None)
+    asyncio.run(images.thumbnail_collection(beanie_db).delete_many({}))
+    return objects
+
+
+def signed(object_names):
+    response, status_code = asyncio.run(get_image_urls(object_names, variant="thumb"))
+    assert status_code == 0
+    # stored name -> key the URL was signed for
+    return {name: urlparse(url).path.lstrip("/") for row in response for name, url in row.items()}
+
+
+def test_presigned_upload_is_normalized_and_gets_a_thumbnail(s3):
+    s3["yashocare/checkin/V1/2026-03-10/1.png"] = photo()
+    asyncio.run(normalize_upload("yashocare/checkin/V1/2026-03-10/1.png", BUCKET))
+    with Image.open(io.BytesIO(s3["yashocare/checkin/V1/2026-03-10/1.png"])) as image:
+        assert image.format == "JPEG"
+        assert not image.getexif()
+    assert thumbnail_key("yashocare/checkin/V1/2026-03-10/1.png") in s3
+    assert signed(["yashocare/checkin/V1/2026-03-10/1.png"]) == {
+        "yashocare/checkin/V1/2026-03-10/1.png": "yashocare/checkin/V1/2026-03-10/thumb/1.jpg",
+    }
+
+
+def test_images_without_a_thumbnail_are_signed_as_the_original(s3):
+    # legacy image, and an upload Pillow cannot decode
+    s3["yashocare/checkin/V1/2026-03-10/2.heic"] = b"not an image"
+    asyncio.run(normalize_upload("yashocare/checkin/V1/2026-03-10/2.heic", BUCKET))
+    assert s3["yashocare/checkin/V1/2026-03-10/2.heic"] == b"not an image"
+    names = ["yashocare/checkin/V1/2026-03-01/legacy.jpg", "yashocare/checkin/V1/2026-03-10/2.heic"]
+    assert signed(names) == {name: name for name in names}
+
+
+def test_direct_upload_records_its_thumbnail(s3):
+    object_name = asyncio.run(upload_image_async(io.BytesIO(photo()), "yashocare/checkin/V1/2026-03-10/", "jpg", BUCKET))
+    assert signed([object_name]) == {object_name: thumbnail_key(object_name)}
+    asyncio.run(images.discard_images([object_name], BUCKET))
+    assert s3 == {}
+    assert signed([object_name]) == {object_name: object_name}
+
+
+def test_direct_upload_hands_the_worker_a_path(s3, monkeypatch):
+    seen = []
+    normalize = images.normalize_image_async
+
+    async def spy(source):
+        seen.append(source)
+        return await normalize(source)
+
+    monkeypatch.setattr(images, "normalize_image_async", spy)
+    object_name = asyncio.run(upload_image_async(io.BytesIO(photo()), "yashocare/checkin/V1/2026-03-10/", "jpg", BUCKET))
+    assert object_name in s3
+    path, = seen
+    assert isinstance(path, str)
+    # the spooled copy is gone once stored
+    assert not os.path.exists(path)
+
+
+class Stream(io.RawIOBase):
+    # a body that cannot tell its size up front
+    def __init__(self, size):
+        self.left = size
+
+    def readable(self):
+        return True
+
+    def read(self, size=-1):
+        size = self.left if size < 0 else min(size, self.left)
+        self.left -= size
+        return b"x" * size
+
+
+@pytest.mark.parametrize("body", [
+    lambda size: io.BytesIO(b"x" * size),
+    Stream,
+], ids=["sized", "unsized"])
+def test_oversized_uploads_are_refused(s3, monkeypatch, body):
+    monkeypatch.setenv("UPLOAD_MAX_BYTES", "1000")
+    get_settings.cache_clear()
+    try:
+        assert asyncio.run(upload_image_async(body(1001), "yashocare/checkin/V1/2026-03-10/", "jpg", BUCKET)) is None
+        assert asyncio.run(upload_image_async(body(1000), "yashocare/checkin/V1/2026-03-10/", "jpg", BUCKET))
+    finally:
+        get_settings.cache_clear()
+    assert len(s3) == 1
@@ -0,0 +1,27 @@
+import os
+import statistics
+
+from bench.bench_import_time import BASELINE_MODULES, LAZY_MODULES, probe
+
+# The hard wall-clock budget lives in `python -m bench.bench_import_time`;
+# here main is compared with the framework imports timed on the same runner,
+# so a slow or busy machine slows both sides.
+MAX_RATIO = float(os.environ.get("IMPORT_MAX_RATIO", "2.0"))
+
+
+def test_import_main_stays_close_to_the_framework_baseline():
+    # first runs compile .pyc files, they are not counted
+    probe()
+    probe(BASELINE_MODULES)
+    app, baseline = [], []
+    for _ in range(5):
+        # interleaved, so a burst of load hits both series
+        app.append(probe()["ms"])
+        baseline.append(probe(BASELINE_MODULES)["ms"])
+    ratio = statistics.median(app) / statistics.median(baseline)
+    assert ratio <= MAX_RATIO, f"import main took {app} ms against a baseline of {baseline} ms"
+
+
+def test_heavy_modules_load_on_first_use():
+    eager = sorted({m.split(".")[0] for m in probe()["modules"]} & set(LAZY_MODULES))
+    assert not eager, f"imported at startup: {', '.join(eager)}"
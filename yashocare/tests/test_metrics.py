@@ -0,0 +1,21 @@
+import boto3
+import pytest
+from botocore.config import Config
+from botocore.exceptions import EndpointConnectionError
+
+from app.app_bundle.metrics import S3_CALL_SECONDS, instrument_s3_client
+
+
+def test_failed_s3_calls_are_timed_and_keep_their_error():
+    client = instrument_s3_client(boto3.client(
+        "s3",
+        region_name="ap-south-1",
+        endpoint_url="http://127.0.0.1:9",
+        aws_access_key_id="test",
+        aws_secret_access_key="test",
+        config=Config(retries={"max_attempts": 1}, connect_timeout=1),
+    ))
+    before = S3_CALL_SECONDS.labels("HeadObject", "error")._sum.get()
+    with pytest.raises(EndpointConnectionError):
+        client.head_object(Bucket="test", Key="missing.jpg")
+    assert S3_CALL_SECONDS.labels("HeadObject", "error")._sum.get() > before
@@ -0,0 +1,72 @@
+import asyncio
+
+import pytest
+
+from app.app_bundle.env_config_settings import get_settings
+from app.user import user_cache
+from app.user.user_cache import get_profile_cache, get_user_status_cache, is_user_active
+from app.user.user_model import Client
+
+
+@pytest.fixture
+def users(beanie_db, monkeypatch):
+    async def clean():
+        await Client.get_motor_collection().delete_many({})
+        await user_cache.user_version_collection(beanie_db).delete_many({})
+
+    asyncio.run(clean())
+    get_profile_cache().clear()
+    get_user_status_cache().clear()
+    monkeypatch.setattr(user_cache, "_versions", {})
+    return beanie_db
+
+
+def elapse_version_check():
+    # as if user_version_check_seconds had passed on this worker
+    for tenant_id, (version, _) in list(user_cache._versions.items()):
+        user_cache._versions[tenant_id] = (version, -get_settings().user_version_check_seconds)
+
+
+def test_deactivation_on_another_worker_reaches_this_one(users):
+    client = Client(name="c", mobile="1", user_id="C1")
+    asyncio.run(client.save())
+    assert asyncio.run(is_user_active("C1"))
+
+    # another worker deactivates: the document and the version change, this
+    # worker's caches do not
+    async def elsewhere():
+        await Client.get_motor_collection().update_one({"user_id": "C1"}, {"$set": {"is_active": False}})
+        await user_cache.bump_user_version(users)
+
+    asyncio.run(elsewhere())
+    get_profile_cache().set(("yashocare", "C1"), {"name": "stale"})
+    assert asyncio.run(is_user_active("C1"))
+    elapse_version_check()
+    assert not asyncio.run(is_user_active("C1"))
+    assert get_profile_cache().get(("yashocare", "C1")) is None
+
+
+def test_status_is_not_reread_while_the_version_is_unchanged(users, monkeypatch):
+    asyncio.run(Client(name="c", mobile="1", user_id="C1").save())
+    assert asyncio.run(is_user_active("C1"))
+    elapse_version_check()
+    reads = []
+    find_one = type(Client.get_motor_collection()).find_one
+
+    async def counting(self, *args, **kwargs):
+        reads.append(self.name)
+        return await find_one(self, *args, **kwargs)
+
+    monkeypatch.setattr(type(Client.get_motor_collection()), "find_one", counting)
+    for _ in range(3):
+        assert asyncio.run(is_user_active("C1"))
+    # one version read, no user reads
+    assert reads == [user_cache.user_version_collection(users).name]
+
+
+def test_local_deactivation_is_immediate(users):
+    client = Client(name="c", mobile="1", user_id="C1")
+    asyncio.run(client.save())
+    assert asyncio.run(is_user_active("C1"))
+    asyncio.run(client.delete())
+    assert not asyncio.run(is_user_active("C1"))
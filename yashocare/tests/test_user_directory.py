@@ -0,0 +1,34 @@
+import asyncio
+
+import pytest
+
+from app.user.user_model import Client
+from app.user.user_view import handler_get_all_users
+
+ADMIN = {"user_id": "A1", "entity_type": "admin"}
+
+
+@pytest.fixture
+def clients(beanie_db):
+    async def seed():
+        await Client.get_motor_collection().delete_many({})
+        for n in range(3):
+            await Client(name=f"c{n}", mobile=str(n), user_id=f"C{n}").insert()
+
+    asyncio.run(seed())
+
+
+def get_all_users(**params):
+    params = {"limit": None, "cursor": None, "fields": None, "entity_type": None, "active": True, "format": "json", **params}
+    return asyncio.run(handler_get_all_users(curr_user=ADMIN, **params))
+
+
+def test_without_paging_every_user_is_returned(clients):
+    response = get_all_users()
+    assert [user["user_id"] for user in response["data"]] == ["C0", "C1", "C2"]
+
+
+def test_a_cursor_alone_keeps_paging(clients):
+    response = get_all_users(cursor="C0")
+    assert [user["user_id"] for user in response["data"]["users"]] == ["C1", "C2"]
+    assert response["data"]["next_cursor"] is None
@@ -0,0 +1,96 @@
+import asyncio
+from datetime import date
+from types import SimpleNamespace
+
+import pytest
+
+from app.visit import visit_availability
+from app.visit.visit_availability import AvailabilityIndex
+
+DAY = date(2026, 3, 10)
+
+
+class Cursor:
+    # yields its documents one per loop turn, pausing before the given
+    # one until the test lets it go on
+    def __init__(self, documents, pause_at=None, gate=None):
+        self.documents, self.pause_at, self.gate = documents, pause_at, gate
+
+    def sort(self, *args):
+        return self
+
+    async def __aiter__(self):
+        for n, document in enumerate(self.documents):
+            if n == self.pause_at:
+                self.gate["reading"].set()
+                await self.gate["go_on"].wait()
+            await asyncio.sleep(0)
+            yield document
+
+
+@pytest.fixture
+def database(monkeypatch):
+    state = {"employees": [{"user_id": "E1", "name": "e"}], "visits": [], "pause_at": None}
+
+    def collection(name):
+        def find(query, projection):
+            return Cursor(state[name], state["pause_at"] if name == "visits" else None, state.get("gate"))
+        return lambda: SimpleNamespace(find=find)
+
+    monkeypatch.setattr(visit_availability, "Yasho_User", SimpleNamespace(get_motor_collection=collection("employees")))
+    monkeypatch.setattr(visit_availability, "Visit", SimpleNamespace(get_motor_collection=collection("visits")))
+    return state
+
+
+def visit(visit_id, emp_id="E1", day=DAY):
+    return {"visit_id": visit_id, "assigned_emp_id": emp_id, "from_ts": day, "to_ts": day}
+
+
+def reload_while(index, database, writes):
+    # the visits are read around the writes: V1 before them, the rest after
+    async def run():
+        database["gate"] = {"reading": asyncio.Event(), "go_on": asyncio.Event()}
+        database["pause_at"] = 1
+        load = asyncio.create_task(index._load())
+        await database["gate"]["reading"].wait()
+        writes()
+        database["gate"]["go_on"].set()
+        await load
+
+    asyncio.run(run())
+
+
+def test_reload_keeps_serving_the_previous_maps(database):
+    database["visits"] = [visit("V1"), visit("V2", "E2")]
+    index = AvailabilityIndex()
+    asyncio.run(index._load())
+
+    def writes():
+        # mid-reload lookups see the last complete load, not a half-read one
+        assert not index.is_free("E2", DAY, DAY)
+        assert [e["user_id"] for e in index.free_employees(DAY, DAY)] == []
+
+    reload_while(index, database, writes)
+    assert not index.is_free("E2", DAY, DAY)
+
+
+def test_track_during_a_reload_is_not_doubled(database):
+    index = AvailabilityIndex()
+    asyncio.run(index._load())
+    # V2 is assigned (written to Mongo, then tracked) while the reload reads
+    database["visits"] = [visit("V1"), visit("V2")]
+    reload_while(index, database, lambda: index.track("V2", "E1", DAY, DAY))
+    assert index._intervals["E1"] == [(DAY, DAY, "V1"), (DAY, DAY, "V2")]
+    index.forget("V2")
+    index.forget("V1")
+    assert index.is_free("E1", DAY, DAY)
+
+
+def test_forget_during_a_reload_wins_over_the_read(database):
+    database["visits"] = [visit("V1"), visit("V2")]
+    index = AvailabilityIndex()
+    asyncio.run(index._load())
+    # V2 checked out and E1 deactivated on this worker while the reload reads
+    reload_while(index, database, lambda: (index.forget("V2"), index.forget_employee("E1")))
+    assert index._visits.keys() == {"V1"}
+    assert index._employees == {}
@@ -0,0 +1,40 @@
+import asyncio
+
+import orjson
+import pytest
+from fastapi.encoders import jsonable_encoder
+
+from app.app_bundle.responses import FastJSONResponse
+from app.visit.visit_model import Visit
+from app.visit.visit_service import get_visits
+
+from tests.test_visit_sync import make_visit
+
+EMPLOYEE = {"user_id": "E1", "entity_type": "employee"}
+
+
+@pytest.fixture
+def visits(beanie_db):
+    async def seed():
+        await Visit.get_motor_collection().delete_many({})
+        await make_visit("V1").insert()
+
+    asyncio.run(seed())
+
+
+def rows(summary, encode):
+    response, status_code = asyncio.run(get_visits(EMPLOYEE, limit=10, summary=summary))
+    assert status_code == 0
+    return encode({"data": response})["data"]["visits"]
+
+
+@pytest.mark.parametrize("encode", [
+    jsonable_encoder,
+    lambda payload: orjson.loads(FastJSONResponse(payload).body),
+], ids=["default", "fast_json"])
+def test_summary_rows_use_the_same_keys_as_full_visits(visits, encode):
+    full, = rows(False, encode)
+    summary, = rows(True, encode)
+    assert "_id" in summary and "id" not in summary
+    assert summary["_id"] == full["_id"]
+    assert set(summary) == set(full) - {"details", "geo_location", "revision_id"}
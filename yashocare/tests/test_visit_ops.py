@@ -0,0 +1,142 @@
+from datetime import date, datetime
+
+import mongomock
+import pytest
+
+from app.visit.visit_model import VisitCheckpoint, VisitStatus
+from app.visit.visit_ops import (
+    check_in_op,
+    check_out_op,
+    checkpoint_projection,
+    day_range,
+    emp_reason_op,
+    next_day_op,
+    reason_op,
+    vitals_op,
+)
+
+DAY = date(2026, 3, 10)
+AT = datetime(2026, 3, 10, 9, 30)
+
+
+def detail(day=DAY, status=VisitStatus.initiated, notes=""):
+    return {
+        "for_date": datetime(day.year, day.month, day.day),
+        "daily_status": status.value,
+        "vitals": {"notes": notes},
+    }
+
+
+def visit(visit_id="V1", main_status=VisitStatus.initiated, details=None, emp_id="E1"):
+    return {
+        "visit_id": visit_id,
+        "assigned_emp_id": emp_id,
+        "main_status": main_status.value,
+        "details": details if details is not None else [detail()],
+    }
+
+
+@pytest.fixture
+def visits():
+    return mongomock.MongoClient().db.visits
+
+
+def matches(collection, op):
+    # the filters are what keeps a stale write from landing, so they are
+    # checked against documents in each state the race can leave behind
+    return [doc["visit_id"] for doc in collection.find(op[0])]
+
+
+def test_day_range_covers_one_calendar_day():
+    assert day_range(DAY) == {"$gte": datetime(2026, 3, 10), "$lt": datetime(2026, 3, 11)}
+
+
+def test_check_in_only_matches_an_initiated_day(visits):
+    visits.insert_many([
+        visit("V1"),
+        visit("V2", VisitStatus.checkedIn, [detail(status=VisitStatus.checkedIn)]),
+        visit("V3", details=[detail(date(2026, 3, 9))]),
+    ])
+    assert matches(visits, check_in_op("V1", AT, "12.9", "77.5", "img")) == ["V1"]
+    # already checked in, or no detail for the day
+    assert matches(visits, check_in_op("V2", AT, "12.9", "77.5", "img")) == []
+    assert matches(visits, check_in_op("V3", AT, "12.9", "77.5", "img")) == []
+
+
+def test_check_in_sets_the_detail_and_the_visit_status():
+    update = check_in_op("V1", AT, "12.9", "77.5", "img")[1]["$set"]
+    assert update["details.$.daily_status"] == VisitStatus.checkedIn.value
+    assert update["main_status"] == VisitStatus.checkedIn.value
+    assert update["details.$.checkIn"]["geo"] == {"type": "Point", "coordinates": [77.5, 12.9]}
+
+
+def test_check_out_needs_vitals_with_notes(visits):
+    visits.insert_many([
+        visit("V1", VisitStatus.checkedIn, [detail(status=VisitStatus.vitalUpdate, notes="stable")]),
+        visit("V2", VisitStatus.checkedIn, [detail(status=VisitStatus.vitalUpdate)]),
+        visit("V3", VisitStatus.checkedIn, [detail(status=VisitStatus.checkedIn)]),
+        visit("V4", VisitStatus.checkedOut, [detail(status=VisitStatus.vitalUpdate, notes="stable")]),
+    ])
+    for visit_id in ("V1", "V2", "V3", "V4"):
+        expected = ["V1"] if visit_id == "V1" else []
+        assert matches(visits, check_out_op(visit_id, AT, "12.9", "77.5", "img", False)) == expected
+
+
+def test_check_out_closes_the_visit_only_on_its_last_day():
+    assert "main_status" not in check_out_op("V1", AT, "1", "2", "img", False)[1]["$set"]
+    assert check_out_op("V1", AT, "1", "2", "img", True)[1]["$set"]["main_status"] == VisitStatus.checkedOut.value
+
+
+def test_vitals_need_a_checked_in_day_on_a_live_visit(visits):
+    visits.insert_many([
+        visit("V1", VisitStatus.checkedIn, [detail(status=VisitStatus.checkedIn)]),
+        visit("V2", VisitStatus.checkedIn, [detail(status=VisitStatus.vitalUpdate, notes="old")]),
+        visit("V3", VisitStatus.cancelledVisit, [detail(status=VisitStatus.checkedIn)]),
+        visit("V4"),
+    ])
+    for visit_id in ("V1", "V2", "V3", "V4"):
+        expected = [visit_id] if visit_id in ("V1", "V2") else []
+        assert matches(visits, vitals_op(visit_id, DAY, "120/80", "100", "fine")) == expected
+
+
+def test_reason_is_pinned_to_its_visit(visits):
+    # two visits of the same employee on the same day
+    visits.insert_many([
+        visit("V1", VisitStatus.cancelledVisit),
+        visit("V2", VisitStatus.checkedIn),
+    ])
+    assert matches(visits, reason_op("V2", "E1", DAY, "late")) == ["V2"]
+    assert matches(visits, reason_op("V1", "E1", DAY, "late")) == []
+    assert matches(visits, reason_op("V2", "E2", DAY, "late")) == []
+
+
+def test_emp_reason_matches_live_visits_of_the_employee_and_day(visits):
+    visits.insert_many([
+        visit("V1", VisitStatus.cancelledVisit),
+        visit("V2", emp_id="E2"),
+        visit("V3"),
+    ])
+    assert matches(visits, emp_reason_op("E1", DAY, "late")) == ["V3"]
+    assert matches(visits, emp_reason_op("E1", date(2026, 3, 11), "late")) == []
+
+
+def test_next_day_is_added_once(visits):
+    visits.insert_one(visit("V1", VisitStatus.checkedIn))
+    op = next_day_op("V1", date(2026, 3, 11))
+    assert matches(visits, op) == ["V1"]
+    visits.update_one(*op)
+    assert matches(visits, next_day_op("V1", date(2026, 3, 11))) == []
+    added = visits.find_one({"visit_id": "V1"})["details"][-1]
+    assert added["for_date"] == datetime(2026, 3, 11)
+    assert added["daily_status"] == VisitStatus.initiated.value
+
+
+def test_checkpoint_reads_only_the_day_of_a_long_visit(visits):
+    days = [detail(date(2026, 3, day)) for day in range(1, 31)]
+    visits.insert_one({**visit("V1", details=days), "location": {"lat": "12.9", "lng": "77.5"}, "assigned_client_id": "C1"})
+    document = visits.find_one({"visit_id": "V1"}, checkpoint_projection(DAY))
+    assert "assigned_client_id" not in document
+    checkpoint = VisitCheckpoint.model_validate(document)
+    assert [d.for_date for d in checkpoint.details] == [datetime(2026, 3, 10)]
+    assert checkpoint.location.lat == "12.9"
+    assert VisitCheckpoint.model_validate(visits.find_one({"visit_id": "V1"}, checkpoint_projection(date(2026, 4, 1)))).details == []
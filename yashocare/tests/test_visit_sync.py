@@ -0,0 +1,249 @@
+import asyncio
+from datetime import datetime, timedelta
+from types import SimpleNamespace
+
+import pytest
+import pytz
+from pymongo.errors import BulkWriteError
+
+from app.visit import visit_sync
+from app.visit.visit_model import SyncReceipt, Visit, VisitStatus
+from app.visit.visit_sync import _day_state, _event_time, _plan, _took_effect, sync_events
+
+LAT, LNG = "12.9716", "77.5946"
+NOW = datetime.now(tz=pytz.UTC)
+# events a few minutes into today, inside the clock-skew allowance even
+# right after midnight
+DAY_START = NOW.replace(hour=0, minute=0, second=0, microsecond=0)
+TODAY = datetime(DAY_START.year, DAY_START.month, DAY_START.day)
+
+
+def make_visit(visit_id="V1", to_days=1, main_status=VisitStatus.initiated, details=None):
+    return Visit(
+        visit_id=visit_id,
+        assigned_client_id="C1",
+        assigned_admin_id="A1",
+        assigned_emp_id="E1",
+        main_status=main_status,
+        from_ts=TODAY,
+        to_ts=TODAY + timedelta(days=to_days),
+        location={"lat": LAT, "lng": LNG},
+        details=details if details is not None else [{"for_date": TODAY}],
+    )
+
+
+def event(kind, key, minute, visit_id="V1", **fields):
+    return {
+        "idempotency_key": key,
+        "type": kind,
+        "visit_id": visit_id,
+        "at": DAY_START + timedelta(minutes=minute),
+        "lat": LAT if kind in ("checkin", "checkout") else None,
+        "lng": LNG if kind in ("checkin", "checkout") else None,
+        "object_key": f"yashocare/{kind}/{visit_id}/img.jpg" if kind in ("checkin", "checkout") else None,
+        "bloodPressure": "",
+        "sugar": "",
+        "notes": "",
+        "reason": None,
+        **fields,
+    }
+
+
+def plan(visit, state, item, image_error=None):
+    return _plan("E1", item, _event_time(item["at"]), visit, state, image_error)
+
+
+@pytest.fixture
+def db(beanie_db, monkeypatch):
+    async def clean():
+        await Visit.get_motor_collection().delete_many({})
+        await SyncReceipt.get_motor_collection().delete_many({})
+
+    asyncio.run(clean())
+
+    async def no_image_error(*args):
+        return None
+
+    readings = []
+
+    async def record_readings(batch):
+        readings.extend(reading for reading in batch if reading)
+
+    monkeypatch.setattr(visit_sync, "_verify_image", no_image_error)
+    monkeypatch.setattr(visit_sync, "record_readings", record_readings)
+    return SimpleNamespace(readings=readings)
+
+
+@pytest.fixture
+def bulk_write(monkeypatch):
+    # mongomock cannot apply several positional details.$ paths in one $set,
+    # so the write is faked and each test decides what landed
+    calls = SimpleNamespace(ops=[], matched=None, apply=None, error=False)
+
+    async def fake(self, ops, ordered=True):
+        calls.ops.append(ops)
+        if calls.apply:
+            await calls.apply()
+        if calls.error:
+            raise BulkWriteError({"writeErrors": []})
+        return SimpleNamespace(matched_count=len(ops) if calls.matched is None else calls.matched)
+
+    monkeypatch.setattr(type(Visit.get_motor_collection()), "bulk_write", fake)
+    return calls
+
+
+def test_plan_walks_a_day_through_a_batch(db):
+    visit = make_visit()
+    state = _day_state(visit)
+
+    error, ops = plan(visit, state, event("checkin", "k1", 1))
+    assert error is None and len(ops) == 1
+    assert state["main_status"] == VisitStatus.checkedIn.value
+
+    error, ops = plan(visit, state, event("vitals", "k2", 2, notes="stable", bloodPressure="120/80"))
+    assert error is None and len(ops) == 1
+    assert state["days"][TODAY.date()] == {"status": VisitStatus.vitalUpdate.value, "notes": "stable"}
+
+    # not the last day: the checkout also opens tomorrow
+    error, ops = plan(visit, state, event("checkout", "k3", 3))
+    assert error is None and len(ops) == 2
+    assert state["main_status"] == VisitStatus.checkedIn.value
+    assert state["days"][TODAY.date() + timedelta(days=1)]["status"] == VisitStatus.initiated.value
+
+    assert plan(visit, state, event("checkout", "k4", 4)) == (("Already checkedOut", 0), None)
+    assert plan(visit, state, event("checkin", "k5", 4)) == (("Already checkedIn", 0), None)
+
+
+def test_plan_last_day_checkout_closes_the_visit(db):
+    visit = make_visit(to_days=0)
+    state = _day_state(visit)
+    for item in (event("checkin", "k1", 1), event("vitals", "k2", 2, notes="stable")):
+        assert plan(visit, state, item)[0] is None
+    error, ops = plan(visit, state, event("checkout", "k3", 3))
+    assert error is None and len(ops) == 1
+    assert state["main_status"] == VisitStatus.checkedOut.value
+    assert plan(visit, state, event("checkin", "k4", 4)) == (("Already checkedOut", 0), None)
+
+
+def test_plan_rejects_events_out_of_order(db):
+    visit = make_visit()
+    state = _day_state(visit)
+    assert plan(visit, state, event("vitals", "k1", 1, notes="stable")) == (("Check in before updating vitals", 403), None)
+    assert plan(visit, state, event("checkout", "k2", 1)) == (("Provide vitals before checkout", 0), None)
+    assert plan(visit, state, event("vitals", "k3", 1)) == (("Provide notes", 403), None)
+    assert plan(visit, state, event("reason", "k4", 24 * 60 + 1, reason="late")) == (("Reason not updated", 402), None)
+    # nothing above changed the planned state
+    assert state == _day_state(visit)
+
+
+def test_plan_rejects_fenced_and_unverified_check_ins(db):
+    visit = make_visit()
+    state = _day_state(visit)
+    error, ops = plan(visit, state, event("checkin", "k1", 1, lat="13.9716"))
+    assert error[1] == 403 and ops is None
+    assert plan(visit, state, event("checkin", "k2", 1), image_error="Upload not found") == (("Upload not found", 403), None)
+    assert state["main_status"] == VisitStatus.initiated.value
+
+
+def test_plan_ignores_cancelled_and_unknown_visits(db):
+    item = event("checkin", "k1", 1)
+    visit = make_visit(main_status=VisitStatus.cancelledVisit)
+    assert plan(visit, _day_state(visit), item) == (("Visit not found", 404), None)
+    assert plan(None, None, item) == (("Visit not found", 404), None)
+
+
+def test_plan_pins_the_reason_to_the_events_visit(db):
+    visit = make_visit(visit_id="V7")
+    error, ops = plan(visit, _day_state(visit), event("reason", "k1", 1, visit_id="V7", reason="late"))
+    assert error is None
+    assert ops[0][0]["visit_id"] == "V7"
+    assert ops[0][0]["main_status"] == {"$ne": VisitStatus.cancelledVisit.value}
+
+
+def test_took_effect_only_counts_the_events_own_write(db):
+    checkin = event("checkin", "k1", 1)
+    at = _event_time(checkin["at"])
+    visit = make_visit(details=[{
+        "for_date": TODAY,
+        "daily_status": VisitStatus.vitalUpdate,
+        "checkIn": {"at": at.replace(tzinfo=None)},
+        "vitals": {"notes": "from an earlier sync"},
+        "reason": "late",
+    }])
+    assert _took_effect(checkin, at, visit)
+    assert not _took_effect(checkin, at + timedelta(minutes=1), visit)
+    assert not _took_effect(event("checkout", "k2", 2), at, visit)
+    assert not _took_effect(event("vitals", "k3", 2, notes="stable"), at, visit)
+    assert _took_effect(event("vitals", "k4", 2, notes="from an earlier sync"), at, visit)
+    assert _took_effect(event("reason", "k5", 2, reason="late"), at, visit)
+    assert not _took_effect(checkin, at, None)
+
+
+def test_sync_applies_the_batch_and_stores_receipts(db, bulk_write):
+    asyncio.run(make_visit().insert())
+    events = [
+        event("checkin", "k1", 1),
+        event("vitals", "k2", 2, notes="stable", bloodPressure="120/80", sugar="101"),
+        event("checkout", "k3", 3),
+    ]
+    results, status = asyncio.run(sync_events("E1", events))
+    assert status == 0
+    assert [result["status_code"] for result in results] == [0, 0, 0]
+    # one ordered write: check-in, vitals, checkout and tomorrow's detail
+    assert len(bulk_write.ops) == 1 and len(bulk_write.ops[0]) == 4
+    assert len(db.readings) == 1
+    assert asyncio.run(SyncReceipt.find({"emp_id": "E1"}).count()) == 3
+
+
+def test_sync_replays_stored_results(db, bulk_write):
+    asyncio.run(make_visit().insert())
+    events = [event("checkin", "k1", 1), event("vitals", "k2", 2, notes="stable")]
+    first, _ = asyncio.run(sync_events("E1", events))
+    again, _ = asyncio.run(sync_events("E1", events))
+    assert [result["replayed"] for result in again] == [True, True]
+    assert [result["data"] for result in again] == [result["data"] for result in first]
+    assert len(bulk_write.ops) == 1
+    assert asyncio.run(SyncReceipt.find({"emp_id": "E1"}).count()) == 2
+
+
+def test_sync_rejects_repeated_keys_within_a_batch(db, bulk_write):
+    asyncio.run(make_visit().insert())
+    events = [event("checkin", "k1", 1), event("vitals", "k1", 2, notes="stable"), event("reason", "", 3, reason="late")]
+    results, _ = asyncio.run(sync_events("E1", events))
+    assert [result["status_code"] for result in results] == [0, 409, 409]
+    # a 409 is not final, so only the check-in has a receipt
+    assert [receipt.key for receipt in asyncio.run(SyncReceipt.find({"emp_id": "E1"}).to_list())] == ["k1"]
+
+
+def test_sync_keeps_only_what_landed_when_the_visit_changed(db, bulk_write):
+    asyncio.run(make_visit().insert())
+    checkin = event("checkin", "k1", 1)
+
+    async def only_the_check_in_lands():
+        await Visit.get_motor_collection().update_one(
+            {"visit_id": "V1"},
+            {"$set": {"details.0.checkIn.at": _event_time(checkin["at"]), "details.0.daily_status": VisitStatus.checkedIn.value}},
+        )
+
+    bulk_write.apply, bulk_write.matched = only_the_check_in_lands, 1
+    results, _ = asyncio.run(sync_events("E1", [checkin, event("vitals", "k2", 2, notes="stable", sugar="101")]))
+    assert [result["status_code"] for result in results] == [0, 409]
+    assert db.readings == []
+    assert [receipt.key for receipt in asyncio.run(SyncReceipt.find({"emp_id": "E1"}).to_list())] == ["k1"]
+
+
+def test_sync_reads_back_after_a_bulk_write_error(db, bulk_write):
+    asyncio.run(make_visit().insert())
+    bulk_write.error = True
+    results, _ = asyncio.run(sync_events("E1", [event("checkin", "k1", 1), event("vitals", "k2", 2, notes="stable")]))
+    assert [result["status_code"] for result in results] == [409, 409]
+    assert asyncio.run(SyncReceipt.find({"emp_id": "E1"}).count()) == 0
+
+
+def test_sync_rejects_stale_future_and_oversized_batches(db, bulk_write):
+    stale = event("checkin", "k1", 1, at=NOW - timedelta(days=4))
+    future = event("checkin", "k2", 1, at=NOW + timedelta(hours=1))
+    results, _ = asyncio.run(sync_events("E1", [stale, future]))
+    assert [result["error"] for result in results] == ["Event is too old to sync", "Event time is in the future"]
+    assert bulk_write.ops == []
+    assert asyncio.run(sync_events("E1", [stale] * 201))[1] == 403
@@ -0,0 +1,40 @@
+import asyncio
+from datetime import datetime
+
+import pytest
+import pytz
+
+from app.app_bundle import s3_utils
+from app.visit import visit_service
+from app.visit.visit_service import store_visit_image, visit_upload_prefix
+
+EVENING = datetime(2026, 3, 10, 23, 59, tzinfo=pytz.UTC)
+AFTER_MIDNIGHT = datetime(2026, 3, 11, 0, 1, tzinfo=pytz.UTC)
+NEXT_NOON = datetime(2026, 3, 11, 12, 0, tzinfo=pytz.UTC)
+
+
+@pytest.fixture(autouse=True)
+def uploaded(monkeypatch):
+    async def head(object_name, bucket):
+        return {"ContentLength": 1024, "ContentType": "image/jpeg"}
+
+    monkeypatch.setattr(s3_utils, "head_s3_object_async", head)
+    monkeypatch.setattr(visit_service, "schedule_normalize", lambda object_key, bucket: None)
+
+
+def confirm(issued, confirmed):
+    object_key = f"{visit_upload_prefix('checkin', 'V1', issued)}123.jpg"
+    return asyncio.run(store_visit_image("checkin", "V1", confirmed, None, object_key))
+
+
+def test_slot_issued_before_midnight_is_accepted_after_it():
+    assert confirm(EVENING, AFTER_MIDNIGHT) == ("yashocare/checkin/V1/2026-03-10/123.jpg", None)
+
+
+def test_slot_from_an_earlier_day_is_rejected_once_it_expired():
+    assert confirm(EVENING, NEXT_NOON) == (None, "Invalid object key")
+
+
+def test_other_visits_keys_are_rejected():
+    object_key = f"{visit_upload_prefix('checkin', 'V2', AFTER_MIDNIGHT)}123.jpg"
+    assert asyncio.run(store_visit_image("checkin", "V1", AFTER_MIDNIGHT, None, object_key)) == (None, "Invalid object key")